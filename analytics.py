@@ -0,0 +1,173 @@
+# analytics.py
+"""Admin analytics rollups.
+
+rollup() runs hourly on the scheduler. It recounts the per-hour counters
+since the start of yesterday from users.joined_at and memories.timestamp
+(both indexed), then folds them into stats_daily with DAU/WAU and the
+totals. Write paths only record the user's active day, a row of their
+own, so concurrent writes never queue on a shared counter row. The admin
+page only ever reads these small tables, and is up to an hour behind.
+
+    python analytics.py backfill [--days 90]   # rebuild from users/memories
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+
+import db
+
+MOODS = range(6)
+
+
+def _active(c, uid):
+    c.execute("""
+        INSERT INTO active_days (day, user_id) VALUES ((now() AT TIME ZONE 'UTC')::date, %s)
+        ON CONFLICT DO NOTHING
+    """, (uid,))
+
+
+def memory_logged(c, uid):
+    _active(c, uid)
+
+
+def streak_claimed(c, uid):
+    _active(c, uid)
+
+
+def _count_hours(c, since):
+    """Rebuilds stats_hourly from the UTC day `since` out of the source tables."""
+    c.execute("DELETE FROM stats_hourly WHERE hour >= %s", (since,))
+    c.execute("""
+        INSERT INTO stats_hourly (hour, metric, value)
+        SELECT date_trunc('hour', joined_at), 'new_users', COUNT(*)
+        FROM users WHERE joined_at >= %s GROUP BY 1
+        UNION ALL
+        SELECT date_trunc('hour', joined_at), 'referred_users', COUNT(*)
+        FROM users WHERE joined_at >= %s AND referred_by IS NOT NULL GROUP BY 1
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), 'memories', COUNT(*)
+        FROM memories WHERE timestamp >= %s GROUP BY 1
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), 'voice_memories', COUNT(*)
+        FROM memories WHERE timestamp >= %s AND voice_path IS NOT NULL GROUP BY 1
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), COALESCE('mood_' || mood, 'mood_skipped'), COUNT(*)
+        FROM memories WHERE timestamp >= %s GROUP BY 1, 2
+    """, (since,) * 5)
+
+
+def _rollup_day(c, day):
+    """Recomputes stats_daily for one UTC day from the hourly table."""
+    c.execute("""
+        INSERT INTO stats_daily (day, metric, value)
+        SELECT %s, metric, SUM(value) FROM stats_hourly
+        WHERE hour >= %s AND hour < %s + interval '1 day'
+        GROUP BY metric
+        ON CONFLICT (day, metric) DO UPDATE SET value = EXCLUDED.value
+    """, (day, day, day))
+    c.execute("""
+        INSERT INTO stats_daily (day, metric, value)
+        SELECT %s, 'dau', COUNT(*) FROM active_days WHERE day = %s
+        UNION ALL
+        SELECT %s, 'wau', COUNT(DISTINCT user_id) FROM active_days
+        WHERE day > %s - 7 AND day <= %s
+        UNION ALL
+        -- invited users who joined that day and have logged at least once
+        SELECT %s, 'referred_activated', COUNT(*) FROM users u
+        WHERE u.referred_by IS NOT NULL
+        AND u.joined_at >= %s AND u.joined_at < %s + interval '1 day'
+        AND EXISTS (SELECT 1 FROM memories m WHERE m.user_id = u.id)
+        ON CONFLICT (day, metric) DO UPDATE SET value = EXCLUDED.value
+    """, (day, day, day, day, day, day, day, day))
+
+
+def rollup():
+    """Hourly job: refresh today and yesterday, plus the running totals."""
+    today = datetime.now(timezone.utc).date()
+    try:
+        with db.cursor() as c:
+            _count_hours(c, today - timedelta(days=1))
+            for day in (today - timedelta(days=1), today):
+                _rollup_day(c, day)
+            c.execute("""
+                INSERT INTO stats_daily (day, metric, value)
+                SELECT %s, 'total_users', COUNT(*) FROM users
+                UNION ALL
+                SELECT %s, 'total_memories', COUNT(*) FROM memories
+                ON CONFLICT (day, metric) DO UPDATE SET value = EXCLUDED.value
+            """, (today, today))
+    except Exception as e:
+        print("[Analytics Rollup Error]", e)
+
+
+def summary():
+    """Headline numbers for the admin page; reads at most 24 hourly rows."""
+    rows = db.fetchall("""
+        SELECT metric, SUM(value) FROM stats_hourly
+        WHERE hour >= date_trunc('hour', now() AT TIME ZONE 'UTC') - interval '23 hours'
+        AND metric IN ('new_users', 'memories')
+        GROUP BY metric
+    """)
+    last_day = dict(rows)
+    totals = dict(db.fetchall("""
+        SELECT DISTINCT ON (metric) metric, value FROM stats_daily
+        WHERE metric IN ('total_users', 'total_memories')
+        ORDER BY metric, day DESC
+    """))
+    return {
+        "total_users": totals.get("total_users", 0),
+        "new_today": last_day.get("new_users", 0),
+        "total_memories": totals.get("total_memories", 0),
+        "new_memories": last_day.get("memories", 0),
+    }
+
+
+def series(days=30):
+    """Daily chart series for the last `days` days, oldest first."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    rows = db.fetchall("SELECT day, metric, value FROM stats_daily WHERE day >= %s", (since,))
+    by_day = {}
+    for day, metric, value in rows:
+        by_day.setdefault(day, {})[metric] = value
+
+    labels, out = [], {k: [] for k in ("dau", "wau", "memories", "voice_memories", "conversion")}
+    moods = {m: 0 for m in list(MOODS) + ["skipped"]}
+    for i in range(days):
+        day = since + timedelta(days=i)
+        d = by_day.get(day, {})
+        labels.append(day.isoformat())
+        for k in ("dau", "wau", "memories", "voice_memories"):
+            out[k].append(d.get(k, 0))
+        referred = d.get("referred_users", 0)
+        out["conversion"].append(round(100 * d.get("referred_activated", 0) / referred, 1) if referred else None)
+        for m in moods:
+            moods[m] += d.get(f"mood_{m}", 0)
+    out["labels"] = labels
+    out["moods"] = moods
+    return out
+
+
+def backfill(days=90):
+    """Rebuilds hourly counters and activity from the source tables."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    with db.cursor() as c:
+        c.execute("SET LOCAL statement_timeout = 0")
+        _count_hours(c, since)
+        c.execute("""
+            INSERT INTO active_days (day, user_id)
+            SELECT DISTINCT timestamp::date, user_id FROM memories WHERE timestamp >= %s
+            UNION
+            SELECT last_streak::date, id FROM users WHERE last_streak >= %s
+            ON CONFLICT DO NOTHING
+        """, (since, since))
+        for i in range(days):
+            _rollup_day(c, since + timedelta(days=i))
+    rollup()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["backfill"]:
+        n = int(sys.argv[sys.argv.index("--days") + 1]) if "--days" in sys.argv else 90
+        backfill(n)
+        print(f"✅ Backfilled {n} days")
+    else:
+        print(__doc__)
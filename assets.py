@@ -0,0 +1,95 @@
+# assets.py
+import os
+import threading
+
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+# Built once at import. Keyboards are kept as their serialized JSON, which
+# telebot passes through as reply_markup unchanged.
+
+MENU_BUTTONS = [
+    "📝 Log Memory", "🎤 Voice",
+    "📜 Memories", "🏆 Leaderboard",
+    "🌍 Explore", "📊 Dashboard",
+    "🔥 Streak", "🔗 Referral",
+    "ℹ️ Help", "🧘 About",
+    "🔒 Privacy", "🗑️ Delete",
+    "💬 Feedback"
+]
+ADMIN_BUTTON = "🛠️ Admin"
+SKIP_BUTTON = "⏭️ Skip"
+
+
+def keyboard(buttons):
+    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    kb.add(*[KeyboardButton(b) for b in buttons])
+    return kb.to_json()
+
+
+USER_MENU = keyboard(MENU_BUTTONS)
+ADMIN_MENU = keyboard(MENU_BUTTONS + [ADMIN_BUTTON])
+
+_feedback = InlineKeyboardMarkup()
+_feedback.add(InlineKeyboardButton("🐦 Give Feedback on Twitter", url="https://twitter.com/s0ulGarden_Bot"))
+FEEDBACK_KEYBOARD = _feedback.to_json()
+
+WELCOME_NEW = (
+    "🌱 Welcome to SoulGarden!\n\n"
+    "This is your peaceful space to grow, reflect, and bloom.\n\n"
+    "✨ Get started with:\n"
+    "📝 /log – Write your thoughts\n"
+    "🎤 /voice – Send a voice memory\n"
+    "📜 /memories – View your past logs\n"
+    "🌍 /explore – Visit other gardens\n"
+    "📊 /dashboard – See your stats\n"
+    "🌟 /streak – Keep your daily streak alive\n"
+    "🔗 /referral – Invite friends and earn 🌸\n"
+    "🗑️ /delete – Want to start over? Use this\n\n"
+    "💬 Type a command anytime to interact."
+)
+
+WELCOME_BACK = (
+    "🌿 Welcome back to SoulGarden!\n\n"
+    "Keep growing your journal 🌸\n"
+    "Use /log or /voice to share your thoughts,\n"
+    "or explore your /memories and /dashboard.\n\n"
+    "Need a restart? /delete\n"
+    "Want to invite friends? /referral"
+)
+
+HELP_TEXT = (
+    "🌿 *Welcome to SoulGarden Help!*\n\n"
+    "Here are the commands you can use:\n\n"
+    "• /start – Begin your SoulGarden journey\n"
+    "• /log or /voice – Share your mood or voice journal\n"
+    "• /explore – Discover anonymous gardens by others\n"
+    "• /dashboard – View your Dashboard\n"
+    "• /rank – See your place on the leaderboard\n"
+    "• /timezone <zone> – Set when your streak day starts\n"
+    "• /moods – See how your mood is trending\n"
+    "• /search <words> – Find old memories (mood:happy since:2024-01-01)\n"
+    "• /export – Download all your memories and voice notes\n"
+    "• /suggest <message> – 💡 Share feedback or ideas\n"
+    "• /help – Show this help message\n\n"
+    "We’re always growing 🌱 and your thoughts help us bloom! 🌸"
+)
+
+ABOUT_TEXT = "🧘 SoulGarden is a peaceful journaling space."
+
+
+class BotIdentity:
+    """The bot's username, fetched from Telegram at most once per process."""
+
+    def __init__(self):
+        self._username = os.getenv("BOT_USERNAME")
+        self._lock = threading.Lock()
+
+    def username(self, bot):
+        if self._username is None:
+            with self._lock:
+                if self._username is None:
+                    self._username = bot.get_me().username
+        return self._username
+
+
+identity = BotIdentity()
@@ -0,0 +1,73 @@
+"""Webhook-style DB load against the pooled layer vs. the old shared cursor.
+
+Each simulated update does the reads a typical handler does (stats lookup and
+latest memories). Run against a disposable database:
+
+    DATABASE_URL=postgres://... python benchmarks/db_pool.py --threads 1 2 4 8
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import db
+
+
+def handle_update_pooled(uid):
+    db.fetchone("SELECT streak, points FROM users WHERE id=%s", (uid,))
+    db.fetchall("SELECT text, mood, timestamp FROM memories WHERE user_id=%s ORDER BY timestamp DESC LIMIT 5", (uid,))
+
+
+def make_shared_handler():
+    conn = psycopg2.connect(db.DATABASE_URL)
+    conn.autocommit = True
+    c = conn.cursor()
+    lock = threading.Lock()
+
+    def handle(uid):
+        with lock:
+            c.execute("SELECT streak, points FROM users WHERE id=%s", (uid,))
+            c.fetchone()
+            c.execute("SELECT text, mood, timestamp FROM memories WHERE user_id=%s ORDER BY timestamp DESC LIMIT 5", (uid,))
+            c.fetchall()
+    return handle
+
+
+def run(handler, threads, seconds, users):
+    done = [0] * threads
+    stop = time.monotonic() + seconds
+
+    def worker(i):
+        n = 0
+        while time.monotonic() < stop:
+            handler((i * 7919 + n) % users + 1)
+            n += 1
+        done[i] = n
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return sum(done) / seconds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--users", type=int, default=1000)
+    args = ap.parse_args()
+
+    shared = make_shared_handler()
+    print(f"{'threads':>7} {'shared cursor/s':>16} {'pooled/s':>10}")
+    for n in args.threads:
+        a = run(shared, n, args.seconds, args.users)
+        b = run(handle_update_pooled, n, args.seconds, args.users)
+        print(f"{n:>7} {a:>16.0f} {b:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
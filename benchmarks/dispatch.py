@@ -0,0 +1,105 @@
+"""Per-update cost of routing a text message to its handler.
+
+Compares dispatch.Router against what the bot did before: telebot testing
+each registered handler's filters in order, then the button if/elif chain.
+Handlers are no-ops, so this measures routing alone.
+
+    python benchmarks/dispatch.py --ops 200000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatch import Router, route_key
+
+COMMANDS = ["start", "admin", "poll", "suggest", "broadcast", "feedback", "log", "voice", "memories",
+            "leaderboard", "rank", "explore", "dashboard", "referral", "streak", "help", "about",
+            "privacy", "delete"]
+BUTTONS = {
+    "📝 Log Memory": "/log", "🎤 Voice": "/voice", "📜 Memories": "/memories",
+    "🏆 Leaderboard": "/leaderboard", "🌍 Explore": "/explore", "📊 Dashboard": "/dashboard",
+    "🔥 Streak": "/streak", "🔗 Referral": "/referral", "ℹ️ Help": "/help", "🧘 About": "/about",
+    "🔒 Privacy": "/privacy", "🗑️ Delete": "/delete", "🛠️ Admin": "/admin", "💬 Feedback": "/feedback",
+}
+MOODS = ["🙂 Happy", "😊 Grateful", "😐 Neutral", "😢 Sad", "😡 Angry", "😨 Anxious", "⏭️ Skip"]
+
+
+class Msg:
+    def __init__(self, text):
+        self.text = text
+
+
+def noop(msg):
+    pass
+
+
+def build_router():
+    router = Router()
+    for cmd in COMMANDS:
+        router.add([f"/{cmd}"], noop)
+    router.add(MOODS, noop, name="mood")
+    router.alias(BUTTONS)
+    return router
+
+
+def build_filters():
+    """The old handler list: one commands= filter per command, then lambdas."""
+    def extract_command(text):
+        return text.split()[0].split("@")[0][1:] if text.startswith("/") else None
+
+    handlers = [(lambda m, c=cmd: extract_command(m.text) == c, noop) for cmd in COMMANDS]
+
+    def buttons(m):
+        actual = BUTTONS[m.text]
+        for cmd in COMMANDS:  # the if/elif chain
+            if actual == f"/{cmd}":
+                return noop(m)
+
+    handlers.insert(1, (lambda m: m.text in BUTTONS, buttons))
+    handlers.append((lambda m: m.text in MOODS, noop))
+    return handlers
+
+
+def old_dispatch(handlers, msg):
+    for test, fn in handlers:
+        if test(msg):
+            fn(msg)
+            return True
+    return False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ops", type=int, default=200000)
+    args = ap.parse_args()
+
+    rng = random.Random(1)
+    pool = [f"/{c}" for c in COMMANDS] + list(BUTTONS) + MOODS + ["just some journal text"] * 5
+    msgs = [Msg(rng.choice(pool)) for _ in range(args.ops)]
+
+    handlers = build_filters()
+    t = time.perf_counter()
+    for m in msgs:
+        old_dispatch(handlers, m)
+    old = (time.perf_counter() - t) / args.ops * 1e6
+    print(f"filter chain:   {old:8.2f} us/update")
+
+    router = build_router()
+    assert router.match("/start@SoulGardenBot 42") and route_key("/log") == "/log"
+    t = time.perf_counter()
+    for m in msgs:
+        router.dispatch(m)
+    new = (time.perf_counter() - t) / args.ops * 1e6
+    print(f"router:         {new:8.2f} us/update  (incl. timing)")
+    print(f"speedup:        {old / new:8.1f}x")
+
+    slowest = max(router.stats().items(), key=lambda kv: kv[1]["ms_p95"])
+    print(f"slowest route:  {slowest[0]} p95 {slowest[1]['ms_p95']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Explore sampling latency as the number of gardens grows.
+
+Seeds garden_latest in a throwaway schema at each size and times
+gardens.sample()'s query. Latency should stay flat across sizes.
+
+    DATABASE_URL=postgres://... python benchmarks/explore_sample.py --sizes 1000 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import gardens
+
+SCHEMA = "bench_explore"
+
+
+def seed(c, n):
+    c.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    c.execute(f"CREATE SCHEMA {SCHEMA}")
+    c.execute(f"SET search_path TO {SCHEMA}")
+    c.execute("""CREATE TABLE garden_latest (
+        user_id BIGINT PRIMARY KEY, seq BIGSERIAL UNIQUE,
+        text TEXT, mood INT, timestamp TIMESTAMP, voice_path TEXT)""")
+    c.execute("""
+        INSERT INTO garden_latest (user_id, text, mood, timestamp)
+        SELECT g, 'memory ' || g, g % 6, now() - (g || ' minutes')::interval
+        FROM generate_series(1, %s) g
+    """, (n,))
+    c.execute("ANALYZE garden_latest")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    ap.add_argument("--runs", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    conn.autocommit = True
+    c = conn.cursor()
+    print(f"{'gardens':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    try:
+        for n in args.sizes:
+            seed(c, n)
+            times = []
+            for i in range(args.runs):
+                t = time.perf_counter()
+                c.execute(gardens._SAMPLE_SQL, {"picks": args.k * 2, "exclude": i + 1})
+                c.fetchall()
+                times.append((time.perf_counter() - t) * 1000)
+            times.sort()
+            print(f"{n:>9} {statistics.median(times):>8.2f} {times[int(len(times) * 0.95)]:>8.2f}")
+    finally:
+        c.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
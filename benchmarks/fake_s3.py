@@ -0,0 +1,181 @@
+"""A local stand-in for an S3-compatible bucket, for storage.S3Storage.
+
+Keeps objects in memory and answers the calls the app makes through
+boto3: HeadObject, GetObject (with Range), PutObject and DeleteObject,
+path-style or virtual-host style. Signatures are not checked. Multipart
+uploads are not supported; boto3 only uses them above 8 MB, well past
+MAX_FILE_SIZE_MB. Latency can be added to model a remote bucket.
+
+    fake = FakeS3(latency_ms=(5, 20)).start()
+    backend = fake.backend()  # a storage.S3Storage pointed here
+
+Run on its own to poke at it: python benchmarks/fake_s3.py --port 9000
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOT_FOUND = b"<?xml version=\"1.0\"?><Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>"
+
+
+class FakeS3:
+    def __init__(self, latency_ms=(0, 0), seed=None, host="127.0.0.1", port=0):
+        self.latency_ms = latency_ms
+        self.host, self.port = host, port
+        self.objects = {}  # (bucket, key) -> (body, headers)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = None
+
+    # --- lifecycle ---
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                fake._handle(self, "HEAD")
+
+            def do_GET(self):
+                fake._handle(self, "GET")
+
+            def do_PUT(self):
+                fake._handle(self, "PUT")
+
+            def do_DELETE(self):
+                fake._handle(self, "DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-s3", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def backend(self, bucket="soulgarden-bench"):
+        """A storage.S3Storage using this fake; boto3 still wants some credentials."""
+        for name, value in (("AWS_ACCESS_KEY_ID", "fake"), ("AWS_SECRET_ACCESS_KEY", "fake"),
+                            ("AWS_DEFAULT_REGION", "us-east-1")):
+            os.environ.setdefault(name, value)
+        import storage
+        return storage.S3Storage(bucket=bucket, endpoint_url=self.url)
+
+    def summary(self):
+        with self._lock:
+            return {"objects": len(self.objects), "bytes": sum(len(b) for b, _ in self.objects.values()),
+                    "calls": dict(self.calls)}
+
+    # --- HTTP ---
+    def _locate(self, req):
+        path = unquote(urlsplit(req.path).path).lstrip("/")
+        host = req.headers.get("Host", "").split(":")[0]
+        if host.count(".") and not host.replace(".", "").isdigit() and host != "localhost":
+            return host.split(".", 1)[0], path  # virtual-host style: bucket.endpoint
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def _handle(self, req, method):
+        lo, hi = self.latency_ms
+        if hi > 0:
+            with self._lock:
+                delay = self._rng.uniform(lo, hi)
+            time.sleep(delay / 1000)
+        bucket, key = self._locate(req)
+        with self._lock:
+            self.calls[method] += 1
+
+        if method == "PUT":
+            n = int(req.headers.get("Content-Length", 0))
+            body = req.rfile.read(n)
+            if req.headers.get("Content-Encoding") == "aws-chunked" or \
+                    req.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+                body = _dechunk(body)
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers = {"ETag": etag, "Content-Type": req.headers.get("Content-Type", "binary/octet-stream"),
+                       "Cache-Control": req.headers.get("Cache-Control", ""),
+                       "Last-Modified": formatdate(usegmt=True)}
+            with self._lock:
+                self.objects[(bucket, key)] = (body, headers)
+            return _reply(req, 200, {"ETag": etag})
+
+        if method == "DELETE":
+            with self._lock:
+                self.objects.pop((bucket, key), None)
+            return _reply(req, 204)
+
+        with self._lock:
+            obj = self.objects.get((bucket, key))
+        if obj is None:
+            return _reply(req, 404, {"Content-Type": "application/xml"}, b"" if method == "HEAD" else NOT_FOUND)
+        body, headers = obj
+        status, extra = 200, {}
+        rng = req.headers.get("Range", "")
+        if method == "GET" and rng.startswith("bytes="):
+            start, _, end = rng[6:].partition("-")
+            start, end = int(start), min(int(end) if end else len(body) - 1, len(body) - 1)
+            extra["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body, status = body[start:end + 1], 206
+        if method == "HEAD":
+            return _reply(req, status, {**headers, **extra, "Content-Length": str(len(body))}, b"", length=False)
+        return _reply(req, status, {**headers, **extra}, body)
+
+
+def _dechunk(data):
+    """Strips aws-chunked framing: <hex size>;chunk-signature=...\\r\\n<data>\\r\\n ..."""
+    out, i = [], 0
+    while i < len(data):
+        eol = data.index(b"\r\n", i)
+        size = int(data[i:eol].split(b";")[0], 16)
+        if size == 0:
+            break
+        out.append(data[eol + 2:eol + 2 + size])
+        i = eol + 2 + size + 2
+    return b"".join(out)
+
+
+def _reply(req, status, headers=None, body=b"", length=True):
+    req.send_response(status)
+    for name, value in (headers or {}).items():
+        req.send_header(name, value)
+    if length:
+        req.send_header("Content-Length", str(len(body)))
+    req.end_headers()
+    if body:
+        req.wfile.write(body)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--latency-ms", type=float, nargs=2, default=(0, 0), metavar=("MIN", "MAX"))
+    args = ap.parse_args()
+    fake = FakeS3(tuple(args.latency_ms), port=args.port).start()
+    print(f"Fake S3 on {fake.url} (S3_ENDPOINT_URL); Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(fake.summary())
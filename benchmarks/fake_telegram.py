@@ -0,0 +1,204 @@
+"""A local stand-in for the Telegram Bot API, for load tests.
+
+Answers the methods the bot uses with plausible results, records every
+call (time, method, chat) and can add latency and answer a share of calls
+with 429 Too Many Requests, the way Telegram throttles a busy bot. Voice
+downloads are served from /file/ with bytes derived from the file_id, so
+equal file_ids dedupe in storage just like re-sent voice notes.
+
+    fake = FakeTelegram(latency_ms=(20, 80), rate_429=0.02, seed=1).start()
+    fake.install()  # points telebot's API_URL / FILE_URL here
+
+Run on its own to poke at it: python benchmarks/fake_telegram.py --port 8081
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qsl, urlsplit
+
+VOICE_BYTES = 8 * 1024
+
+
+def voice_bytes(file_id):
+    seed = file_id.encode()
+    return (b"OggS" + seed * (VOICE_BYTES // max(len(seed), 1) + 1))[:VOICE_BYTES]
+
+
+class FakeTelegram:
+    def __init__(self, latency_ms=(0, 0), rate_429=0.0, retry_after=1, seed=None, host="127.0.0.1", port=0):
+        self.latency_ms = latency_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.host, self.port = host, port
+        self.calls = []
+        self.throttled = 0
+        self._by_chat = defaultdict(list)
+        self._cond = threading.Condition()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._message_id = 0
+        self._server = None
+
+    # --- lifecycle ---
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._handle(self)
+
+            def do_POST(self):
+                fake._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def install(self):
+        from telebot import apihelper
+        apihelper.API_URL = self.url + "/bot{0}/{1}"
+        apihelper.FILE_URL = self.url + "/file/bot{0}/{1}"
+
+    # --- what the bot did ---
+    def count(self, chat_id):
+        with self._cond:
+            return len(self._by_chat[chat_id])
+
+    def wait(self, chat_id, seen, timeout=30):
+        """Blocks until chat_id has more than `seen` calls; returns the next one's time or None."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._by_chat[chat_id]) <= seen:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self._cond.wait(left)
+            return self._by_chat[chat_id][seen]
+
+    def wait_for_text(self, chat_id, prefix, timeout=300):
+        """Blocks until a message to chat_id starts with prefix; returns its time or None."""
+        deadline = time.monotonic() + timeout
+        seen = 0
+        while True:
+            with self._cond:
+                texts = [(t, text) for t, _, c, text in self.calls[seen:] if c == chat_id]
+                seen = len(self.calls)
+                for t, text in texts:
+                    if text and text.startswith(prefix):
+                        return t
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self._cond.wait(min(left, 1))
+
+    def summary(self):
+        with self._cond:
+            methods = Counter(method for _, method, _, _ in self.calls)
+        return {"calls": sum(methods.values()), "throttled": self.throttled, "by_method": dict(methods)}
+
+    def reset(self):
+        with self._cond:
+            self.calls.clear()
+            self._by_chat.clear()
+            self.throttled = 0
+
+    # --- HTTP ---
+    def _params(self, req):
+        parts = urlsplit(req.path)
+        params = dict(parse_qsl(parts.query))
+        length = int(req.headers.get("Content-Length") or 0)
+        body = req.rfile.read(length) if length else b""
+        ctype = req.headers.get("Content-Type", "")
+        if body and "json" in ctype:
+            params.update(json.loads(body))
+        elif body and "x-www-form-urlencoded" in ctype:
+            params.update(parse_qsl(body.decode()))
+        return parts.path, params
+
+    def _send(self, req, status, payload, ctype="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        req.send_response(status)
+        req.send_header("Content-Type", ctype)
+        req.send_header("Content-Length", str(len(body)))
+        req.end_headers()
+        req.wfile.write(body)
+
+    def _handle(self, req):
+        path, params = self._params(req)
+        if path.startswith("/file/"):
+            return self._send(req, 200, voice_bytes(path.rsplit("/", 1)[-1].split(".")[0]), "audio/ogg")
+
+        method = path.rsplit("/", 1)[-1]
+        with self._rng_lock:
+            delay = self._rng.uniform(*self.latency_ms) / 1000
+            throttle = self._rng.random() < self.rate_429
+        chat = params.get("chat_id")
+        chat = int(chat) if chat not in (None, "") and str(chat).lstrip("-").isdigit() else None
+        with self._cond:
+            self.calls.append((time.monotonic(), method, chat, params.get("text")))
+            if chat is not None:
+                self._by_chat[chat].append(time.monotonic())
+            self.throttled += throttle
+            self._cond.notify_all()
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            return self._send(req, 429, {"ok": False, "error_code": 429,
+                                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                                         "parameters": {"retry_after": self.retry_after}})
+        return self._send(req, 200, {"ok": True, "result": self._result(method, chat, params)})
+
+    def _result(self, method, chat, params):
+        if method == "getFile":
+            fid = params.get("file_id", "")
+            return {"file_id": fid, "file_unique_id": fid, "file_size": VOICE_BYTES,
+                    "file_path": f"voice/{fid}.oga"}
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "SoulGarden", "username": "SoulGardenBenchBot"}
+        if method in ("setWebhook", "deleteWebhook", "answerCallbackQuery"):
+            return True
+        with self._cond:
+            self._message_id += 1
+            mid = self._message_id
+        msg = {"message_id": mid, "date": int(time.time()), "chat": {"id": chat or 0, "type": "private"}}
+        if params.get("text"):
+            msg["text"] = params["text"]
+        return msg
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency-ms", type=float, nargs=2, default=(0, 0))
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    args = ap.parse_args()
+    fake = FakeTelegram(tuple(args.latency_ms), args.rate_429, port=args.port).start()
+    print(f"Fake Bot API on {fake.url}/bot<token>/<method>; Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(fake.summary())
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Rank lookups and point updates at 1M users, in-process.
+
+Compares leaderboard.PointsIndex against sorting every user's points, which
+is what answering "my rank" cost before.
+
+    python benchmarks/leaderboard.py --users 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import bisect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import PointsIndex
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000000)
+    ap.add_argument("--ops", type=int, default=100000)
+    args = ap.parse_args()
+
+    rng = random.Random(1)
+    points = [int(rng.paretovariate(1.5)) for _ in range(args.users)]
+
+    t = time.perf_counter()
+    index = PointsIndex()
+    for p in points:
+        index.add(p)
+    print(f"build index:        {time.perf_counter() - t:8.2f} s")
+
+    probes = [rng.choice(points) for _ in range(args.ops)]
+    t = time.perf_counter()
+    for p in probes:
+        index.rank(p)
+    per = (time.perf_counter() - t) / args.ops * 1e6
+    print(f"index rank:         {per:8.2f} us/op")
+
+    t = time.perf_counter()
+    for p in probes:
+        index.add(p, -1)
+        index.add(p + 1, 1)
+    per = (time.perf_counter() - t) / args.ops * 1e6
+    print(f"index update:       {per:8.2f} us/op")
+
+    runs = 5
+    t = time.perf_counter()
+    for p in probes[:runs]:
+        ordered = sorted(points)
+        len(ordered) - bisect.bisect_right(ordered, p) + 1
+    per = (time.perf_counter() - t) / runs * 1e6
+    print(f"full sort rank:     {per:8.0f} us/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""End-to-end load test: seeded database, real app, fake Telegram.
+
+Seeds --users bench users (ids from --base) with --memories memories in
+total, starts the Flask app on a local port and points telebot at
+fake_telegram.FakeTelegram, which can add latency and answer a share of
+calls with 429. Virtual users then replay synthetic update streams
+through the webhook, one chat each, waiting for the bot's reply before
+sending the next update, so latency is webhook POST -> first Bot API call
+back to that chat (plain HTTP round trip for page steps).
+
+Scenarios:
+    log        /log, memory text, mood button
+    voice      /voice, voice note (downloaded from the fake), mood button
+    mood       /moods
+    streak     /streak, a different user each time
+    explore    GET /explore, as a different user each time (a page-cache
+               miss while --users >= concurrency x iterations)
+    mix        the above, weighted like real traffic
+    broadcast  one /broadcast to every user; time until the admin's
+               "sent" report
+
+Results go to stdout (or --out) as JSON: p50/p95/p99 and throughput per
+scenario and per step, plus the Bot API calls seen. Uses the app's
+storage for voice notes and messages every user in the database on
+broadcast, so run it against a disposable database:
+
+    DATABASE_URL=postgres://... python benchmarks/loadtest.py --users 500 --memories 50000 \\
+        --scenarios log mix broadcast --concurrency 16 --latency-ms 20 80 --rate-429 0.01
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+import psycopg2
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram
+
+MIX = {"log": 40, "streak": 20, "mood": 15, "explore": 15, "voice": 10}
+SCENARIOS = ("log", "voice", "mood", "streak", "explore", "mix", "broadcast")
+
+
+def pct(values):
+    if not values:
+        return None
+    v = sorted(values)
+
+    def at(p):
+        return round(v[min(len(v) - 1, int(len(v) * p))] * 1000, 1)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": at(1.0),
+            "mean": round(sum(v) / len(v) * 1000, 1)}
+
+
+# --- Database ---
+def seed(base, users, memories, rng_seed):
+    import db
+    with db.cursor() as c:
+        c.execute("SET LOCAL statement_timeout = 0")
+        c.execute("SELECT setseed(%s)", (rng_seed % 1000 / 1000,))
+        c.execute("""
+            INSERT INTO users (id, username, points, streak, joined_at)
+            SELECT g, 'bench' || g, 0, 0, now() - interval '400 days'
+            FROM generate_series(%s, %s) g
+            ON CONFLICT (id) DO NOTHING
+        """, (base, base + users - 1))
+        c.execute("""
+            INSERT INTO memories (user_id, text, mood, timestamp)
+            SELECT %(base)s + (g %% %(users)s), 'bench memory ' || g,
+                   CASE WHEN g %% 7 = 0 THEN NULL ELSE g %% 6 END,
+                   (now() AT TIME ZONE 'UTC') - random() * interval '365 days'
+            FROM generate_series(1, %(memories)s) g
+        """, {"base": base, "users": users, "memories": memories})
+        c.execute("""
+            UPDATE users u SET points = m.n FROM (
+                SELECT user_id, COUNT(*) n FROM memories WHERE user_id BETWEEN %s AND %s GROUP BY user_id
+            ) m WHERE u.id = m.user_id
+        """, (base, base + users - 1))
+        c.execute("""
+            INSERT INTO garden_latest (user_id, text, mood, timestamp)
+            SELECT DISTINCT ON (user_id) user_id, text, mood, timestamp FROM memories
+            WHERE user_id BETWEEN %s AND %s
+            ORDER BY user_id, timestamp DESC
+            ON CONFLICT (user_id) DO NOTHING
+        """, (base, base + users - 1))
+        c.execute("""
+            INSERT INTO mood_daily (user_id, day, hour, n, total)
+            SELECT m.user_id, m.timestamp::date, EXTRACT(HOUR FROM m.timestamp), COUNT(*), SUM(m.mood)
+            FROM memories m
+            WHERE m.user_id BETWEEN %s AND %s AND m.mood IS NOT NULL
+            GROUP BY 1, 2, 3
+            ON CONFLICT (user_id, day, hour) DO NOTHING
+        """, (base, base + users - 1))
+
+
+def cleanup(base, users):
+    import db
+    with db.cursor() as c:
+        c.execute("SET LOCAL statement_timeout = 0")
+        for table, col in (("memories", "user_id"), ("garden_latest", "user_id"), ("mood_daily", "user_id"),
+                           ("conv_state", "user_id"), ("users", "id")):
+            c.execute(f"DELETE FROM {table} WHERE {col} BETWEEN %s AND %s", (base, base + users - 1))
+
+
+# --- Updates ---
+class Updates:
+    """Builds Telegram update JSON with increasing ids."""
+
+    def __init__(self):
+        self.n = 0
+        self.lock = threading.Lock()
+
+    def _next(self):
+        with self.lock:
+            self.n += 1
+            return self.n
+
+    def message(self, uid, text=None, voice=None):
+        n = self._next()
+        msg = {"message_id": n, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"},
+               "from": {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"bench{uid}"}}
+        if voice:
+            msg["voice"] = {"file_id": voice, "file_unique_id": voice, "duration": 7,
+                            "mime_type": "audio/ogg", "file_size": 8192}
+        else:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": n, "message": msg}
+
+
+class Scenario:
+    def __init__(self, app_url, token, fake, mood_buttons, timeout):
+        self.app_url = app_url
+        self.hook = f"{app_url}/{token}"
+        self.fake = fake
+        self.moods = mood_buttons
+        self.timeout = timeout
+        self.updates = Updates()
+
+    def steps(self, name, uid, rng, visitor):
+        if name == "mix":
+            name = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        if name == "log":
+            return [("/log", "msg", "/log"), ("text", "msg", f"bench log {rng.random():.6f}"),
+                    ("mood", "msg", rng.choice(self.moods))]
+        if name == "voice":
+            return [("/voice", "msg", "/voice"), ("voice", "voice", f"bench-voice-{rng.randrange(100)}"),
+                    ("mood", "msg", rng.choice(self.moods))]
+        if name == "mood":
+            return [("/moods", "msg", "/moods")]
+        if name == "streak":
+            return [("/streak", "msg", "/streak")]
+        if name == "explore":
+            # The page is cached per URL; the chat's own uid would only ever measure hits.
+            return [("GET /explore", "http", f"/explore?uid={visitor}")]
+        raise ValueError(name)
+
+    def step(self, session, uid, kind, arg):
+        """Runs one step; returns (latency seconds or None, webhook ack seconds or None, error or None)."""
+        t0 = time.monotonic()
+        if kind == "http":
+            r = session.get(self.app_url + arg, timeout=self.timeout)
+            took = time.monotonic() - t0
+            return took, None, None if r.status_code < 500 else f"http {r.status_code}"
+
+        seen = self.fake.count(uid)
+        update = self.updates.message(uid, voice=arg) if kind == "voice" else self.updates.message(uid, arg)
+        r = session.post(self.hook, json=update, timeout=self.timeout)
+        ack = time.monotonic() - t0
+        if r.status_code != 200:
+            return None, ack, f"webhook {r.status_code}"
+        replied = self.fake.wait(uid, seen, self.timeout)
+        if replied is None:
+            return None, ack, "timeout"
+        return replied - t0, ack, None
+
+
+def run_scenario(sc, name, pool, concurrency, iterations, warmup, seed):
+    lat, acks, by_step = [], [], defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    counts = [0] * concurrency
+
+    def vu(v):
+        rng = random.Random(f"{seed}:{name}:{v}")
+        mine = pool[v::concurrency]
+        session = requests.Session()
+        for k in range(warmup + iterations):
+            visitor = mine[k % len(mine)]
+            uid = visitor if name == "streak" else mine[0]
+            for label, kind, arg in sc.steps(name, uid, rng, visitor):
+                took, ack, err = sc.step(session, uid, kind, arg)
+                if k < warmup:
+                    continue
+                with lock:
+                    counts[v] += 1
+                    if err:
+                        errors[err] += 1
+                    else:
+                        lat.append(took)
+                        by_step[label].append(took)
+                    if ack is not None:
+                        acks.append(ack)
+
+    sc.fake.reset()
+    started = time.monotonic()
+    threads = [threading.Thread(target=vu, args=(v,)) for v in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    seconds = time.monotonic() - started
+    steps = sum(counts)
+    return {
+        "steps": steps, "errors": dict(errors), "seconds": round(seconds, 3),
+        "throughput_per_s": round(steps / seconds, 1) if seconds else 0.0,
+        "latency_ms": pct(lat), "webhook_ack_ms": pct(acks),
+        "by_step": {label: {"count": len(v), **pct(v)} for label, v in sorted(by_step.items())},
+        "telegram": sc.fake.summary(),
+    }
+
+
+def run_broadcast(sc, admin, users, timeout):
+    sc.fake.reset()
+    session = requests.Session()
+    started = time.monotonic()
+    text = f"/broadcast bench {started:.0f}"
+    _, ack, err = sc.step(session, admin, "msg", text)
+    done = sc.fake.wait_for_text(admin, "✅ Message sent", timeout) if not err else None
+    seconds = (done or time.monotonic()) - started
+    calls = sc.fake.summary()
+    sent = calls["by_method"].get("sendMessage", 0)
+    return {
+        "users": users, "errors": {err: 1} if err else ({} if done else {"timeout": 1}),
+        "seconds": round(seconds, 3), "throughput_per_s": round(sent / seconds, 1) if seconds else 0.0,
+        "latency_ms": pct([seconds]) if done else None, "webhook_ack_ms": pct([ack] if ack else []),
+        "telegram": calls,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["log", "streak", "explore", "mix"])
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--memories", type=int, default=20000, help="total, spread over the users")
+    ap.add_argument("--base", type=int, default=7_000_000_000, help="first bench user id")
+    ap.add_argument("--concurrency", type=int, default=8, help="virtual users, one chat each")
+    ap.add_argument("--iterations", type=int, default=25, help="per virtual user")
+    ap.add_argument("--warmup", type=int, default=1, help="untimed iterations per virtual user")
+    ap.add_argument("--latency-ms", type=float, nargs=2, default=(0, 0), metavar=("MIN", "MAX"),
+                    help="fake Bot API latency, uniform")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="share of Bot API calls answered with 429")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=10, help="seconds to wait for a reply")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep", action="store_true", help="leave the seeded rows in place")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+    if args.users <= args.concurrency:
+        ap.error("--users must be larger than --concurrency")
+
+    # Before main is imported: no webhook registration, no scheduler, and a
+    # bench user as admin so /broadcast is allowed.
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+    os.environ.setdefault("WEBHOOK_URL", "http://bench.invalid")
+    os.environ.setdefault("ADMIN_ID", str(args.base))
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    admin = int(os.environ["ADMIN_ID"])
+
+    import db
+    import migrations
+    conn = psycopg2.connect(db.DATABASE_URL)
+    try:
+        migrations.migrate(conn, verbose=False)
+    finally:
+        conn.close()
+    print(f"Seeding {args.users} users, {args.memories} memories...", file=sys.stderr)
+    cleanup(args.base, args.users)
+    seed(args.base, args.users, args.memories, args.seed)
+
+    fake = FakeTelegram(tuple(args.latency_ms), args.rate_429, args.retry_after, seed=args.seed).start()
+    fake.install()
+
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    import main as app_main
+    server = make_server("127.0.0.1", 0, app_main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    app_url = f"http://127.0.0.1:{server.server_port}"
+
+    sc = Scenario(app_url, os.environ["BOT_TOKEN"], fake, list(app_main.MOOD_LABELS), args.timeout)
+    pool = [args.base + i for i in range(args.users) if args.base + i != admin]
+    results = {}
+    try:
+        for name in args.scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            if name == "broadcast":
+                results[name] = run_broadcast(sc, admin, args.users, max(args.timeout, args.users))
+            else:
+                results[name] = run_scenario(sc, name, pool, args.concurrency, args.iterations,
+                                             args.warmup, args.seed)
+    finally:
+        server.shutdown()
+        fake.stop()
+        if not args.keep:
+            cleanup(args.base, args.users)
+
+    report = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "scenarios": results,
+        "routes": app_main.router.stats(),
+    }
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
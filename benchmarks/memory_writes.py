@@ -0,0 +1,80 @@
+"""Memories per second through writes.MemoryWriter, per-row vs write-behind.
+
+Each thread plays one stream of users logging memories back to back, the
+way update workers call it. Seeds its own users (ids from --base) and
+removes them afterwards. Run against a disposable database:
+
+    DATABASE_URL=postgres://... python benchmarks/memory_writes.py --threads 4 16 --windows 0 5 20
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import writes
+
+
+def seed(base, users):
+    with db.cursor() as c:
+        c.execute("""
+            INSERT INTO users (id, username, points, joined_at)
+            SELECT g, 'bench' || g, 0, now() FROM generate_series(%s, %s) g
+            ON CONFLICT (id) DO NOTHING
+        """, (base, base + users - 1))
+
+
+def cleanup(base, users):
+    with db.cursor() as c:
+        c.execute("SET LOCAL statement_timeout = 0")
+        for table, col in (("memories", "user_id"), ("garden_latest", "user_id"), ("users", "id")):
+            c.execute(f"DELETE FROM {table} WHERE {col} BETWEEN %s AND %s", (base, base + users - 1))
+
+
+def run(writer, threads, seconds, base, users):
+    done = [0] * threads
+    stop = time.monotonic() + seconds
+
+    def worker(i):
+        n = 0
+        while time.monotonic() < stop:
+            uid = base + (i * 7919 + n) % users
+            writer.write(uid, f"bench memory {n}", n % 6, datetime.now(timezone.utc))
+            n += 1
+        done[i] = n
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return sum(done) / seconds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--windows", type=float, nargs="+", default=[0, 5, 20], help="write-behind ms; 0 = per row")
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--base", type=int, default=9_000_000_000)
+    args = ap.parse_args()
+
+    seed(args.base, args.users)
+    try:
+        print(f"{'threads':>7}" + "".join(f"{f'{w:g} ms/s':>12}" for w in args.windows))
+        for n in args.threads:
+            rates = []
+            for w in args.windows:
+                writer = writes.MemoryWriter(window_ms=w)
+                rates.append(run(writer, n, args.seconds, args.base, args.users))
+                writer.drain()
+            print(f"{n:>7}" + "".join(f"{r:>12.0f}" for r in rates))
+    finally:
+        cleanup(args.base, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Times moods.analyse() on 10 years of synthetic daily entries.
+
+Builds the mood_daily rows a heavy user would have (1-3 moods most days,
+some days skipped), then compares analyse() with a straightforward
+pure-Python pass over the same rows, and checks both agree. No database
+needed:
+
+    python benchmarks/mood_trends.py --years 10 --runs 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import moods
+
+
+def synthetic(years, seed=7):
+    rnd = random.Random(seed)
+    today = date.today().toordinal()
+    cells = defaultdict(lambda: [0, 0])
+    for d in range(today - int(years * 365.25), today + 1):
+        if rnd.random() < 0.15:
+            continue
+        for _ in range(rnd.choice((1, 1, 2, 3))):
+            cell = cells[d, rnd.choice((8, 9, 13, 18, 21, 22))]
+            cell[0] += 1
+            cell[1] += rnd.randint(0, 5)
+    rows = np.array([(d, h, n, t) for (d, h), (n, t) in sorted(cells.items())], dtype=np.int64)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], today
+
+
+def baseline(day, hour, n, total, today):
+    """The same numbers with dicts and loops, one calendar day at a time."""
+    cnt, tot = defaultdict(int), defaultdict(int)
+    heat = defaultdict(lambda: [0, 0])
+    for d, h, k, t in zip(day.tolist(), hour.tolist(), n.tolist(), total.tolist()):
+        cnt[d] += k
+        tot[d] += t
+        cell = heat[(d - 1) % 7, h]
+        cell[0] += k
+        cell[1] += t
+    days = range(min(cnt), max(today, max(cnt)) + 1)
+    avg7, streak, run = [], defaultdict(lambda: [0, 0]), 0
+    for d in days:
+        c = sum(cnt.get(x, 0) for x in range(d - 6, d + 1))
+        s = sum(tot.get(x, 0) for x in range(d - 6, d + 1))
+        avg7.append(s / c if c else None)
+        run = run + 1 if d in cnt else 0
+        if run:
+            slot = streak[min(run, moods.STREAK_DAYS) - 1]
+            slot[0] += cnt[d]
+            slot[1] += tot[d]
+    heatmap = [[heat[w, h][1] / heat[w, h][0] if heat[w, h][0] else None for h in range(24)] for w in range(7)]
+    return {"avg7": avg7, "heatmap": heatmap, "streak": [t / c if c else None for c, t in
+                                                         (streak[i] for i in range(moods.STREAK_DAYS))]}
+
+
+def timed(fn, args, runs):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, out
+
+
+def close(a, b):
+    return (a is None) == (b is None) and (a is None or abs(a - b) < 0.01)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--years", type=float, default=10)
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+
+    data = synthetic(args.years)
+    print(f"{len(data[0])} mood_daily rows, {int(data[2].sum())} entries over {args.years:g} years")
+    fast_ms, fast = timed(moods.analyse, data, args.runs)
+    slow_ms, slow = timed(baseline, data, max(args.runs // 10, 1))
+    print(f"numpy analyse   {fast_ms:8.2f} ms")
+    print(f"python baseline {slow_ms:8.2f} ms  ({slow_ms / fast_ms:.0f}x)")
+
+    window = len(fast["avg7"])
+    ok = (all(close(a, b) for a, b in zip(fast["avg7"], slow["avg7"][-window:]))
+          and all(close(a, b) for ra, rb in zip(fast["heatmap"], slow["heatmap"]) for a, b in zip(ra, rb))
+          and all(close(a, b) for a, b in zip(fast["streak"], slow["streak"])))
+    print("results match" if ok else "RESULTS DIFFER")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Requests per second for the public pages with the page cache cold and warm.
+
+Drives the Flask app in-process through its test client, so it measures
+query + render (cold) against a cached, pre-compressed hit (warm), without
+network noise. Also reports how a revalidating client fares (304s).
+Needs the app's usual environment (DATABASE_URL, BOT_TOKEN, ...):
+
+    python benchmarks/page_cache.py --uid 123 --seconds 3
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pagecache
+from main import app
+
+
+def rate(client, url, seconds, headers, before=None):
+    n = 0
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        if before:
+            before()
+        resp = client.get(url, headers=headers)
+        assert resp.status_code in (200, 304), (url, resp.status_code)
+        n += 1
+    return n / seconds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--uid", type=int, required=True, help="an existing user with some memories")
+    ap.add_argument("--seconds", type=float, default=3)
+    args = ap.parse_args()
+
+    routes = ["/privacy", "/leaderboard", f"/explore?uid={args.uid}",
+              f"/visit_garden/{args.uid}", f"/dashboard/{args.uid}"]
+    client = app.test_client()
+    gz = {"Accept-Encoding": "gzip"}
+
+    print(f"{'route':<28} {'cold/s':>8} {'warm/s':>8} {'304/s':>8} {'html KB':>8} {'gzip KB':>8}")
+    for url in routes:
+        cold = rate(client, url, args.seconds, gz, before=pagecache.clear)
+        warm = rate(client, url, args.seconds, gz)
+        plain = client.get(url)
+        packed = client.get(url, headers=gz)
+        etag = {"If-None-Match": plain.headers.get("ETag", ""), **gz}
+        revalidate = rate(client, url, args.seconds, etag)
+        print(f"{url:<28} {cold:>8.0f} {warm:>8.0f} {revalidate:>8.0f} "
+              f"{len(plain.data) / 1024:>8.1f} {len(packed.data) / 1024:>8.1f}")
+    print(pagecache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Fails if a hot query's plan falls back to a sequential scan.
+
+Applies migrations.py into a throwaway schema, seeds it, and EXPLAINs every
+query the bot and web routes run per request. Exits non-zero listing the
+offenders, so it can gate a deploy or CI job:
+
+    DATABASE_URL=postgres://... python benchmarks/query_plans.py
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import pytz
+import gardens
+import migrations
+import reminders
+import streaks
+
+SCHEMA = "bench_plans"
+
+# (name, sql, params) -- keep in step with what runs per update or page view
+HOT_QUERIES = [
+    # bot
+    ("show_memories",
+     "SELECT text, mood, timestamp FROM memories WHERE user_id=%s ORDER BY timestamp DESC LIMIT 5", (42,)),
+    ("conv_state get", "SELECT data FROM conv_state WHERE user_id = %s AND expires_at > now()", (42,)),
+    ("conv_state set",
+     """INSERT INTO conv_state (user_id, data, expires_at) VALUES (%s, %s, now() + make_interval(secs => %s))
+        ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at""",
+     (42, "{}", 900)),
+    ("conv_state pop",
+     "DELETE FROM conv_state WHERE user_id = %s RETURNING data, expires_at > now()", (42,)),
+    ("streak claim", streaks._CLAIM_SQL,
+     {"uid": 42, "points": streaks.STREAK_POINTS, "every": streaks.BONUS_EVERY, "bonus": streaks.BONUS_POINTS}),
+    ("rank points", "SELECT points FROM users WHERE id = %s", (42,)),
+    ("rank neighbours above",
+     "SELECT username, points FROM users WHERE (points, id) > (%s, %s) ORDER BY points, id LIMIT 2", (250, 42)),
+    ("rank neighbours below",
+     "SELECT username, points FROM users WHERE (points, id) < (%s, %s) ORDER BY points DESC, id DESC LIMIT 2", (250, 42)),
+    ("mood_daily", "SELECT day - DATE '0001-01-01' + 1, hour, n, total FROM mood_daily WHERE user_id = %s", (42,)),
+    ("memory search",
+     """SELECT m.id FROM memories m, websearch_to_tsquery('english', %s) q
+        WHERE m.user_id = %s AND m.tsv @@ q
+        ORDER BY ts_rank_cd(m.tsv, q) DESC, m.timestamp DESC, m.id DESC LIMIT 11""", ("quiet walk", 42)),
+    ("reminder audience",
+     "SELECT id FROM users WHERE id > %s AND ({}) ORDER BY id LIMIT %s", None),
+    # web
+    ("pagecache version", "SELECT pages_version FROM users WHERE id = %s", (42,)),
+    ("profile",
+     """SELECT username, streak, points, last_streak,
+               (SELECT COUNT(*) FROM users r WHERE r.referred_by = users.id)
+        FROM users WHERE id = %s""", (42,)),
+    ("journal page after cursor",
+     """SELECT m.id, m.text, m.mood, m.timestamp, m.voice_path, m.audio_status, b.size, b.duration
+        FROM memories m LEFT JOIN voice_blobs b ON b.key = m.voice_path
+        WHERE m.user_id = %s AND m.timestamp IS NOT NULL AND (m.timestamp, m.id) < (now(), 1000000000)
+        ORDER BY m.timestamp DESC, m.id DESC LIMIT 21""", (42,)),
+    ("leaderboard", "SELECT username, points, id FROM users ORDER BY points DESC, id DESC LIMIT 10", ()),
+    ("explore sample", gardens._SAMPLE_SQL, {"picks": 10, "exclude": 42}),
+]
+
+
+def _reminder_audience():
+    where, params = reminders.audience(reminders.payload())
+    return where, (0, *params, 500)
+
+
+def seed(c, users, per_user):
+    zones = sorted(pytz.all_timezones)
+    c.execute("""
+        INSERT INTO users (id, username, referred_by, streak, points, joined_at, tz)
+        SELECT g, 'user' || g, CASE WHEN g %% 10 = 0 THEN g / 10 END, g %% 30, g %% 500,
+               now() - (g %% 1000 || ' days')::interval, (%s::text[])[g %% %s + 1]
+        FROM generate_series(1, %s) g
+    """, (zones, len(zones), users))
+    c.execute("""
+        INSERT INTO memories (user_id, text, mood, timestamp)
+        SELECT (g %% %s) + 1, 'memory ' || g, g %% 6, now() - (g || ' minutes')::interval
+        FROM generate_series(1, %s) g
+    """, (users, users * per_user))
+    c.execute("""
+        INSERT INTO garden_latest (user_id, text, mood, timestamp)
+        SELECT DISTINCT ON (user_id) user_id, text, mood, timestamp
+        FROM memories ORDER BY user_id, timestamp DESC
+    """)
+    c.execute("""
+        INSERT INTO mood_daily (user_id, day, hour, n, total)
+        SELECT user_id, timestamp::date, EXTRACT(HOUR FROM timestamp), COUNT(*), SUM(mood)
+        FROM memories GROUP BY 1, 2, 3
+    """)
+    c.execute("""
+        INSERT INTO conv_state (user_id, data, expires_at)
+        SELECT g, '{}', now() + interval '15 minutes' FROM generate_series(1, %s, 20) g
+    """, (users,))
+    c.execute("ANALYZE")
+
+
+def seq_scans(plan):
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50000)
+    ap.add_argument("--per-user", type=int, default=10)
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    c = conn.cursor()
+    failures = []
+    try:
+        c.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        c.execute(f"CREATE SCHEMA {SCHEMA}")
+        c.execute(f"SET search_path TO {SCHEMA}")
+        conn.commit()
+        migrations.migrate(conn, verbose=False)
+        seed(c, args.users, args.per_user)
+        conn.commit()
+
+        for name, sql, params in HOT_QUERIES:
+            if params is None:
+                where, params = _reminder_audience()
+                sql = sql.format(where)
+            c.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = c.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = seq_scans(plan[0]["Plan"])
+            print(f"{'FAIL' if scans else 'ok':>4}  {name}" + (f"  (seq scan on {', '.join(scans)})" if scans else ""))
+            if scans:
+                failures.append(name)
+    finally:
+        conn.rollback()
+        c.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
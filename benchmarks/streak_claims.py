@@ -0,0 +1,131 @@
+"""Fires parallel streak claims at one user and checks exactly one wins.
+
+Covers the three cases streaks.py decides: first claim, continuing from
+yesterday, and a claim after a missed day (with the 5-day bonus in
+between). Exits 1 on any wrong result, so it can gate a deploy.
+
+    python benchmarks/streak_claims.py --backend sqlite --threads 32
+    DATABASE_URL=postgres://... python benchmarks/streak_claims.py --backend postgres
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streaks
+
+UID = 9_000_000_001
+TZ = "Asia/Kolkata"
+
+
+class SQLiteTarget:
+    def __init__(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "streaks.db")
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, streak INT, points INT, last_entry TEXT)")
+
+    def reset(self, streak, points, last):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)",
+                         (UID, streak, points, last.isoformat() if last else None))
+
+    def claim(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                return streaks.claim_sqlite(conn.cursor(), UID, tz=TZ)
+        finally:
+            conn.close()
+
+    def state(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT streak, points FROM users WHERE id = ?", (UID,)).fetchone()
+
+
+class PostgresTarget:
+    def __init__(self):
+        import db
+        self.db = db
+
+    def reset(self, streak, points, last):
+        self.db.execute("""
+            INSERT INTO users (id, username, streak, points, last_streak, tz, joined_at)
+            VALUES (%s, 'streak-check', %s, %s, %s, %s, now())
+            ON CONFLICT (id) DO UPDATE SET streak = EXCLUDED.streak, points = EXCLUDED.points,
+                last_streak = EXCLUDED.last_streak, tz = EXCLUDED.tz
+        """, (UID, streak, points, last, TZ))
+
+    def claim(self):
+        with self.db.cursor() as c:
+            row = streaks.claim(c, UID)
+        return row[:2] if row else None
+
+    def state(self):
+        return self.db.fetchone("SELECT streak, points FROM users WHERE id = %s", (UID,))
+
+    def cleanup(self):
+        self.db.execute("DELETE FROM users WHERE id = %s", (UID,))
+
+
+def fire(target, threads):
+    barrier = threading.Barrier(threads)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        barrier.wait()
+        r = target.claim()
+        with lock:
+            results.append(r)
+
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return [r for r in results if r]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args()
+
+    target = SQLiteTarget() if args.backend == "sqlite" else PostgresTarget()
+    yesterday, today = streaks.day_bounds(TZ)
+    cases = [
+        ("first claim", (0, 0, None), (1, 1)),
+        ("continues from yesterday", (3, 10, yesterday + timedelta(hours=1)), (4, 11)),
+        ("fifth day earns bonus", (4, 10, yesterday), (5, 10 + streaks.STREAK_POINTS + streaks.BONUS_POINTS)),
+        ("missed a day resets", (7, 10, yesterday - timedelta(minutes=1)), (1, 11)),
+        ("already claimed today", (2, 5, today), None),
+    ]
+
+    failures = 0
+    for name, start, expected in cases:
+        for _ in range(args.rounds):
+            target.reset(*start)
+            winners = fire(target, args.threads)
+            state = tuple(target.state())
+            want_state = expected or start[:2]
+            ok = len(winners) == (1 if expected else 0) and state == want_state
+            if not ok:
+                failures += 1
+                print(f"FAIL {name}: {len(winners)} winners, state {state}, expected {want_state}")
+                break
+        else:
+            print(f"ok   {name}")
+
+    if hasattr(target, "cleanup"):
+        target.cleanup()
+    print(f"{args.threads} parallel claims x {args.rounds} rounds per case")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Voice memories handled per second: inline pydub vs. the transcode pool.
+
+"Inline" is what handle_voice used to do before replying to the user: pydub
+decode + MP3 export. "Queued" measures how fast the handler can hand notes
+off to transcode.submit(), and "drained" how long the pool takes to finish
+all of them. Needs ffmpeg on PATH; pydub only for the inline baseline.
+
+With --s3, the notes live in fake_s3.FakeS3 (with --latency-ms per
+request) and the pool runs the real job: fetch, convert, upload. The
+handler-side rate is compared with fetching each note on the handler
+thread first, which is what submit() used to do.
+
+    python benchmarks/voice_transcode.py --notes 40
+    python benchmarks/voice_transcode.py --notes 40 --s3 --latency-ms 20 60
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+import transcode
+from fake_s3 import FakeS3
+
+
+def make_sample(path, seconds):
+    subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", f"sine=frequency=440:duration={seconds}", "-c:a", "libopus", path], check=True)
+
+
+def run_s3(paths, latency_ms):
+    fake = FakeS3(latency_ms).start()
+    storage.backend = fake.backend()
+    keys = []
+    for i, p in enumerate(paths):
+        key = f"voices/{i % 256:02x}/{i:064x}.ogg"
+        shutil.copy(p, p + ".up")
+        storage.backend.put_file(key, p + ".up")
+        keys.append(key)
+
+    t = time.perf_counter()
+    for key in keys:
+        path, _ = storage.backend.local_copy(key)
+        os.remove(path)
+    fetched = len(keys) / (time.perf_counter() - t)
+    print(f"fetch on handler: {fetched:8.1f} notes/s (before: submit() downloaded first)")
+
+    executor = transcode._get_executor()
+    t = time.perf_counter()
+    futures = [executor.submit(transcode._job, key) for key in keys]
+    queued = len(keys) / (time.perf_counter() - t)
+    wait(futures)
+    drained = len(keys) / (time.perf_counter() - t)
+    for f in futures:
+        f.result()
+    print(f"queued:           {queued:8.1f} notes/s (handler-side, fetch in the pool)")
+    print(f"drained ({transcode.TRANSCODE_WORKERS}w):     {drained:8.1f} notes/s")
+    print(fake.summary()["calls"])
+    fake.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=40)
+    ap.add_argument("--seconds", type=int, default=15, help="length of each voice note")
+    ap.add_argument("--s3", action="store_true", help="store the notes in fake_s3 and run the full job")
+    ap.add_argument("--latency-ms", type=float, nargs=2, default=(20, 60), metavar=("MIN", "MAX"))
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    sample = os.path.join(work, "sample.ogg")
+    make_sample(sample, args.seconds)
+    paths = []
+    for i in range(args.notes):
+        p = os.path.join(work, f"{i}.ogg")
+        shutil.copy(sample, p)
+        paths.append(p)
+
+    if args.s3:
+        run_s3(paths, tuple(args.latency_ms))
+        shutil.rmtree(work)
+        return
+
+    try:
+        from pydub import AudioSegment
+        t = time.perf_counter()
+        for p in paths:
+            AudioSegment.from_file(p).export(p[:-4] + ".inline.mp3", format="mp3")
+        inline = args.notes / (time.perf_counter() - t)
+        print(f"inline pydub:   {inline:8.1f} notes/s")
+    except ImportError:
+        print("inline pydub:   skipped (pydub not installed)")
+
+    executor = transcode._get_executor()
+    t = time.perf_counter()
+    futures = [executor.submit(transcode.to_mp3, p, p[:-4] + ".mp3") for p in paths]
+    queued = args.notes / (time.perf_counter() - t)
+    wait(futures)
+    drained = args.notes / (time.perf_counter() - t)
+    print(f"queued:         {queued:8.1f} notes/s (handler-side)")
+    print(f"drained ({transcode.TRANSCODE_WORKERS}w):   {drained:8.1f} notes/s")
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
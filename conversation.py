@@ -0,0 +1,239 @@
+# conversation.py
+"""Per-user conversation state (pending log text, voice note, next step).
+
+Kept outside the process so any worker can continue a flow another worker
+started. State is one small JSON object per user with a TTL, so abandoned
+flows expire on their own.
+
+CONV_STORE picks the backend: postgres (default), sqlite, redis or memory.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import db
+
+CONV_STORE = os.getenv("CONV_STORE", "postgres")
+CONV_TTL_SECONDS = int(os.getenv("CONV_TTL_SECONDS", "3600"))
+CONV_SQLITE_PATH = os.getenv("CONV_SQLITE_PATH", "conversations.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+MEMORY_MAX_USERS = 50000
+
+
+def dumps(state):
+    return json.dumps(state, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(raw):
+    return json.loads(raw) if raw else None
+
+
+class MemoryStore:
+    """Single-process store; LRU-bounded as well as TTL-expired."""
+
+    def __init__(self, max_users=MEMORY_MAX_USERS):
+        self.max_users = max_users
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        with self._lock:
+            item = self._data.get(uid)
+            if item is None:
+                return None
+            expires, raw = item
+            if expires < time.monotonic():
+                del self._data[uid]
+                return None
+            return loads(raw)
+
+    def set(self, uid, state, ttl=CONV_TTL_SECONDS):
+        with self._lock:
+            self._data[uid] = (time.monotonic() + ttl, dumps(state))
+            self._data.move_to_end(uid)
+            while len(self._data) > self.max_users:
+                self._data.popitem(last=False)
+
+    def pop(self, uid):
+        with self._lock:
+            item = self._data.pop(uid, None)
+        if item is None or item[0] < time.monotonic():
+            return None
+        return loads(item[1])
+
+    def purge(self):
+        now = time.monotonic()
+        with self._lock:
+            for uid in [u for u, (exp, _) in self._data.items() if exp < now]:
+                del self._data[uid]
+
+
+class PostgresStore:
+    def get(self, uid):
+        row = db.fetchone("SELECT data FROM conv_state WHERE user_id = %s AND expires_at > now()", (uid,))
+        return loads(row[0]) if row else None
+
+    def set(self, uid, state, ttl=CONV_TTL_SECONDS):
+        db.execute("""
+            INSERT INTO conv_state (user_id, data, expires_at)
+            VALUES (%s, %s, now() + make_interval(secs => %s))
+            ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+        """, (uid, dumps(state), ttl))
+
+    def pop(self, uid):
+        # DELETE ... RETURNING makes the hand-off atomic: two workers can
+        # never both consume the same pending memory.
+        row = db.fetchone("DELETE FROM conv_state WHERE user_id = %s RETURNING data, expires_at > now()",
+                          (uid,), retry=False)
+        return loads(row[0]) if row and row[1] else None
+
+    def purge(self):
+        db.execute("DELETE FROM conv_state WHERE expires_at <= now()")
+
+
+class SQLiteStore:
+    """For local runs without Postgres; shared by processes on one host."""
+
+    def __init__(self, path=CONV_SQLITE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS conv_state (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM conv_state WHERE user_id = ? AND expires_at > ?",
+                                     (uid, time.time())).fetchone()
+        return loads(row[0]) if row else None
+
+    def set(self, uid, state, ttl=CONV_TTL_SECONDS):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO conv_state (user_id, data, expires_at) VALUES (?, ?, ?)",
+                               (uid, dumps(state), time.time() + ttl))
+
+    def pop(self, uid):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data, expires_at FROM conv_state WHERE user_id = ?",
+                                         (uid,)).fetchone()
+                self._conn.execute("DELETE FROM conv_state WHERE user_id = ?", (uid,))
+            finally:
+                self._conn.execute("COMMIT")
+        return loads(row[0]) if row and row[1] > time.time() else None
+
+    def purge(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM conv_state WHERE expires_at <= ?", (time.time(),))
+
+
+class RedisStore:
+    """Speaks the Redis protocol directly (GET/SET PX/GETDEL), so it works
+    against Redis, Valkey, KeyDB or a local stand-in without a client library."""
+
+    def __init__(self, url=REDIS_URL, prefix="conv:"):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "localhost", u.port or 6379
+        self.password = u.password
+        self.db = int((u.path or "/0").lstrip("/") or 0)
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        f = sock.makefile("rb")
+        self._local.sock, self._local.file = sock, f
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _read(self):
+        f = self._local.file
+        line = f.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = f.read(n + 2)[:-2]
+            return data.decode()
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RuntimeError(f"unexpected redis reply {line!r}")
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for a in args:
+            b = str(a).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        self._local.sock.sendall(b"".join(parts))
+
+    def _call(self, *args):
+        self._send(*args)
+        return self._read()
+
+    def _close(self):
+        # The makefile() reader holds its own reference; close both or the fd leaks.
+        for res in (getattr(self._local, "file", None), getattr(self._local, "sock", None)):
+            if res is not None:
+                try:
+                    res.close()
+                except OSError:
+                    pass
+        self._local.sock = self._local.file = None
+
+    def _cmd(self, *args):
+        for attempt in range(2):
+            sent = False
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                self._send(*args)
+                sent = True
+                return self._read()
+            except (OSError, ConnectionError):
+                self._close()
+                # GETDEL may already have run if the request went out; a retry would lose the state.
+                if attempt or (sent and args[0] == "GETDEL"):
+                    raise
+
+    def get(self, uid):
+        return loads(self._cmd("GET", f"{self.prefix}{uid}"))
+
+    def set(self, uid, state, ttl=CONV_TTL_SECONDS):
+        self._cmd("SET", f"{self.prefix}{uid}", dumps(state), "PX", int(ttl * 1000))
+
+    def pop(self, uid):
+        return loads(self._cmd("GETDEL", f"{self.prefix}{uid}"))
+
+    def purge(self):
+        pass  # Redis expires keys itself
+
+
+def create(kind=CONV_STORE):
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "sqlite":
+        return SQLiteStore()
+    if kind == "redis":
+        return RedisStore()
+    return PostgresStore()
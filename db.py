@@ -1,40 +1,156 @@
-import sqlite3
-
-conn = sqlite3.connect("memories.db", check_same_thread=False)
-c = conn.cursor()
-
-def init_db():
-    c.execute("""CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY,
-        name TEXT,
-        points INTEGER DEFAULT 0,
-        streak INTEGER DEFAULT 0
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS memories (
-        user_id INTEGER,
-        content TEXT,
-        type TEXT,  -- text/image/voice
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )""")
-
-    conn.commit()
-
-def add_user(user_id, name):
-    c.execute("INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)", (user_id, name))
-    conn.commit()
-
-def log_memory(user_id, content, mem_type):
-    c.execute("INSERT INTO memories (user_id, content, type) VALUES (?, ?, ?)",
-              (user_id, content, mem_type))
-    c.execute("UPDATE users SET points = points + 5 WHERE id = ?", (user_id,))
-    conn.commit()
-
-def get_dashboard_data(user_id):
-    c.execute("SELECT name, points FROM users WHERE id = ?", (user_id,))
-    user = c.fetchone()
-
-    c.execute("SELECT content, type, timestamp FROM memories WHERE user_id = ?", (user_id,))
-    files = c.fetchall()
-
-    return user, files
+# db.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+import metrics
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_HEALTHCHECK_IDLE_SECONDS", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(POOL_MAX)
+_last_used = {}
+_in_use = 0
+_counter_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within DB_POOL_TIMEOUT seconds."""
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    POOL_MIN, POOL_MAX, DATABASE_URL,
+                    options=f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+                    cursor_factory=metrics.TimedCursor,
+                )
+    return _pool
+
+
+def _healthy(conn):
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0)
+    if idle < HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    global _in_use
+    # The semaphore makes callers wait for a free connection instead of
+    # getting PoolError from psycopg2 when all POOL_MAX are checked out.
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        raise PoolTimeout(f"no database connection available after {POOL_TIMEOUT}s")
+    try:
+        pool = _get_pool()
+        conn = pool.getconn()
+        if not _healthy(conn):
+            pool.putconn(conn, close=True)
+            _last_used.pop(id(conn), None)
+            conn = pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    with _counter_lock:
+        _in_use += 1
+    return conn
+
+
+def _release(conn, broken=False):
+    global _in_use
+    try:
+        close = broken or conn.closed
+        if close:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        _get_pool().putconn(conn, close=close)
+    finally:
+        with _counter_lock:
+            _in_use -= 1
+        _slots.release()
+
+
+@contextmanager
+def connection():
+    """Checks a connection out of the pool for one transaction.
+
+    Commits when the block exits cleanly, rolls back on error, and throws the
+    connection away if the server dropped it so the next checkout reconnects.
+    """
+    conn = _checkout()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        broken = broken or conn.closed != 0
+        raise
+    finally:
+        _release(conn, broken)
+
+
+@contextmanager
+def cursor():
+    """Yields a cursor on a pooled connection, committed on exit."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+
+def _run(fn, sql, params, retry=True):
+    # A read on a connection the server already closed is safe to retry once
+    # on a fresh one. Statement timeouts and errors on a live connection are
+    # raised as-is, and writes are never retried.
+    for attempt in range(2 if retry else 1):
+        try:
+            with cursor() as cur:
+                cur.execute(sql, params)
+                return fn(cur)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if attempt or not retry or isinstance(e, psycopg2.extensions.QueryCanceledError):
+                raise
+            print("[DB] Connection lost, retrying:", e)
+
+
+def fetchone(sql, params=None, retry=True):
+    return _run(lambda cur: cur.fetchone(), sql, params, retry)
+
+
+def fetchall(sql, params=None, retry=True):
+    return _run(lambda cur: cur.fetchall(), sql, params, retry)
+
+
+def execute(sql, params=None):
+    return _run(lambda cur: cur.rowcount, sql, params, retry=False)
+
+
+def stats():
+    """Returns pool usage for diagnostics."""
+    return {"in_use": _in_use, "max": POOL_MAX}
+
@@ -0,0 +1,156 @@
+# deletion.py
+import os
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import gardens
+import moods
+import storage
+
+BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", "500"))
+FILE_WORKERS = int(os.getenv("DELETION_FILE_WORKERS", "8"))
+# Gap between batches so other writers to memories get a turn at the locks.
+BATCH_PAUSE = float(os.getenv("DELETION_BATCH_PAUSE", "0.05"))
+STALE_AFTER = "5 minutes"
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create(uid):
+    """Queues deletion of a user's account; asking twice is harmless."""
+    db.execute("""
+        INSERT INTO deletion_jobs (user_id) VALUES (%s)
+        ON CONFLICT (user_id) DO UPDATE
+        SET status = 'queued', deleted = 0, owner = NULL, heartbeat = NULL,
+            created_at = now(), finished_at = NULL
+        WHERE deletion_jobs.status = 'done'
+    """, (uid,))
+
+
+def pending(uid):
+    """True while a deletion for the user is queued or running."""
+    return db.fetchone("SELECT 1 FROM deletion_jobs WHERE user_id = %s AND status != 'done'",
+                       (uid,)) is not None
+
+
+def _claim(uid):
+    # Same ownership rules as fanout: a stale heartbeat means the previous
+    # owner died and the job can be picked up where it stopped.
+    return db.fetchone("""
+        UPDATE deletion_jobs SET owner = %s, heartbeat = now(), status = 'running'
+        WHERE user_id = %s AND status IN ('queued', 'running')
+        AND (owner IS NULL OR owner = %s OR heartbeat < now() - interval %s)
+        RETURNING deleted
+    """, (_OWNER, uid, _OWNER, STALE_AFTER), retry=False)
+
+
+def _delete_files(pool, keys):
+    def delete(key):
+        try:
+            storage.backend.delete(key)
+        except Exception as e:
+            print("[Storage Delete Error]", key, e)
+    list(pool.map(delete, keys))
+
+
+def _batch(uid):
+    """Deletes up to BATCH_SIZE memories in one short transaction.
+
+    Returns (rows deleted, keys whose last reference went with them).
+    """
+    doomed = []
+    with db.cursor() as c:
+        c.execute("""
+            DELETE FROM memories WHERE id IN (
+                SELECT id FROM memories WHERE user_id = %s LIMIT %s
+            ) RETURNING voice_path
+        """, (uid, BATCH_SIZE))
+        rows = c.fetchall()
+        for (vp,) in rows:
+            if vp:
+                doomed += storage.release(c, uid, vp)
+        c.execute("""
+            UPDATE deletion_jobs SET deleted = deleted + %s, heartbeat = now()
+            WHERE user_id = %s
+        """, (len(rows), uid))
+    return len(rows), doomed
+
+
+def _finish(uid):
+    """Drops the user row once no memories are left; False if some still are."""
+    with db.cursor() as c:
+        # Memories logged while the job ran send it round again.
+        c.execute("SELECT EXISTS (SELECT 1 FROM memories WHERE user_id = %s)", (uid,))
+        if c.fetchone()[0]:
+            return False
+        gardens.forget(c, uid)
+        moods.forget(c, uid)
+        c.execute("DELETE FROM active_days WHERE user_id = %s", (uid,))
+        c.execute("DELETE FROM conv_state WHERE user_id = %s", (uid,))
+        # Only the account the job was asked to delete, never one made after it.
+        c.execute("""
+            DELETE FROM users WHERE id = %s AND (joined_at IS NULL OR joined_at <
+                (SELECT created_at AT TIME ZONE 'UTC' FROM deletion_jobs WHERE user_id = %s))
+            RETURNING points
+        """, (uid, uid))
+        gone = c.fetchone()
+        c.execute("UPDATE deletion_jobs SET status = 'done', finished_at = now() WHERE user_id = %s", (uid,))
+    return gone[0] if gone else None
+
+
+def run(uid):
+    """Runs (or resumes) a deletion; returns (memories deleted, old points or None).
+
+    Every batch commits its rows together with the blob refcounts, so a
+    crash at any point resumes cleanly. Files are removed only after the
+    batch that released them has committed.
+    """
+    row = _claim(uid)
+    if not row:
+        return None
+    deleted = row[0]
+    with ThreadPoolExecutor(FILE_WORKERS, thread_name_prefix=f"delete-{uid}") as pool:
+        while True:
+            n, doomed = _batch(uid)
+            deleted += n
+            _delete_files(pool, doomed)
+            if n < BATCH_SIZE:
+                points = _finish(uid)
+                if points is not False:
+                    return deleted, points
+            time.sleep(BATCH_PAUSE)
+
+
+def _spawn(uid, done):
+    def target():
+        try:
+            result = run(uid)
+            if done and result:
+                done(uid, *result)
+        except Exception as e:
+            print(f"[Deletion Error] user {uid}: {e}")
+
+    threading.Thread(target=target, name=f"delete-{uid}", daemon=True).start()
+
+
+def start(uid, done=None):
+    """Queues the deletion and runs it on a background thread.
+
+    done(uid, deleted, points) is called once everything is gone.
+    """
+    create(uid)
+    _spawn(uid, done)
+
+
+def resume_stale(done=None):
+    """Restarts deletions whose owner stopped heartbeating, e.g. after a crash."""
+    rows = db.fetchall("""
+        SELECT user_id FROM deletion_jobs
+        WHERE status IN ('queued', 'running')
+        AND COALESCE(heartbeat, created_at) < now() - interval %s
+    """, (STALE_AFTER,))
+    for (uid,) in rows:
+        _spawn(uid, done)
@@ -0,0 +1,89 @@
+# dispatch.py
+import time
+import threading
+from collections import deque
+
+import metrics
+
+TIMING_WINDOW = 1000
+
+
+def route_key(text):
+    """'/start 123' and '/start@SoulGardenBot' -> '/start'; anything else as-is."""
+    if text.startswith("/"):
+        return text.split(None, 1)[0].split("@", 1)[0]
+    return text
+
+
+class Router:
+    """Maps slash commands and button labels to handlers with one dict lookup.
+
+    Keeps a rolling window of handler run times per route, so a slow
+    command shows up in /admin/queue without profiling the whole bot.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, keys, handler, name=None):
+        name = name or keys[0]
+        for key in keys:
+            self._routes[key] = (name, handler)
+
+    def route(self, *keys, name=None):
+        def decorator(fn):
+            self.add(keys, fn, name)
+            return fn
+        return decorator
+
+    def alias(self, mapping):
+        """Points each label at the route of an already registered key."""
+        for label, key in mapping.items():
+            self._routes[label] = self._routes[key]
+
+    def match(self, text):
+        return self._routes.get(route_key(text))
+
+    def dispatch(self, msg):
+        """Runs the matching handler; returns False when nothing matched."""
+        found = self._routes.get(route_key(msg.text or ""))
+        if found is None:
+            return False
+        self.run(*found, msg)
+        return True
+
+    def run(self, name, handler, msg):
+        """Calls handler(msg), timed under the given route name."""
+        t = time.perf_counter()
+        span = metrics.begin("handler", name)
+        ok = False
+        try:
+            handler(msg)
+            ok = True
+        finally:
+            elapsed = time.perf_counter() - t
+            metrics.end(span, ok)
+            with self._lock:
+                timing = self._timings.get(name)
+                if timing is None:
+                    timing = self._timings[name] = {"count": 0, "errors": 0, "times": deque(maxlen=TIMING_WINDOW)}
+                timing["count"] += 1
+                timing["errors"] += not ok
+                timing["times"].append(elapsed)
+
+    def stats(self):
+        out = {}
+        with self._lock:
+            snapshot = [(name, t["count"], t["errors"], sorted(t["times"])) for name, t in self._timings.items()]
+        for name, count, errors, times in snapshot:
+            if not count:
+                continue
+
+            def pct(p):
+                return round(times[min(len(times) - 1, int(len(times) * p))] * 1000, 1)
+
+            out[name] = {"count": count, "errors": errors,
+                         "ms_p50": pct(0.50), "ms_p95": pct(0.95), "ms_max": pct(1.0)}
+        return out
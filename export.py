@@ -0,0 +1,174 @@
+# export.py
+"""Personal data export, streamed.
+
+Memories are read in keyset batches of FETCH_SIZE and written out as they
+arrive, as NDJSON, CSV, or a ZIP holding memories.ndjson plus the voice
+files. Nothing is built up in memory, so a user with tens of thousands of
+memories costs the same RAM as one with ten. Each batch is its own short
+query, so a slow download never holds a pooled connection or an open
+transaction between chunks.
+
+Download links are HMAC-signed and expire, so they can be handed out in
+chat without exposing other users' data.
+"""
+import io
+import os
+import csv
+import hmac
+import json
+import time
+import hashlib
+import zipfile
+
+import db
+import storage
+
+EXPORT_SECRET = os.getenv("EXPORT_SECRET") or os.getenv("BOT_TOKEN") or ""
+LINK_TTL_SECONDS = int(os.getenv("EXPORT_LINK_TTL_SECONDS", "3600"))
+FETCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "zip": ("application/zip", "zip"),
+}
+COLUMNS = ("id", "timestamp", "mood", "text", "voice", "audio_status")
+
+
+def sign(uid, expires):
+    msg = f"{uid}:{expires}".encode()
+    return hmac.new(EXPORT_SECRET.encode(), msg, hashlib.sha256).hexdigest()[:32]
+
+
+def link_params(uid, ttl=LINK_TTL_SECONDS):
+    expires = int(time.time()) + ttl
+    return {"expires": expires, "sig": sign(uid, expires)}
+
+
+def verify(uid, expires, sig):
+    if not EXPORT_SECRET or not expires or not sig or expires < time.time():
+        return False
+    return hmac.compare_digest(sign(uid, expires), sig)
+
+
+def _walk(uid, columns, where=""):
+    """Yields (id, timestamp, *columns) rows oldest first, one query per batch."""
+    # Dated rows follow memories_user_ts_idx; legacy undated ones come last, by id.
+    last = None
+    while True:
+        if last is None:
+            keyset, params = "m.timestamp IS NOT NULL", [uid]
+        else:
+            keyset, params = "(m.timestamp, m.id) > (%s, %s)", [uid, *last]
+        rows = db.fetchall(f"""
+            SELECT m.id, m.timestamp, {columns} FROM memories m
+            WHERE m.user_id = %s AND {keyset}{where}
+            ORDER BY m.timestamp, m.id LIMIT %s
+        """, params + [FETCH_SIZE])
+        yield from rows
+        if len(rows) < FETCH_SIZE:
+            break
+        last = rows[-1][1], rows[-1][0]
+    last_id = 0
+    while True:
+        rows = db.fetchall(f"""
+            SELECT m.id, m.timestamp, {columns} FROM memories m
+            WHERE m.user_id = %s AND m.timestamp IS NULL AND m.id > %s{where}
+            ORDER BY m.id LIMIT %s
+        """, (uid, last_id, FETCH_SIZE))
+        yield from rows
+        if len(rows) < FETCH_SIZE:
+            break
+        last_id = rows[-1][0]
+
+
+def memories(uid):
+    """Yields the user's memories oldest first as dicts, FETCH_SIZE at a time."""
+    for row in _walk(uid, "m.mood, m.text, m.voice_path, m.audio_status"):
+        m = dict(zip(COLUMNS, row))
+        m["timestamp"] = m["timestamp"].isoformat() if m["timestamp"] else None
+        yield m
+
+
+def voice_keys(uid):
+    seen = set()
+    for _, _, key in _walk(uid, "m.voice_path", " AND m.voice_path IS NOT NULL"):
+        if key not in seen:
+            seen.add(key)
+            yield key
+
+
+def ndjson(uid):
+    for m in memories(uid):
+        yield json.dumps(m, ensure_ascii=False) + "\n"
+
+
+def to_csv(uid):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(COLUMNS)
+    for m in memories(uid):
+        w.writerow([m[c] for c in COLUMNS])
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable target; zipfile then streams with data descriptors."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def to_zip(uid):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("memories.ndjson", "w") as f:
+            for line in ndjson(uid):
+                f.write(line.encode())
+                if sink.chunks:
+                    yield sink.take()
+        for key in voice_keys(uid):
+            try:
+                path, is_temp = storage.backend.local_copy(key)
+            except Exception as e:
+                print("[Export Voice Error]", key, e)
+                continue
+            try:
+                # Opus is already compressed; deflating it only costs CPU.
+                with open(path, "rb") as src, zf.open(zipfile.ZipInfo(key), "w") as f:
+                    while True:
+                        block = src.read(CHUNK_SIZE)
+                        if not block:
+                            break
+                        f.write(block)
+                        yield sink.take()
+            except FileNotFoundError:
+                pass
+            finally:
+                if is_temp:
+                    os.remove(path)
+    yield sink.take()
+
+
+def stream(uid, fmt):
+    """Returns (chunk generator, mimetype, filename) for one of FORMATS."""
+    mimetype, ext = FORMATS[fmt]
+    gen = {"ndjson": ndjson, "csv": to_csv, "zip": to_zip}[fmt](uid)
+    return gen, mimetype, f"soulgarden-{uid}.{ext}"
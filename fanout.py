@@ -0,0 +1,194 @@
+# fanout.py
+import os
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+import db
+
+# Telegram allows roughly 30 messages/second per bot and 1/second per chat.
+GLOBAL_RATE = float(os.getenv("FANOUT_GLOBAL_RATE", "25"))
+PER_CHAT_INTERVAL = float(os.getenv("FANOUT_PER_CHAT_INTERVAL", "1.05"))
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "8"))
+BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", "500"))
+MAX_RETRIES = 5
+STALE_AFTER = "5 minutes"
+
+_JOBS = {}
+_AUDIENCES = {}
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TokenBucket:
+    """Thread-safe token bucket; pause() stops everyone after a 429."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated = self.paused_until
+            self.tokens = 0
+
+
+bucket = TokenBucket(GLOBAL_RATE)
+
+
+def job(kind, audience=None):
+    """Registers fn(uid, payload) -> list of zero-arg send calls for one recipient.
+
+    audience(payload) -> (sql condition, params) narrows the recipients;
+    without it every user gets the job.
+    """
+    def register(fn):
+        _JOBS[kind] = fn
+        if audience:
+            _AUDIENCES[kind] = audience
+        return fn
+    return register
+
+
+def recipient_batches(after_uid=0, where="TRUE", params=(), size=BATCH_SIZE):
+    """Yields lists of user ids in id order, one short keyset query per batch.
+
+    No cursor or transaction stays open while a batch is being sent, so a
+    rate-limited send to many users holds neither a pool slot nor vacuum.
+    """
+    while True:
+        rows = db.fetchall(f"SELECT id FROM users WHERE id > %s AND ({where}) ORDER BY id LIMIT %s",
+                           (after_uid, *params, size))
+        if not rows:
+            return
+        yield [uid for (uid,) in rows]
+        if len(rows) < size:
+            return
+        after_uid = rows[-1][0]
+
+
+def _send(call):
+    for attempt in range(MAX_RETRIES):
+        bucket.acquire()
+        try:
+            return call()
+        except ApiTelegramException as e:
+            if e.error_code != 429 or attempt == MAX_RETRIES - 1:
+                raise
+            retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+            bucket.pause(retry_after)
+
+
+def _deliver(uid, calls):
+    try:
+        for i, call in enumerate(calls):
+            if i:
+                time.sleep(PER_CHAT_INTERVAL)
+            _send(call)
+        return True
+    except Exception as e:
+        print(f"[Fanout] Couldn't message {uid}: {e}")
+        return False
+
+
+def _claim(job_id):
+    # Only one process may drive a job; a stale heartbeat means the previous
+    # owner died and the job can be picked up from its checkpoint. Kinds this
+    # process hasn't registered are left for one that has.
+    return db.fetchone("""
+        UPDATE broadcasts SET owner = %s, heartbeat = now(), status = 'running'
+        WHERE id = %s AND status IN ('queued', 'running') AND kind = ANY(%s)
+        AND (owner IS NULL OR owner = %s OR heartbeat < now() - interval %s)
+        RETURNING kind, payload, last_uid, sent, failed
+    """, (_OWNER, job_id, list(_JOBS), _OWNER, STALE_AFTER), retry=False)
+
+
+def run(job_id, progress=None):
+    """Runs (or resumes) a job to completion and returns (sent, failed)."""
+    row = _claim(job_id)
+    if not row:
+        return None
+    kind, payload, last_uid, sent, failed = row
+    if kind not in _JOBS:
+        raise KeyError(f"fan-out kind {kind!r} is not registered")
+    build = _JOBS[kind]
+    where, params = _AUDIENCES[kind](payload) if kind in _AUDIENCES else ("TRUE", ())
+
+    with ThreadPoolExecutor(FANOUT_WORKERS, thread_name_prefix=f"fanout-{job_id}") as pool:
+        for batch in recipient_batches(last_uid, where, params):
+            results = list(pool.map(lambda uid: _deliver(uid, build(uid, payload)), batch))
+            ok = sum(results)
+            sent += ok
+            failed += len(results) - ok
+            last_uid = batch[-1]
+            db.execute("""
+                UPDATE broadcasts SET last_uid = %s, sent = %s, failed = %s, heartbeat = now()
+                WHERE id = %s
+            """, (last_uid, sent, failed, job_id))
+            if progress:
+                progress(sent, failed)
+
+    db.execute("UPDATE broadcasts SET status = 'done', finished_at = now() WHERE id = %s", (job_id,))
+    return sent, failed
+
+
+def create(kind, payload=""):
+    return db.fetchone("INSERT INTO broadcasts (kind, payload) VALUES (%s, %s) RETURNING id",
+                       (kind, payload), retry=False)[0]
+
+
+def start(kind, payload="", progress=None, done=None):
+    """Queues a job and runs it on a background thread."""
+    job_id = create(kind, payload)
+
+    def target():
+        try:
+            result = run(job_id, progress)
+            if done and result:
+                done(*result)
+        except Exception as e:
+            print(f"[Fanout Error] job {job_id}: {e}")
+
+    threading.Thread(target=target, name=f"fanout-{job_id}", daemon=True).start()
+    return job_id
+
+
+def prune(kind, older_than):
+    """Deletes finished jobs of one kind, e.g. routine reminder slices."""
+    db.execute("""
+        DELETE FROM broadcasts
+        WHERE kind = %s AND status = 'done' AND finished_at < now() - interval %s
+    """, (kind, older_than))
+
+
+def resume_stale():
+    """Restarts jobs whose owner stopped heartbeating, e.g. after a crash."""
+    rows = db.fetchall("""
+        SELECT id FROM broadcasts
+        WHERE status IN ('queued', 'running')
+        AND COALESCE(heartbeat, created_at) < now() - interval %s
+    """, (STALE_AFTER,))
+    for (job_id,) in rows:
+        threading.Thread(target=run, args=(job_id,), name=f"fanout-{job_id}", daemon=True).start()
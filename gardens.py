@@ -0,0 +1,73 @@
+# gardens.py
+import random
+
+import db
+
+# garden_latest holds each user's newest memory, so explore never has to
+# touch the full memories table. seq numbers the rows for random sampling.
+# It can have holes: an INSERT that loses ON CONFLICT still uses up a
+# sequence value. forget() refills the hole a deletion leaves, so the
+# holes stay few, and sample() only takes exact seq hits, so a hole never
+# makes the row after it more likely to be picked.
+
+_SAMPLE_SQL = """
+    WITH bounds AS (
+        SELECT MIN(seq) AS lo, MAX(seq) AS hi FROM garden_latest
+    ), picks AS (
+        SELECT DISTINCT lo + floor(random() * (hi - lo + 1))::bigint AS pos
+        FROM bounds, generate_series(1, %(picks)s)
+    )
+    SELECT g.user_id, g.text, g.mood, g.timestamp
+    FROM picks
+    JOIN garden_latest g ON g.seq = picks.pos
+    WHERE g.user_id != %(exclude)s
+"""
+SAMPLE_ROUNDS = 3
+
+
+def record(c, uid, text, mood, timestamp, voice_path=None):
+    """Makes a newly inserted memory the user's explore card (same transaction)."""
+    if text is None and voice_path is None:
+        return
+    c.execute("""
+        UPDATE garden_latest SET text = %s, mood = %s, timestamp = %s, voice_path = %s
+        WHERE user_id = %s AND timestamp <= %s
+    """, (text, mood, timestamp, voice_path, uid, timestamp))
+    if c.rowcount == 0:
+        c.execute("""
+            INSERT INTO garden_latest (user_id, text, mood, timestamp, voice_path)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id) DO NOTHING
+        """, (uid, text, mood, timestamp, voice_path))
+
+
+def forget(c, uid):
+    """Removes a user's card and moves the highest-seq card into its slot."""
+    c.execute("DELETE FROM garden_latest WHERE user_id = %s RETURNING seq", (uid,))
+    row = c.fetchone()
+    if row:
+        c.execute("""
+            UPDATE garden_latest SET seq = %s
+            WHERE seq = (SELECT MAX(seq) FROM garden_latest) AND seq > %s
+        """, (row[0], row[0]))
+
+
+def sample(exclude_uid, k=5):
+    """Returns up to k random other users' latest memories.
+
+    Draws random positions between MIN(seq) and MAX(seq) and keeps the
+    rows whose seq matches exactly, so every card is equally likely. Each
+    position is one index probe however large the table is. A round that
+    hits too many holes is retried with twice as many positions.
+    """
+    picked = {}
+    picks = k * 2
+    for _ in range(SAMPLE_ROUNDS):
+        for u, t, m, ts in db.fetchall(_SAMPLE_SQL, {"picks": picks, "exclude": exclude_uid}):
+            picked[u] = {"uid": u, "text": t, "mood": m, "timestamp": ts}
+        if len(picked) >= k:
+            break
+        picks *= 2
+    rows = list(picked.values())
+    random.shuffle(rows)
+    return rows[:k]
@@ -0,0 +1,58 @@
+# journal.py
+from datetime import datetime
+
+import db
+
+PAGE_SIZE = 20
+
+
+def encode_cursor(timestamp, memory_id):
+    return f"{timestamp.isoformat()}_{memory_id}"
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, id) or None for a missing or malformed cursor."""
+    try:
+        ts, memory_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(ts), int(memory_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(uid, cursor=None, limit=PAGE_SIZE, public=False):
+    """Returns (memories, next_cursor) newest first, strictly older than cursor.
+
+    Keyset pagination on (timestamp, id) walks memories_user_ts_idx, so
+    every page costs the same however many memories the user has. Rows
+    without a timestamp (legacy data) can't be placed in that order and
+    are left out.
+    """
+    where = ["m.user_id = %s", "m.timestamp IS NOT NULL"]
+    params = [uid]
+    after = decode_cursor(cursor)
+    if after:
+        where.append("(m.timestamp, m.id) < (%s, %s)")
+        params += list(after)
+    if public:
+        where.append("(m.text IS NOT NULL OR m.voice_path IS NOT NULL)")
+    params.append(limit + 1)
+
+    # Clip size and length come from the blob index, so a page of voice
+    # memories renders without reading any audio.
+    rows = db.fetchall(f"""
+        SELECT m.id, m.text, m.mood, m.timestamp, m.voice_path, m.audio_status, b.size, b.duration
+        FROM memories m
+        LEFT JOIN voice_blobs b ON b.key = m.voice_path
+        WHERE {' AND '.join(where)}
+        ORDER BY m.timestamp DESC, m.id DESC
+        LIMIT %s
+    """, params)
+
+    mems = [{"id": i, "text": t, "mood": m, "timestamp": ts, "voice": vp, "audio_status": st,
+             "size": size, "duration": dur}
+            for i, t, m, ts, vp, st, size, dur in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = mems[-1]
+        next_cursor = encode_cursor(last["timestamp"], last["id"])
+    return mems, next_cursor
@@ -0,0 +1,183 @@
+# leaderboard.py
+import os
+import time
+import threading
+
+import db
+
+TOP_N = 10
+REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+
+
+class PointsIndex:
+    """Fenwick tree of user counts per points value.
+
+    rank() and update() are O(log max_points). Points are small integers,
+    so the tree stays tiny even with millions of users.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def _grow(self, points):
+        size = self.size
+        while size <= points:
+            size *= 2
+        counts = [self.count_at(p) for p in range(self.size)]
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+        for p, n in enumerate(counts):
+            if n:
+                self.add(p, n)
+
+    def add(self, points, n=1):
+        points = max(points, 0)
+        if points >= self.size:
+            self._grow(points)
+        self.total += n
+        i = points + 1
+        while i <= self.size:
+            self.tree[i] += n
+            i += i & -i
+
+    def at_most(self, points):
+        """Number of users with points <= given value."""
+        i = min(max(points, -1), self.size - 1) + 1
+        n = 0
+        while i > 0:
+            n += self.tree[i]
+            i -= i & -i
+        return n
+
+    def count_at(self, points):
+        return self.at_most(points) - self.at_most(points - 1)
+
+    def rank(self, points):
+        """1-based competition rank: one more than the number of users ahead."""
+        return self.total - self.at_most(points) + 1
+
+
+_lock = threading.Lock()
+_index = None
+_loaded_at = 0.0
+_top = None
+_html = None
+_version = 0
+
+
+def _load():
+    global _index, _loaded_at, _top, _html, _version
+    index = PointsIndex()
+    for points, n in db.fetchall("SELECT COALESCE(points, 0), COUNT(*) FROM users GROUP BY 1"):
+        index.add(points, n)
+    with _lock:
+        _index, _loaded_at, _top, _html = index, time.monotonic(), None, None
+        _version += 1
+
+
+def _ensure_fresh():
+    # Other workers change points too; a periodic rebuild bounds the drift.
+    if _index is None or time.monotonic() - _loaded_at > REFRESH_SECONDS:
+        _load()
+
+
+def _invalidate_if_visible(points):
+    global _top, _html, _version
+    if _top is None or len(_top) < TOP_N or points >= _top[-1][1]:
+        _top = _html = None
+        _version += 1
+
+
+def version():
+    """Changes whenever the top of the board may have; for page caches."""
+    _ensure_fresh()
+    return _version
+
+
+def changed(old_points, new_points):
+    """Moves one user between buckets after a committed points change."""
+    if _index is None:
+        return
+    with _lock:
+        _index.add(old_points or 0, -1)
+        _index.add(new_points or 0, 1)
+        _invalidate_if_visible(max(old_points or 0, new_points or 0))
+
+
+def joined(points=0):
+    if _index is None:
+        return
+    with _lock:
+        _index.add(points, 1)
+        _invalidate_if_visible(points)
+
+
+def left(points):
+    if _index is None:
+        return
+    with _lock:
+        _index.add(points or 0, -1)
+        _invalidate_if_visible(points or 0)
+
+
+def top(n=TOP_N):
+    """Returns [(username, points, uid)] for the top n, cached until it changes."""
+    global _top
+    _ensure_fresh()
+    rows = _top
+    if rows is None:
+        rows = db.fetchall("""
+            SELECT username, points, id FROM users
+            ORDER BY points DESC, id DESC LIMIT %s
+        """, (TOP_N,))
+        with _lock:
+            _top = rows
+    return rows[:n]
+
+
+def page_html(render):
+    """Returns the rendered /leaderboard page, re-rendering only after changes."""
+    global _html
+    rows = top()
+    html = _html
+    if html is None:
+        html = render([(u, p) for u, p, _ in rows])
+        with _lock:
+            if _top is rows:
+                _html = html
+    return html
+
+
+def rank(uid, neighbours=2):
+    """Returns (rank, points, above, below) or None for unknown users.
+
+    above/below are up to `neighbours` [(username, points)] entries around
+    the user in (points, id) order, each fetched with one index range scan.
+    """
+    _ensure_fresh()
+    with db.cursor() as c:
+        c.execute("SELECT points FROM users WHERE id = %s", (uid,))
+        row = c.fetchone()
+        if not row:
+            return None
+        points = row[0] or 0
+        above, below = [], []
+        if neighbours > 0:
+            c.execute("""
+                SELECT username, points FROM users
+                WHERE (points, id) > (%s, %s)
+                ORDER BY points, id LIMIT %s
+            """, (points, uid, neighbours))
+            above = list(reversed(c.fetchall()))
+            c.execute("""
+                SELECT username, points FROM users
+                WHERE (points, id) < (%s, %s)
+                ORDER BY points DESC, id DESC LIMIT %s
+            """, (points, uid, neighbours))
+            below = c.fetchall()
+    with _lock:
+        r = _index.rank(points)
+    return r, points, above, below
@@ -1,51 +1,64 @@
 import os, random, telebot, traceback
-import psycopg2
-import pytz
-from pydub import AudioSegment
-from datetime import datetime, timezone, timedelta
-from flask import Flask, request, render_template, abort
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton
-from apscheduler.schedulers.background import BackgroundScheduler
+import db
+import analytics
+import assets
+import conversation
+import deletion
+import dispatch
+import export
+import fanout
+import gardens
+import journal
+import leaderboard
+import metrics
+import moods
+import pagecache
+import profiles
+import reminders
+import search
+import scheduling
+import updates
+import writes
+import storage
+import streaks
+import transcode
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from flask import Flask, Response, request, render_template, abort, jsonify
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 # --- Environment ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "1335511330"))
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-conn = psycopg2.connect(DATABASE_URL)
-conn.autocommit = True
-c = conn.cursor()
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # optional bearer token for /metrics
 
 os.makedirs("static/voices", exist_ok=True)
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# Handlers run on the update queue's workers, not telebot's own thread pool,
+# so per-chat ordering is decided in one place.
+bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
+update_queue = updates.create(lambda update: bot.process_new_updates([update]))
+memory_writer = writes.create()
 app = Flask(__name__, template_folder="templates", static_folder="static")
-scheduler = BackgroundScheduler()
-scheduler.start()
+app.jinja_env.globals.update(voice_url=storage.url, mp3_path=storage.mp3_path, clip_meta=storage.clip_meta)
+router = dispatch.Router()
+metrics.instrument(app)
+metrics.instrument_telegram()
+metrics.gauge("soulgarden_update_queue_depth", "Updates waiting for a worker.", lambda: update_queue.depth())
+metrics.gauge("soulgarden_db_connections_in_use", "Pooled connections checked out.", lambda: db.stats()["in_use"])
+metrics.gauge("soulgarden_memory_writes_pending", "Memories waiting for the write-behind batch.",
+              lambda: memory_writer.stats()["pending"])
 
 # --- Tables ---
-c.execute("""CREATE TABLE IF NOT EXISTS users (
-    id BIGINT PRIMARY KEY,
-    username TEXT,
-    referred_by BIGINT,
-    streak INT DEFAULT 0,
-    last_streak TIMESTAMP,
-    points INT DEFAULT 0,
-    joined_at TIMESTAMP
-)""")
-
-c.execute("""CREATE TABLE IF NOT EXISTS memories (
-    user_id BIGINT,
-    text TEXT,
-    mood INT,
-    timestamp TIMESTAMP,
-    voice_path TEXT
-)""")
-
-pending_voice = {}
-pending_mood = {}
+# Schema lives in migrations.py and is applied by the release step.
+
+# Pending log text / voice note and next step per user, shared by all workers
+conv = conversation.create()
 MAX_FILE_SIZE_MB = 2
+EXPLORE_SAMPLE_SIZE = 5
+GARDEN_PAGE_SIZE = 5
 
 MOOD_LABELS = {
     "🙂 Happy": 5,
@@ -68,37 +81,18 @@ MOOD_MAP = {
 
 
 MOOD_DISPLAY = {v: k for k, v in MOOD_LABELS.items()}
+MOOD_NAMES = {k.split()[-1].lower(): v for k, v in MOOD_LABELS.items()}  # "happy" -> 5
+MOOD_KEYBOARD = assets.keyboard(list(MOOD_LABELS) + [assets.SKIP_BUTTON])
 
 
 # --- Utilities ---
-def menu(uid):
-    kb = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    buttons = [
-        "📝 Log Memory", "🎤 Voice",
-        "📜 Memories", "🏆 Leaderboard",
-        "🌍 Explore", "📊 Dashboard",
-        "🔥 Streak", "🔗 Referral",
-        "ℹ️ Help", "🧘 About",
-        "🔒 Privacy", "🗑️ Delete",
-        "💬 Feedback"
-    ]
-    if uid == ADMIN_ID:
-        buttons.append("🛠️ Admin")
-    kb.add(*[telebot.types.KeyboardButton(b) for b in buttons])
-    return kb
+def file_url(file_path):
+    return (telebot.apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}").format(BOT_TOKEN, file_path)
 
 
-def get_stats(uid):
-    c.execute("SELECT streak, points FROM users WHERE id=%s", (uid,))
-    r = c.fetchone() or (0, 0)
-    return {"streak": r[0], "points": r[1]}
+def menu(uid):
+    return assets.ADMIN_MENU if uid == ADMIN_ID else assets.USER_MENU
 
-def valid_streak(uid):
-    c.execute("SELECT last_streak FROM users WHERE id=%s", (uid,))
-    row = c.fetchone()
-    if not row or not row[0]:
-        return True
-    return datetime.now(timezone.utc) - row[0] >= timedelta(hours=24)
 
 def motivation():
     return random.choice([
@@ -110,61 +104,64 @@ def motivation():
 
 
 # --- Commands ---
-@bot.message_handler(commands=['start'])
+# The only text handler telebot sees: commands and button labels are routed
+# with one dict lookup instead of a chain of filters per message.
+@bot.message_handler(content_types=['text'])
+def handle_text(msg):
+    # A pending next step sees the user's reply before any command or button,
+    # like telebot's register_next_step_handler.
+    if (conv.get(msg.from_user.id) or {}).get("s") in NEXT_STEPS:
+        state = conv.pop(msg.from_user.id) or {}
+        step = state.get("s")
+        if step in NEXT_STEPS:
+            router.run(f"step:{step}", NEXT_STEPS[step], msg)
+            return
+    router.dispatch(msg)
+
+
+@router.route("/start")
 def start(msg):
     uid = msg.from_user.id
     name = msg.from_user.username or f"user{uid}"
     now = datetime.now(timezone.utc)
     ref = None
-    new_user = False
 
     if len(msg.text.split()) > 1:
         try: ref = int(msg.text.split()[1])
         except: pass
 
-    c.execute("SELECT id FROM users WHERE id = %s", (uid,))
-    existing = c.fetchone()
+    if deletion.pending(uid):
+        # The old row is still there until the job finishes; "welcome back"
+        # would hand out an account that is about to disappear.
+        bot.send_message(uid, "🗑️ Your old data is still being deleted. I'll message you when it's done; send /start then.")
+        return
 
-    if not existing:
-        new_user = True
+    with db.cursor() as c:
         c.execute("""
-            INSERT INTO users (id, username, referred_by, joined_at)
-            VALUES (%s, %s, %s, %s)
-        """, (uid, name, ref if ref != uid else None, now))
-        if ref and ref != uid:
-            c.execute("UPDATE users SET points = points + 5 WHERE id = %s", (ref,))
-            bot.send_message(ref, f"🎁 +5 points for inviting @{name}")
-        conn.commit()
+            INSERT INTO users (id, username, referred_by, joined_at, tz)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO NOTHING
+        """, (uid, name, ref if ref != uid else None, now, streaks.DEFAULT_TZ))
+        new_user = c.rowcount == 1
+        ref_points = None
+        if new_user and ref and ref != uid:
+            c.execute("""
+                UPDATE users SET points = points + 5, pages_version = nextval('pages_version_seq')
+                WHERE id = %s RETURNING points
+            """, (ref,))
+            ref_points = c.fetchone()
 
     if new_user:
-        welcome_msg = (
-            "🌱 Welcome to SoulGarden!\n\n"
-            "This is your peaceful space to grow, reflect, and bloom.\n\n"
-            "✨ Get started with:\n"
-            "📝 /log – Write your thoughts\n"
-            "🎤 /voice – Send a voice memory\n"
-            "📜 /memories – View your past logs\n"
-            "🌍 /explore – Visit other gardens\n"
-            "📊 /dashboard – See your stats\n"
-            "🌟 /streak – Keep your daily streak alive\n"
-            "🔗 /referral – Invite friends and earn 🌸\n"
-            "🗑️ /delete – Want to start over? Use this\n\n"
-            "💬 Type a command anytime to interact."
-        )
-    else:
-        welcome_msg = (
-            "🌿 Welcome back to SoulGarden!\n\n"
-            "Keep growing your journal 🌸\n"
-            "Use /log or /voice to share your thoughts,\n"
-            "or explore your /memories and /dashboard.\n\n"
-            "Need a restart? /delete\n"
-            "Want to invite friends? /referral"
-        )
+        leaderboard.joined()
+    if ref_points:
+        leaderboard.changed(ref_points[0] - 5, ref_points[0])
+        bot.send_message(ref, f"🎁 +5 points for inviting @{name}")
 
+    welcome_msg = assets.WELCOME_NEW if new_user else assets.WELCOME_BACK
     bot.send_message(uid, welcome_msg, reply_markup=menu(uid))
 
 
-
+# Menu buttons run the same route as their command (aliased below NEXT_STEPS).
 command_map = {
     "📝 Log Memory": "/log",
     "🎤 Voice": "/voice",
@@ -183,40 +180,7 @@ command_map = {
 }
 
 
-@bot.message_handler(func=lambda m: m.text in command_map)
-def handle_button_commands(msg):
-    actual_command = command_map[msg.text]
-    if actual_command == "/log":
-        log_cmd(msg)
-    elif actual_command == "/voice":
-        voice_cmd(msg)
-    elif actual_command == "/memories":
-        mem_cmd(msg)
-    elif actual_command == "/leaderboard":
-        lead_cmd(msg)
-    elif actual_command == "/explore":
-        explore_cmd(msg)
-    elif actual_command == "/dashboard":
-        dash_cmd(msg)
-    elif actual_command == "/streak":
-        streak_cmd(msg)
-    elif actual_command == "/referral":
-        ref_cmd(msg)
-    elif actual_command == "/help":
-        help_cmd(msg)
-    elif actual_command == "/about":
-        about_cmd(msg)
-    elif actual_command == "/privacy":
-        privacy_cmd(msg)
-    elif actual_command == "/delete":
-        delete_cmd(msg)
-    elif actual_command == "/admin" and msg.from_user.id == ADMIN_ID:
-        admin_cmd(msg)
-    elif actual_command == "/feedback":
-        feedback_cmd(msg)
-
-
-@bot.message_handler(commands=['admin'])
+@router.route("/admin")
 def admin_cmd(msg):
     if msg.from_user.id != ADMIN_ID:
         bot.send_message(msg.chat.id, "🚫 This section is restricted.")
@@ -224,48 +188,68 @@ def admin_cmd(msg):
     bot.send_message(msg.chat.id, f"📊 Admin Panel:\n{WEBHOOK_URL}/admin/analytics?uid={msg.from_user.id}")
 
 
-@bot.message_handler(commands=['poll'])
-def send_crypto_puzzle_poll(msg):
-    if msg.from_user.id != ADMIN_ID:
-        bot.reply_to(msg, "❌ You're not authorized to send this poll.")
-        return
+POLL_QUESTION = "🌿 A strange seed has fallen in SoulGarden...\nWhat would you do if a digital flower grew that *rewarded you for being mindful*?"
+
+POLL_OPTIONS = [
+    "🌸 I’d water it daily 🌞",
+    "🤔 I'd watch and see what happens",
+    "🚫 Flowers aren't my thing",
+    "📚 Wait—what’s a digital flower?"
+]
+
+
+@fanout.job("poll")
+def poll_messages(uid, payload):
+    return [
+        lambda: bot.send_poll(
+            chat_id=uid,
+            question=POLL_QUESTION,
+            options=POLL_OPTIONS,
+            is_anonymous=False,
+            allows_multiple_answers=False
+        ),
+        lambda: bot.send_message(
+            chat_id=uid,
+            text="🌱 Sometimes... rewards bloom for those who reflect. Stay curious. 👁️\nWant to share thoughts? Try /suggest."
+        ),
+    ]
 
-    poll_question = "🌿 A strange seed has fallen in SoulGarden...\nWhat would you do if a digital flower grew that *rewarded you for being mindful*?"
 
-    options = [
-        "🌸 I’d water it daily 🌞",
-        "🤔 I'd watch and see what happens",
-        "🚫 Flowers aren't my thing",
-        "📚 Wait—what’s a digital flower?"
-    ]
+@fanout.job("broadcast")
+def broadcast_messages(uid, announcement):
+    return [lambda: bot.send_message(uid, f"📢 *Update from SoulGarden*\n\n{announcement}", parse_mode="Markdown")]
 
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT id FROM users")
-            user_ids = c.fetchall()
 
-        if not user_ids:
-            bot.reply_to(msg, "📭 No users found to send the poll.")
-            return
+@fanout.job("reminder", audience=reminders.audience)
+def reminder_messages(uid, payload):
+    return [lambda: bot.send_message(uid, "🌞 Hey there! Don't forget to share a memory or check your garden today 🌿")]
+
+
+def start_fanout(msg, kind, payload=""):
+    """Starts a mass send in the background and keeps the admin posted."""
+    status = bot.reply_to(msg, "⏳ Sending...")
+
+    def progress(sent, failed):
+        try:
+            bot.edit_message_text(f"⏳ Sending... {sent} sent, {failed} failed",
+                                  status.chat.id, status.message_id)
+        except Exception:
+            pass
+
+    def done(sent, failed):
+        bot.reply_to(msg, f"✅ Message sent to {sent} users. Failed: {failed}")
 
-        for row in user_ids:
-            uid = row[0]
-            try:
-                bot.send_poll(
-                    chat_id=uid,
-                    question=poll_question,
-                    options=options,
-                    is_anonymous=False,
-                    allows_multiple_answers=False
-                )
-                bot.send_message(
-                    chat_id=uid,
-                    text="🌱 Sometimes... rewards bloom for those who reflect. Stay curious. 👁️\nWant to share thoughts? Try /suggest."
-                )
-                time.sleep(0.5)
-            except Exception as e:
-                print(f"Failed to send poll to {uid}: {e}")
+    fanout.start(kind, payload, progress=progress, done=done)
 
+
+@router.route("/poll")
+def send_crypto_puzzle_poll(msg):
+    if msg.from_user.id != ADMIN_ID:
+        bot.reply_to(msg, "❌ You're not authorized to send this poll.")
+        return
+
+    try:
+        start_fanout(msg, "poll")
     except Exception as e:
         print(f"[Poll Error] {e}")
         bot.reply_to(msg, "❌ Something went wrong while sending the poll.")
@@ -273,7 +257,7 @@ def send_crypto_puzzle_poll(msg):
 
 
 
-@bot.message_handler(commands=['suggest'])
+@router.route("/suggest")
 def handle_suggestion(msg):
     parts = msg.text.split(maxsplit=1)
     if len(parts) < 2 or not parts[1].strip():
@@ -286,7 +270,7 @@ def handle_suggestion(msg):
 
 
 
-@bot.message_handler(commands=['broadcast'])
+@router.route("/broadcast")
 def broadcast_all_users(msg):
     if msg.from_user.id != ADMIN_ID:
         bot.reply_to(msg, "❌ Only the admin can use this.")
@@ -299,105 +283,69 @@ def broadcast_all_users(msg):
 
     announcement = parts[1].strip()
 
-    # Fetch all user IDs
     try:
-        c.execute("SELECT id FROM users")
-        users = c.fetchall()
-
-        sent = 0
-        failed = 0
-
-        for row in users:
-            uid = row[0]
-            try:
-                bot.send_message(uid, f"📢 *Update from SoulGarden*\n\n{announcement}", parse_mode="Markdown")
-                sent += 1
-            except Exception as e:
-                print(f"❌ Couldn’t message {uid}: {e}")
-                failed += 1
-
-        bot.reply_to(msg, f"✅ Message sent to {sent} users. Failed: {failed}")
+        start_fanout(msg, "broadcast", announcement)
     except Exception as e:
         bot.reply_to(msg, f"❌ Error: {e}")
         
 
-@bot.message_handler(commands=['feedback'])
+@router.route("/feedback")
 def feedback_cmd(msg):
-    kb = telebot.types.InlineKeyboardMarkup()
-    twitter_button = telebot.types.InlineKeyboardButton("🐦 Give Feedback on Twitter", url="https://twitter.com/s0ulGarden_Bot")
-    kb.add(twitter_button)
-    bot.send_message(msg.chat.id, "We’d love to hear your thoughts! 💬", reply_markup=kb)
+    bot.send_message(msg.chat.id, "We’d love to hear your thoughts! 💬", reply_markup=assets.FEEDBACK_KEYBOARD)
 
-@bot.message_handler(commands=['log'])
+@router.route("/log")
 def log_cmd(msg):
+    conv.set(msg.from_user.id, {"s": "log"})
     bot.send_message(msg.chat.id, "📝 What's on your mind?")
-    bot.register_next_step_handler(msg, after_log)
 
-@bot.message_handler(commands=['voice'])
+@router.route("/voice")
 def voice_cmd(msg):
     uid = msg.from_user.id
-    pending_voice[uid] = True
+    conv.set(uid, {"s": "voice"})
     bot.send_message(uid, "🎤 Send your voice note.")
 
-@bot.message_handler(commands=['memories'])
+@router.route("/memories")
 def mem_cmd(msg): show_memories(msg.from_user.id)
 
-@bot.message_handler(commands=['leaderboard'])
+@router.route("/leaderboard")
 def lead_cmd(msg): send_leaderboard(msg.from_user.id)
 
-@bot.message_handler(commands=['explore'])
+@router.route("/rank")
+def rank_cmd(msg): send_rank(msg.from_user.id)
+
+@router.route("/explore")
 def explore_cmd(msg):
     uid = msg.from_user.id
     url = f"https://soulgarden.up.railway.app/explore?uid={uid}"
     bot.send_message(uid, f"🌍 Explore soul gardens here:\n🔗 {url}")
 
-@bot.message_handler(commands=['dashboard'])
+@router.route("/dashboard")
 def dash_cmd(msg): bot.send_message(msg.chat.id, f"📊 Dashboard:\n{WEBHOOK_URL}/dashboard/{msg.from_user.id}")
 
-@bot.message_handler(commands=['referral'])
+@router.route("/referral")
 def ref_cmd(msg):
     uid = msg.from_user.id
-    bot.send_message(uid, f"🔗 Invite:\nhttps://t.me/{bot.get_me().username}?start={uid}")
+    bot.send_message(uid, f"🔗 Invite:\nhttps://t.me/{assets.identity.username(bot)}?start={uid}")
 
-@bot.message_handler(commands=['streak'])
+@router.route("/streak")
 def streak_cmd(msg):
     uid = msg.from_user.id
 
     try:
-        # Get last streak date
-        c.execute("SELECT streak, last_streak, points FROM users WHERE id=%s", (uid,))
-        row = c.fetchone()
+        with db.cursor() as c:
+            row = streaks.claim(c, uid)
+            if row:
+                analytics.streak_claimed(c, uid)
 
         if not row:
-            bot.send_message(uid, "⚠️ You're not registered yet. Please send /start.", reply_markup=menu(uid))
+            if profiles.get(uid) is None:
+                bot.send_message(uid, "⚠️ You're not registered yet. Please send /start.", reply_markup=menu(uid))
+            else:
+                bot.send_message(uid, "📆 You've already claimed today's streak!\nCome back tomorrow 🌞", reply_markup=menu(uid))
             return
 
-        streak, last_streak, points = row
-        now = datetime.now(timezone.utc).date()
-
-        if last_streak:
-            last = last_streak.date()
-            days_diff = (now - last).days
-
-            if days_diff == 0:
-                # Already claimed today
-                bot.send_message(uid, "📆 You've already claimed today's streak!\nCome back tomorrow 🌞", reply_markup=menu(uid))
-                return
-            elif days_diff > 1:
-                # Missed streak
-                streak = 0
-                c.execute("UPDATE users SET streak = 0 WHERE id = %s", (uid,))
-                conn.commit()
-
-        # Eligible for new streak
-        new_streak = streak + 1
-        new_points = points + 1
-        c.execute("""
-            UPDATE users
-            SET streak = %s, last_streak = %s, points = %s
-            WHERE id = %s
-        """, (new_streak, datetime.now(timezone.utc), new_points, uid))
-        conn.commit()
+        new_streak, new_points, claimed_at = row
+        leaderboard.changed(new_points - streaks.awarded(new_streak), new_points)
 
         bot.send_message(uid, f"✅ +1 Streak!\n🔥 Streak: {new_streak} days\n🏆 Points: {new_points}\n{motivation()}", reply_markup=menu(uid))
 
@@ -407,98 +355,151 @@ def streak_cmd(msg):
 
 
 
-@bot.message_handler(commands=['help'])
-def help_cmd(msg):
-    help_text = (
-        "🌿 *Welcome to SoulGarden Help!*\n\n"
-        "Here are the commands you can use:\n\n"
-        "• /start – Begin your SoulGarden journey\n"
-        "• /log or /voice – Share your mood or voice journal\n"
-        "• /explore – Discover anonymous gardens by others\n"
-        "• /dashboard – View your Dashboard\n"
-        "• /suggest <message> – 💡 Share feedback or ideas\n"
-        "• /help – Show this help message\n\n"
-        "We’re always growing 🌱 and your thoughts help us bloom! 🌸"
-    )
+@router.route("/export")
+def export_cmd(msg):
+    uid = msg.from_user.id
+    base = f"{WEBHOOK_URL}/export/{uid}?{urlencode(export.link_params(uid))}"
+    bot.send_message(uid, "📦 Your SoulGarden export (links work for 1 hour):\n\n"
+                          f"• JSON lines: {base}&format=ndjson\n"
+                          f"• CSV: {base}&format=csv\n"
+                          f"• ZIP with voice notes: {base}&format=zip",
+                     disable_web_page_preview=True)
+
+
+@router.route("/search")
+def search_cmd(msg):
+    uid = msg.from_user.id
+    parts = msg.text.split(maxsplit=1)
+    args = parts[1] if len(parts) > 1 else ""
+    q = search.parse(args, MOOD_NAMES)
+    if not q["terms"]:
+        bot.reply_to(msg, "🔎 Usage: /search beach walk\n"
+                          "Filters: mood:happy since:2024-01-01 until:2024-12-31 page:2")
+        return
+    mems, more = search.run(uid, **q)
+    if not mems:
+        bot.send_message(uid, f"🔍 Nothing found for “{q['terms']}”.")
+        return
+    lines = [f"{m['timestamp']:%Y-%m-%d} {MOOD_DISPLAY.get(m['mood'], '❓ Skipped')}\n{m['headline'] or m['text']}"
+             for m in mems]
+    if more:
+        lines.append(f"➡️ More: /search {search.with_page(args, q['page'] + 1)}")
+    bot.send_message(uid, f"🔍 Results for “{q['terms']}”:\n\n" + "\n\n".join(lines))
 
-    bot.send_message(msg.chat.id, help_text, parse_mode="Markdown")
+
+@router.route("/moods")
+def moods_cmd(msg):
+    uid = msg.from_user.id
+    st = moods.summary(uid)
+    if not st:
+        bot.send_message(uid, "📈 No moods yet. Log a memory with a mood and check back!", reply_markup=menu(uid))
+        return
+    lines = [f"📈 Your mood (0 anxious – 5 happy), {st['entries']} entries over {st['days']} days"]
+    if st["week"] is not None:
+        change = f" ({st['week'] - st['prev_week']:+.1f} on the week before)" if st["prev_week"] is not None else ""
+        lines.append(f"• Last 7 days: {st['week']:.1f}{change}")
+    if st["month"] is not None:
+        lines.append(f"• Last 30 days: {st['month']:.1f}")
+    lines.append(f"• Brightest: {st['best_weekday']}s, around {st['best_hour']:02d}:00")
+    if st["swing"] is not None:
+        lines.append(f"• Day-to-day swing: ±{st['swing']:.1f}")
+    first, later = st["streak"][0], st["streak"][6]
+    if first is not None and later is not None:
+        lines.append(f"• On a streak: {first:.1f} on day 1, {later:.1f} by day 7")
+    lines.append(f"\n📊 Chart: {WEBHOOK_URL}/dashboard/{uid}")
+    bot.send_message(uid, "\n".join(lines), reply_markup=menu(uid), disable_web_page_preview=True)
+
+
+@router.route("/timezone")
+def tz_cmd(msg):
+    uid = msg.from_user.id
+    parts = msg.text.split(maxsplit=1)
+    tz = parts[1].strip() if len(parts) > 1 else ""
+    if not streaks.valid_tz(tz):
+        bot.reply_to(msg, "🕰️ Usage: /timezone Asia/Kolkata\nYour streak day starts at midnight there.")
+        return
+    # Mood stats on the dashboard are bucketed by local day.
+    db.execute("UPDATE users SET tz = %s, pages_version = nextval('pages_version_seq') WHERE id = %s", (tz, uid))
+    bot.reply_to(msg, f"✅ Timezone set to {tz}")
 
 
-@bot.message_handler(commands=['about'])
-def about_cmd(msg): bot.send_message(msg.chat.id, "🧘 SoulGarden is a peaceful journaling space.")
+@router.route("/help")
+def help_cmd(msg):
+    bot.send_message(msg.chat.id, assets.HELP_TEXT, parse_mode="Markdown")
 
-@bot.message_handler(commands=['privacy'])
+
+@router.route("/about")
+def about_cmd(msg): bot.send_message(msg.chat.id, assets.ABOUT_TEXT)
+
+@router.route("/privacy")
 def privacy_cmd(msg): bot.send_message(msg.chat.id, f"🔒 Privacy:\n{WEBHOOK_URL}/privacy")
 
-@bot.message_handler(commands=['delete'])
+@router.route("/delete")
 def delete_cmd(msg):
     uid = msg.from_user.id
+    conv.set(uid, {"s": "delete"})
     bot.send_message(uid, "⚠️ Type 'DELETE' to confirm.")
-    bot.register_next_step_handler(msg, confirm_delete)
 
 def confirm_delete(msg):
     uid = msg.from_user.id
     if msg.text.strip().upper() == "DELETE":
+        # Ack first: a small account can finish before this message would go out.
+        bot.send_message(uid, "🗑️ Deleting your data... I'll message you when it's done.")
         delete_all(uid)
-        bot.send_message(uid, "🗑️ All data deleted. Send /start to begin again.")
     else:
         bot.send_message(uid, "❎ Cancelled.")
 
 # --- Logging ---
 def after_log(msg):
     uid, txt = msg.from_user.id, msg.text.strip()
-    pending_mood[uid] = txt
+    conv.set(uid, {"s": "mood", "t": txt})
+
+    bot.send_message(uid, "🧠 How are you feeling?", reply_markup=MOOD_KEYBOARD)
 
-    kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    mood_buttons = list(MOOD_LABELS.keys()) + ["⏭️ Skip"]
-    kb.add(*[KeyboardButton(b) for b in mood_buttons])
-    bot.send_message(uid, "🧠 How are you feeling?", reply_markup=kb)
+
+NEXT_STEPS = {"log": after_log, "delete": confirm_delete}
+router.alias(command_map)
 
 
 @bot.message_handler(content_types=['voice'])
+@metrics.timed("handler", "voice")
 def handle_voice(msg):
     uid = msg.from_user.id
-    if pending_voice.pop(uid, None):
-        f = bot.get_file(msg.voice.file_id)
-        data = bot.download_file(f.file_path)
-
-        # Check size
-        file_size_mb = len(data) / (1024 * 1024)
+    if (conv.get(uid) or {}).get("s") == "voice":
+        conv.pop(uid)
+        # Check size before downloading anything
+        file_size_mb = (msg.voice.file_size or 0) / (1024 * 1024)
         if file_size_mb > MAX_FILE_SIZE_MB:
             bot.send_message(uid, f"⚠️ Voice note too large ({file_size_mb:.2f} MB). Max allowed: {MAX_FILE_SIZE_MB} MB.")
             return
 
-        # Save OGG
-        filename_base = f"{uid}_{msg.message_id}"
-        ogg_path_rel = f"voices/{filename_base}.ogg"
-        ogg_path_full = os.path.join("static", ogg_path_rel)
-
-        with open(ogg_path_full, "wb") as fp:
-            fp.write(data)
+        # Stream OGG into content-addressed storage
+        f = bot.get_file(msg.voice.file_id)
+        try:
+            ogg_path_rel, created = storage.save_voice(file_url(f.file_path), MAX_FILE_SIZE_MB * 1024 * 1024,
+                                                       msg.voice.duration)
+        except storage.TooLarge:
+            bot.send_message(uid, f"⚠️ Voice note too large. Max allowed: {MAX_FILE_SIZE_MB} MB.")
+            return
 
-        # Convert to MP3
+        # MP3 fallback is produced off the request path
         try:
-            audio = AudioSegment.from_file(ogg_path_full)
-            mp3_path_full = os.path.join("static", f"voices/{filename_base}.mp3")
-            audio.export(mp3_path_full, format="mp3")
+            if created or not storage.backend.exists(storage.mp3_path(ogg_path_rel)):
+                transcode.submit(ogg_path_rel)
         except Exception as e:
             print("[Audio Conversion Error]", e)
-            bot.send_message(uid, "⚠️ Couldn't convert voice note to mp3, but .ogg was saved.")
 
         # Save path for next step
-        pending_mood[uid] = "(voice)"
-        pending_voice[uid] = ogg_path_rel  # Only store the relative .ogg path
-        kb = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        mood_buttons = list(MOOD_LABELS.keys()) + ["⏭️ Skip"]
-        kb.add(*[KeyboardButton(b) for b in mood_buttons])
-        bot.send_message(uid, "🧠 How did this voice memory feel?", reply_markup=kb)
-
-@bot.message_handler(func=lambda m: m.text in MOOD_LABELS or m.text == "⏭️ Skip")
+        conv.set(uid, {"s": "mood", "t": "(voice)", "v": ogg_path_rel})  # Only store the relative .ogg path
+        bot.send_message(uid, "🧠 How did this voice memory feel?", reply_markup=MOOD_KEYBOARD)
+
+@router.route(*MOOD_LABELS, assets.SKIP_BUTTON, name="mood")
 def handle_mood_choice(msg):
     uid = msg.from_user.id
 
     # Get and validate memory text
-    text = pending_mood.pop(uid, None)
+    state = conv.pop(uid) or {}
+    text = state.get("t") if state.get("s") == "mood" else None
     if not text:
         bot.send_message(uid, "⚠️ Something went wrong. Please try again.", reply_markup=menu(uid))
         return
@@ -508,36 +509,50 @@ def handle_mood_choice(msg):
         return
 
     # Get and validate voice path
-    voice_path = pending_voice.pop(uid, None)
+    voice_path = state.get("v")
     if not isinstance(voice_path, str) or not voice_path.startswith("voices/"):
         voice_path = None
 
     # Determine mood value
-    mood = MOOD_LABELS.get(msg.text) if msg.text != "⏭️ Skip" else None
+    mood = MOOD_LABELS.get(msg.text) if msg.text != assets.SKIP_BUTTON else None
 
     # Save to DB
-    c.execute("INSERT INTO memories VALUES (%s, %s, %s, %s, %s)",
-              (uid, text, mood, datetime.now(timezone.utc), voice_path))
-    c.execute("UPDATE users SET points = points + 1 WHERE id = %s", (uid,))
-    s = get_stats(uid)
+    audio_status = transcode.status(voice_path) if voice_path else None
+    now = datetime.now(timezone.utc)
+    new_points = memory_writer.write(uid, text, mood, now, voice_path, audio_status)
+    points = new_points or 0
+    if new_points is not None:
+        leaderboard.changed(points - 1, points)
 
     # Send confirmation
-    bot.send_message(uid, f"💾 Saved!\nPoints: {s['points']}\n{motivation()}", reply_markup=menu(uid))
+    bot.send_message(uid, f"💾 Saved!\nPoints: {points}\n{motivation()}", reply_markup=menu(uid))
 
     
 
 
 # --- Data ---
 def delete_all(uid):
-    c.execute("SELECT voice_path FROM memories WHERE user_id = %s", (uid,))
-    for (vp,) in c.fetchall():
-        if vp and os.path.exists(vp): os.remove(vp)
-    c.execute("DELETE FROM memories WHERE user_id = %s", (uid,))
-    c.execute("DELETE FROM users WHERE id = %s", (uid,))
+    """Starts the background deletion; the user hears back when it's done."""
+    deletion.start(uid, done=deletion_done)
+
+
+def deletion_done(uid, deleted, points):
+    if points is not None:
+        leaderboard.left(points)
+    try:
+        bot.send_message(uid, f"🗑️ All data deleted ({deleted} memories). Send /start to begin again.")
+    except Exception as e:
+        print("[Deletion Notify Error]", e)
+
+
+try:
+    deletion.resume_stale(done=deletion_done)
+except Exception as e:
+    print("[Deletion Resume Error]", e)
+
 
 def show_memories(uid):
-    c.execute("SELECT text, mood, timestamp FROM memories WHERE user_id=%s ORDER BY timestamp DESC LIMIT 5", (uid,))
-    rows = c.fetchall()
+    rows = db.fetchall("SELECT text, mood, timestamp FROM memories WHERE user_id=%s ORDER BY timestamp DESC LIMIT 5", (uid,))
     if not rows:
         bot.send_message(uid, "📭 No memories yet.")
         return
@@ -545,54 +560,48 @@ def show_memories(uid):
     bot.send_message(uid, f"🗂️ Your Memories:\n{msg}")
 
 def send_leaderboard(uid):
-    c.execute("SELECT username, points FROM users ORDER BY points DESC LIMIT 10")
-    rows = c.fetchall()
-    board = "\n".join([f"{i+1}. @{u or 'anon'} – {p} pts" for i, (u, p) in enumerate(rows)])
-    bot.send_message(uid, f"🏆 Leaderboard:\n{board}\nOr view at: {WEBHOOK_URL}/leaderboard")
+    rows = leaderboard.top()
+    board = "\n".join([f"{i+1}. @{u or 'anon'} – {p} pts" for i, (u, p, _) in enumerate(rows)])
+    me = leaderboard.rank(uid, neighbours=0)
+    mine = f"\nYou: #{me[0]} with {me[1]} pts" if me else ""
+    bot.send_message(uid, f"🏆 Leaderboard:\n{board}{mine}\nOr view at: {WEBHOOK_URL}/leaderboard")
+
+
+def send_rank(uid):
+    me = leaderboard.rank(uid)
+    if not me:
+        bot.send_message(uid, "⚠️ You're not registered yet. Please send /start.")
+        return
+    r, points, above, below = me
+    lines = [f"{r - len(above) + i}. @{u or 'anon'} – {p} pts" for i, (u, p) in enumerate(above)]
+    lines.append(f"👉 {r}. You – {points} pts")
+    lines += [f"{r + 1 + i}. @{u or 'anon'} – {p} pts" for i, (u, p) in enumerate(below)]
+    bot.send_message(uid, "📈 Your rank:\n" + "\n".join(lines))
 
 
 def send_daily_reminder():
+    """Reminds the users whose local reminder hour this slice falls in."""
     try:
-        c.execute("SELECT id FROM users")
-        all_users = c.fetchall()
-
-        for row in all_users:
-            user_id = row[0]
-            try:
-                bot.send_message(user_id, "🌞 Hey there! Don't forget to share a memory or check your garden today 🌿")
-            except Exception as e:
-                print(f"[Reminder Error] Couldn't message {user_id}: {e}")
+        result = fanout.run(fanout.create("reminder", reminders.payload()))
+        if result:
+            print(f"[Reminder] sent={result[0]} failed={result[1]}")
+        fanout.prune("reminder", reminders.KEEP_FINISHED)
     except Exception as e:
         print(f"[Reminder DB Error]: {e}")
 
 def send_explore(uid):
     try:
-        c.execute("""
-            SELECT DISTINCT ON (user_id) user_id 
-            FROM memories 
-            WHERE user_id != %s 
-            ORDER BY user_id, RANDOM()
-        """, (uid,))
-        users = c.fetchall()
-
-        if not users:
+        picked = gardens.sample(uid, EXPLORE_SAMPLE_SIZE)
+
+        if not picked:
             bot.send_message(uid, "🌱 No other gardens to explore yet.")
             return
 
-        for (other_uid,) in users:
-            c.execute("""
-                SELECT text, mood, timestamp 
-                FROM memories 
-                WHERE user_id = %s 
-                ORDER BY timestamp DESC LIMIT 1
-            """, (other_uid,))
-            row = c.fetchone()
-            if row:
-                text, mood, ts = row
-                text = text or "(No memory text)"
-                mood = mood if mood is not None else "Skipped"
-                preview = f"🌿 {ts.strftime('%Y-%m-%d')} • Mood: {mood}\n{text}"
-                bot.send_message(uid, preview)
+        for g in picked:
+            text = g["text"] or "(No memory text)"
+            mood = g["mood"] if g["mood"] is not None else "Skipped"
+            preview = f"🌿 {g['timestamp'].strftime('%Y-%m-%d')} • Mood: {mood}\n{text}"
+            bot.send_message(uid, preview)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -605,7 +614,9 @@ def send_explore(uid):
 def webhook():
     try:
         update = telebot.types.Update.de_json(request.data.decode("utf-8"))
-        bot.process_new_updates([update])
+        if not update_queue.put(update):
+            # Queue is full: let Telegram redeliver later instead of piling up.
+            return "Busy", 503
         return "OK"
     except Exception as e:
         print("Webhook error:", e)
@@ -615,74 +626,94 @@ def webhook():
 def home(): return "🌿 SoulGarden Bot Running"
 
 @app.route("/dashboard/<int:uid>")
+@pagecache.cached(ttl=300, version=pagecache.version, public=False)
 def dashboard(uid):
-    c.execute("SELECT username, streak, points FROM users WHERE id=%s", (uid,))
-    u = c.fetchone()
+    u = profiles.get(uid)
     if not u: return "Not found", 404
-    c.execute("SELECT COUNT(*) FROM users WHERE referred_by=%s", (uid,))
-    refs = c.fetchone()[0]
-    c.execute("SELECT text, mood, timestamp, voice_path FROM memories WHERE user_id=%s ORDER BY timestamp DESC", (uid,))
-    mems = [{"text": t, "mood": m, "timestamp": ts, "voice": vp} for t, m, ts, vp in c.fetchall()]
-    return render_template("dashboard.html", name=u[0] or "anon", streak=u[1], points=u[2],
-                           referrals=refs, memories=mems, mood_display=MOOD_DISPLAY)
+    q = {
+        "terms": request.args.get("q", "").strip()[:200],
+        "mood": request.args.get("mood", type=int),
+        "since": search.parse_date(request.args.get("since")),
+        "until": search.parse_date(request.args.get("until")),
+        "page": max(request.args.get("page", 1, type=int), 1),
+    }
+    searching = q["terms"] or q["mood"] is not None or q["since"] or q["until"]
+    next_cursor = more_url = None
+    if searching:
+        mems, more = search.run(uid, **q)
+        if more:
+            more_url = "?" + urlencode({**request.args.to_dict(), "page": q["page"] + 1})
+    else:
+        mems, next_cursor = journal.page(uid, request.args.get("cursor"))
+    return render_template("dashboard.html", uid=uid, name=u["username"] or "anon", streak=u["streak"],
+                           points=u["points"], referrals=u["referrals"], memories=mems, next_cursor=next_cursor,
+                           mood_display=MOOD_DISPLAY, search=q if searching else None, more_url=more_url,
+                           moods=sorted(MOOD_DISPLAY.items(), key=lambda kv: -(kv[0] or 0)),
+                           mood_stats=moods.summary(uid), weekdays=moods.WEEKDAYS)
+
+
+@app.route("/api/memories/<int:uid>")
+def memories_api(uid):
+    public = request.args.get("public") == "1"
+    limit = GARDEN_PAGE_SIZE if public else journal.PAGE_SIZE
+    mems, next_cursor = journal.page(uid, request.args.get("cursor"), limit, public)
+    return jsonify(next=next_cursor, memories=[{
+        "text": (m["text"] or "(No text)") if public else m["text"],
+        "mood": m["mood"],
+        "mood_label": MOOD_DISPLAY.get(m["mood"], "❓ Skipped"),
+        "date": m["timestamp"].strftime("%Y-%m-%d"),
+        "voice": storage.url(m["voice"]) if m["voice"] else None,
+        "mp3": storage.url(storage.mp3_path(m["voice"]))
+               if m["voice"] and m["audio_status"] not in ("failed", "skipped") else None,
+        "clip": storage.clip_meta(m["duration"], m["size"]) if m["voice"] else None,
+    } for m in mems])
+
+
+@app.route("/export/<int:uid>")
+def export_data(uid):
+    if not export.verify(uid, request.args.get("expires", type=int), request.args.get("sig")):
+        return "This export link is invalid or has expired. Send /export for a new one.", 403
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return "Unknown format", 400
+    chunks, mimetype, filename = export.stream(uid, fmt)
+    return Response(chunks, mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "private, no-store",
+    })
+
+
+@app.route("/media/<path:key>")
+def media(key):
+    if not storage.valid_key(key):
+        abort(404)
+    return storage.backend.response(key)
 
 
 @app.route("/privacy")
+@pagecache.cached(ttl=86400)
 def privacy():
     return render_template("privacy.html")
 
 @app.route("/leaderboard")
+@pagecache.cached(ttl=60, version=lambda: leaderboard.version())
 def leaderboard_page():
-    c.execute("SELECT username, points FROM users ORDER BY points DESC LIMIT 10")
-    users = c.fetchall()
-    return render_template("leaderboard.html", users=users)
+    return leaderboard.page_html(lambda users: render_template("leaderboard.html", users=users))
 
 @app.route("/explore")
+@pagecache.cached(ttl=30)
 def explore():
     try:
-        uid = request.args.get("uid")
+        uid = request.args.get("uid", type=int)
         if not uid:
             return "Missing user ID", 400
 
-        # Get all distinct other user IDs who have memories
-        c.execute("""
-            SELECT DISTINCT user_id 
-            FROM memories 
-            WHERE user_id != %s
-        """, (uid,))
-        all_others = [row[0] for row in c.fetchall()]
-
-        if not all_others:
-            return render_template("explore.html", gardens=[], my_uid=uid)
+        picked = gardens.sample(uid, EXPLORE_SAMPLE_SIZE)
+        for g in picked:
+            g["text"] = g["text"] or "(No text)"
+            g["mood"] = MOOD_MAP.get(g["mood"], "❓ Skipped")
 
-        # Randomly select 5
-        random.shuffle(all_others)
-        selected_uids = all_others[:5]
-
-        gardens = []
-        for other_uid in selected_uids:
-            c.execute("""
-                SELECT text, mood, timestamp 
-                FROM memories 
-                WHERE user_id = %s 
-                AND (text IS NOT NULL OR voice_path IS NOT NULL)
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (other_uid,))
-            row = c.fetchone()
-            if row:
-                text = row[0] or "(No text)"
-                mood = row[1]
-                timestamp = row[2]
-                mood_display = MOOD_MAP.get(mood, "❓ Skipped")
-                gardens.append({
-                    "uid": other_uid,
-                    "text": text,
-                    "mood": mood_display,
-                    "timestamp": timestamp
-                })
-
-        return render_template("explore.html", gardens=gardens, my_uid=uid)
+        return render_template("explore.html", gardens=picked, my_uid=uid)
 
     except Exception as e:
         print("[Explore Error]", str(e))
@@ -691,28 +722,15 @@ def explore():
     
 
 @app.route("/visit_garden/<int:uid>")
+@pagecache.cached(ttl=300, version=pagecache.version)
 def visit_garden(uid):
     try:
-        c.execute("""
-            SELECT text, mood, timestamp, voice_path 
-            FROM memories 
-            WHERE user_id=%s 
-            AND (text IS NOT NULL OR voice_path IS NOT NULL)
-            ORDER BY timestamp DESC 
-            LIMIT 5
-        """, (uid,))
-        rows = c.fetchall()
-
-        memories = []
-        for text, mood, timestamp, voice_path in rows:
-            memories.append({
-                "text": text or "(No text)",
-                "mood": MOOD_DISPLAY.get(mood, "❓ Skipped"),
-                "timestamp": timestamp,
-                "voice": voice_path  # path to audio
-            })
-
-        return render_template("visit_garden.html", memories=memories)
+        memories, next_cursor = journal.page(uid, request.args.get("cursor"), GARDEN_PAGE_SIZE, public=True)
+        for mem in memories:
+            mem["text"] = mem["text"] or "(No text)"
+            mem["mood"] = MOOD_DISPLAY.get(mem["mood"], "❓ Skipped")
+
+        return render_template("visit_garden.html", uid=uid, memories=memories, next_cursor=next_cursor)
 
     except Exception as e:
         print("[Visit Garden Error]", e)
@@ -720,23 +738,47 @@ def visit_garden(uid):
 
 
 @app.route("/admin/analytics")
-def analytics():
+def admin_analytics():
     uid = request.args.get("uid", type=int)
     if uid != ADMIN_ID:
         return "Unauthorized", 403
 
-    c.execute("SELECT COUNT(*) FROM users")
-    total = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM users WHERE joined_at >= now() - interval '1 day'")
-    today = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM memories")
-    memories = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM memories WHERE timestamp >= now() - interval '1 day'")
-    new_mems = c.fetchone()[0]
+    days = min(request.args.get("days", 30, type=int), 365)
+    return render_template("admin_analytics.html", series=analytics.series(days),
+                           days=days, **analytics.summary())
+
+
+@app.route("/admin/queue")
+def queue_stats():
+    uid = request.args.get("uid", type=int)
+    if uid != ADMIN_ID:
+        return "Unauthorized", 403
+    return jsonify(queue=update_queue.stats(), db=db.stats(),
+                   routes=router.stats(), writes=memory_writer.stats(),
+                   pages=pagecache.stats(), scheduler=scheduling.stats())
 
-    return render_template("admin_analytics.html", total_users=total, new_today=today,
-                           total_memories=memories, new_memories=new_mems)
 
+@app.route("/metrics")
+def metrics_page():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# --- Scheduled Jobs ---
+# Registered in every worker; only the elected leader runs them.
+scheduling.add("sweep_orphans", storage.sweep_orphans, IntervalTrigger(hours=6))
+scheduling.add("analytics_rollup", analytics.rollup, CronTrigger(minute=5, timezone="UTC"))
+scheduling.add("conv_purge", lambda: conv.purge(), IntervalTrigger(minutes=15))
+scheduling.add("daily_reminder", send_daily_reminder,
+               CronTrigger(minute=f"*/{reminders.SLICE_MINUTES}", timezone="UTC"))
+scheduling.start()
+
+# Only once every @fanout.job is registered, so a resumed job finds its kind.
+try:
+    fanout.resume_stale()
+except Exception as e:
+    print("[Fanout Resume Error]", e)
 
 
 # --- Start Bot ---
@@ -745,10 +787,3 @@ if __name__ == "__main__":
     bot.remove_webhook()
     bot.set_webhook(url=f"{WEBHOOK_URL}/{BOT_TOKEN}")
     app.run(host="0.0.0.0", port=8080)
-
-
-
-# --- Daily Reminder ---
-scheduler = BackgroundScheduler(timezone=pytz.timezone("Asia/Kolkata"))
-scheduler.add_job(send_daily_reminder, trigger="cron", hour=20, minute=0)  # 8 PM IST
-scheduler.start()
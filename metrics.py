@@ -0,0 +1,264 @@
+# metrics.py
+"""Latency histograms, error counts and slow-request traces.
+
+Four things are timed: bot handlers (dispatch.Router and @timed), Flask
+views (instrument), SQL statements (TimedCursor, the pool's cursor class)
+and Telegram Bot API calls (instrument_telegram), plus scheduled jobs. Each
+(kind, name) pair gets a histogram, an error count and an in-flight gauge,
+served in Prometheus text format by render().
+
+A handler, view or job is a trace root: the SQL and Telegram calls made on
+its thread are collected as spans, and when the root takes longer than
+SLOW_TRACE_MS a TRACE_SAMPLE fraction of them is written to TRACE_LOG as
+one JSON line (or printed when TRACE_LOG is unset). Span names are
+statement shapes and API method names, never parameters.
+"""
+import os
+import re
+import json
+import time
+import random
+import threading
+import functools
+from datetime import datetime, timezone
+
+import psycopg2.extensions
+
+SLOW_TRACE_MS = float(os.getenv("SLOW_TRACE_MS", "1000"))
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "1.0"))
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+MAX_SPANS = 200
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+KINDS = {
+    # kind: (metric prefix, label, description)
+    "handler": ("soulgarden_handler", "handler", "Bot update handlers"),
+    "route": ("soulgarden_http_request", "endpoint", "Flask views"),
+    "sql": ("soulgarden_sql", "statement", "SQL statements, by verb and table"),
+    "telegram": ("soulgarden_telegram_api", "method", "Outbound Telegram Bot API calls"),
+    "job": ("soulgarden_job", "job", "Scheduled jobs"),
+}
+ROOTS = ("handler", "route", "job")
+
+_series = {}
+_gauges = []
+_lock = threading.Lock()
+_trace_lock = threading.Lock()
+_local = threading.local()
+traces_written = 0
+
+
+class Series:
+    __slots__ = ("buckets", "sum", "count", "errors", "in_flight")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self.in_flight = 0
+
+
+def _get(kind, name):
+    s = _series.get((kind, name))
+    if s is None:
+        with _lock:
+            s = _series.setdefault((kind, name), Series())
+    return s
+
+
+def begin(kind, name):
+    """Starts timing one call; pass the result to end()."""
+    s = _get(kind, name)
+    with _lock:
+        s.in_flight += 1
+    trace = getattr(_local, "trace", None)
+    root = trace is None and kind in ROOTS
+    if root:
+        _local.trace = trace = []
+    return kind, name, s, time.perf_counter(), trace, root
+
+
+def end(span, ok=True):
+    kind, name, s, started, trace, root = span
+    elapsed = time.perf_counter() - started
+    with _lock:
+        s.in_flight -= 1
+        s.count += 1
+        s.sum += elapsed
+        s.errors += not ok
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                s.buckets[i] += 1
+                break
+    if root:
+        _local.trace = None
+        if elapsed * 1000 >= SLOW_TRACE_MS and random.random() < TRACE_SAMPLE:
+            _write_trace(kind, name, started, elapsed, ok, trace)
+    elif trace is not None and len(trace) < MAX_SPANS:
+        trace.append((kind, name, started, elapsed, ok))
+
+
+class track:
+    """Times a block: with metrics.track("sql", "SELECT users"): ..."""
+
+    def __init__(self, kind, name):
+        self.kind, self.name = kind, name
+
+    def __enter__(self):
+        self.span = begin(self.kind, self.name)
+
+    def __exit__(self, exc_type, exc, tb):
+        end(self.span, exc_type is None)
+
+
+def timed(kind, name):
+    """Decorator form of track()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(kind, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write_trace(kind, name, started, elapsed, ok, spans):
+    global traces_written
+    line = json.dumps({
+        "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "kind": kind, "name": name, "ms": round(elapsed * 1000, 1), "ok": ok,
+        "spans": [{"kind": k, "name": n, "at_ms": round((t - started) * 1000, 1),
+                   "ms": round(e * 1000, 1), "ok": o} for k, n, t, e, o in spans],
+    }, ensure_ascii=False)
+    with _trace_lock:
+        traces_written += 1
+        if not TRACE_LOG:
+            print("[Slow Trace]", line)
+            return
+        try:
+            with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print("[Trace Log Error]", e)
+
+
+# --- SQL ---
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _shape(head):
+    words = head.split(None, 1)
+    verb = words[0].upper() if words else "?"
+    table = _TABLE.search(head)
+    return f"{verb} {table.group(1).lower()}" if table else verb
+
+
+def statement(query):
+    """'SELECT ... FROM memories m ...' -> 'SELECT memories'. Few distinct values."""
+    if isinstance(query, bytes):
+        # execute_values sends the rows already inlined; only the head matters.
+        query = query[:400].decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    return _shape(query[:400])
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        with track("sql", statement(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with track("sql", statement(query)):
+            return super().executemany(query, vars_list)
+
+
+# --- Telegram ---
+def instrument_telegram():
+    """Times every Bot API call; telebot sends them all through _make_request."""
+    from telebot import apihelper
+    make = apihelper._make_request
+    if getattr(make, "timed", False):
+        return
+
+    def timed_request(token, method_name, *args, **kwargs):
+        with track("telegram", method_name):
+            return make(token, method_name, *args, **kwargs)
+
+    timed_request.timed = True
+    apihelper._make_request = timed_request
+
+
+# --- Flask ---
+def instrument(app):
+    """Times every view under its endpoint name (not its URL, which may hold secrets)."""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_begin():
+        g.metrics_span = begin("route", request.endpoint or "unmatched")
+
+    @app.after_request
+    def _metrics_status(resp):
+        g.metrics_ok = resp.status_code < 500
+        return resp
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        span = g.pop("metrics_span", None)
+        if span is not None:
+            end(span, exc is None and g.pop("metrics_ok", True))
+
+
+def gauge(name, desc, fn):
+    """Adds a gauge read from fn() at scrape time."""
+    _gauges.append((name, desc, fn))
+
+
+# --- Exposition ---
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """All metrics in Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = [(kind, name, list(s.buckets), s.sum, s.count, s.errors, s.in_flight)
+                    for (kind, name), s in sorted(_series.items())]
+    out = []
+    for kind, (prefix, label, desc) in KINDS.items():
+        rows = [r for r in snapshot if r[0] == kind]
+        if not rows:
+            continue
+        out.append(f"# HELP {prefix}_seconds {desc}: latency.")
+        out.append(f"# TYPE {prefix}_seconds histogram")
+        for _, name, buckets, total, count, _, _ in rows:
+            lbl = f'{label}="{_label(name)}"'
+            running = 0
+            for bound, n in zip(BUCKETS, buckets):
+                running += n
+                out.append(f'{prefix}_seconds_bucket{{{lbl},le="{bound}"}} {running}')
+            out.append(f'{prefix}_seconds_bucket{{{lbl},le="+Inf"}} {count}')
+            out.append(f"{prefix}_seconds_sum{{{lbl}}} {total:.6f}")
+            out.append(f"{prefix}_seconds_count{{{lbl}}} {count}")
+        out.append(f"# HELP {prefix}_errors_total {desc}: calls that raised or returned 5xx.")
+        out.append(f"# TYPE {prefix}_errors_total counter")
+        for _, name, _, _, _, errors, _ in rows:
+            out.append(f'{prefix}_errors_total{{{label}="{_label(name)}"}} {errors}')
+        out.append(f"# HELP {prefix}_in_flight {desc}: calls running now.")
+        out.append(f"# TYPE {prefix}_in_flight gauge")
+        for _, name, _, _, _, _, in_flight in rows:
+            out.append(f'{prefix}_in_flight{{{label}="{_label(name)}"}} {in_flight}')
+    for name, desc, fn in _gauges:
+        try:
+            value = float(fn())
+        except Exception as e:
+            print("[Metrics Gauge Error]", name, e)
+            continue
+        out += [f"# HELP {name} {desc}", f"# TYPE {name} gauge", f"{name} {value:g}"]
+    out.append("# HELP soulgarden_slow_traces_total Slow-request traces written.")
+    out.append("# TYPE soulgarden_slow_traces_total counter")
+    out.append(f"soulgarden_slow_traces_total {traces_written}")
+    return "\n".join(out) + "\n"
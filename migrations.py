@@ -0,0 +1,284 @@
+# migrations.py
+"""Versioned schema migrations, applied once per deploy.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied / pending
+
+Runs as the Procfile release step so web workers never touch DDL at import.
+Migrations are append-only: never edit one that has shipped, add a new one.
+"""
+import os
+import sys
+
+import psycopg2
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+LOCK_KEY = 0x50D16A4D  # pg_advisory_lock key; keeps concurrent deploys apart
+
+_MOOD_DAILY_BACKFILL = """INSERT INTO mood_daily (user_id, day, hour, n, total)
+    SELECT m.user_id, l.local::date, EXTRACT(HOUR FROM l.local), COUNT(*), SUM(m.mood)
+    FROM memories m
+    JOIN users u ON u.id = m.user_id
+    CROSS JOIN LATERAL (SELECT m.timestamp AT TIME ZONE 'UTC' AT TIME ZONE u.tz AS local) l
+    WHERE m.mood IS NOT NULL AND m.timestamp IS NOT NULL
+    GROUP BY 1, 2, 3"""
+
+MIGRATIONS = [
+    (1, "baseline tables", [
+        # Everything the app used to create at import, so existing databases
+        # can adopt versioning without changes.
+        """CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username TEXT,
+            referred_by BIGINT,
+            streak INT DEFAULT 0,
+            last_streak TIMESTAMP,
+            points INT DEFAULT 0,
+            joined_at TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS memories (
+            user_id BIGINT,
+            text TEXT,
+            mood INT,
+            timestamp TIMESTAMP,
+            voice_path TEXT
+        )""",
+        "ALTER TABLE memories ADD COLUMN IF NOT EXISTS audio_status TEXT",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS voice_bytes BIGINT DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS voice_blobs (
+            key TEXT PRIMARY KEY,
+            size BIGINT NOT NULL,
+            refs INT DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )""",
+        """CREATE TABLE IF NOT EXISTS garden_latest (
+            user_id BIGINT PRIMARY KEY,
+            seq BIGSERIAL UNIQUE,
+            text TEXT,
+            mood INT,
+            timestamp TIMESTAMP,
+            voice_path TEXT
+        )""",
+        """INSERT INTO garden_latest (user_id, text, mood, timestamp, voice_path)
+            SELECT DISTINCT ON (user_id) user_id, text, mood, timestamp, voice_path
+            FROM memories
+            WHERE (text IS NOT NULL OR voice_path IS NOT NULL) AND timestamp IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM garden_latest)
+            ORDER BY user_id, timestamp DESC NULLS LAST""",
+        """CREATE TABLE IF NOT EXISTS broadcasts (
+            id SERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            status TEXT DEFAULT 'queued',
+            last_uid BIGINT DEFAULT 0,
+            sent INT DEFAULT 0,
+            failed INT DEFAULT 0,
+            owner TEXT,
+            heartbeat TIMESTAMPTZ,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )""",
+    ]),
+    (2, "memory ids and hot-path indexes", [
+        "ALTER TABLE memories ADD COLUMN id BIGSERIAL",
+        "ALTER TABLE memories ADD PRIMARY KEY (id)",
+        # dashboard / show_memories / visit_garden; id breaks timestamp ties
+        "CREATE INDEX memories_user_ts_idx ON memories (user_id, timestamp DESC, id DESC)",
+        # admin analytics "new logs today"
+        "CREATE INDEX memories_timestamp_idx ON memories (timestamp)",
+        "CREATE INDEX users_referred_by_idx ON users (referred_by)",
+        "CREATE INDEX users_points_idx ON users (points DESC)",
+        "CREATE INDEX users_joined_at_idx ON users (joined_at)",
+    ]),
+    (3, "leaderboard neighbour index", [
+        # (points, id) order for rank neighbours; also covers ORDER BY points DESC
+        "CREATE INDEX users_points_id_idx ON users (points DESC, id DESC)",
+        "DROP INDEX IF EXISTS users_points_idx",
+    ]),
+    (4, "analytics rollups", [
+        """CREATE TABLE stats_hourly (
+            hour TIMESTAMP NOT NULL,
+            metric TEXT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, metric)
+        )""",
+        """CREATE TABLE stats_daily (
+            day DATE NOT NULL,
+            metric TEXT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, metric)
+        )""",
+        "CREATE INDEX stats_daily_metric_idx ON stats_daily (metric, day DESC)",
+        """CREATE TABLE active_days (
+            day DATE NOT NULL,
+            user_id BIGINT NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )""",
+    ]),
+    (5, "conversation state", [
+        """CREATE TABLE conv_state (
+            user_id BIGINT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        )""",
+        "CREATE INDEX conv_state_expires_idx ON conv_state (expires_at)",
+    ]),
+    (6, "per-user timezone for streaks", [
+        "ALTER TABLE users ADD COLUMN tz TEXT NOT NULL DEFAULT 'UTC'",
+    ]),
+    (7, "background account deletion", [
+        """CREATE TABLE deletion_jobs (
+            user_id BIGINT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'queued',
+            deleted INT NOT NULL DEFAULT 0,
+            owner TEXT,
+            heartbeat TIMESTAMPTZ,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )""",
+    ]),
+    (8, "voice clip durations", [
+        "ALTER TABLE voice_blobs ADD COLUMN duration INT",
+    ]),
+    (9, "scheduler job store", [
+        """CREATE TABLE scheduled_jobs (
+            name TEXT PRIMARY KEY,
+            next_run TIMESTAMPTZ NOT NULL,
+            last_run TIMESTAMPTZ,
+            last_status TEXT,
+            last_error TEXT,
+            last_duration_ms INT,
+            owner TEXT
+        )""",
+        # reminder slices pick users by timezone
+        "CREATE INDEX users_tz_idx ON users (tz)",
+    ]),
+    (10, "memory full-text search", [
+        # Generated, so every insert path (including batched writes) keeps
+        # it current without knowing about search. Rewrites the table once.
+        """ALTER TABLE memories ADD COLUMN tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('english'::regconfig, COALESCE(text, ''))) STORED""",
+        # btree_gin lets one GIN index cover user_id = ? AND tsv @@ ?
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        "CREATE INDEX memories_user_tsv_idx ON memories USING GIN (user_id, tsv)",
+    ]),
+    (11, "per-user mood aggregates", [
+        # local day and hour (users.tz); kept current by moods.record
+        """CREATE TABLE mood_daily (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            hour SMALLINT NOT NULL,
+            n INT NOT NULL,
+            total INT NOT NULL,
+            PRIMARY KEY (user_id, day, hour)
+        )""",
+        _MOOD_DAILY_BACKFILL,
+    ]),
+    (12, "per-user lookup on active_days", [
+        # account deletion clears a user's rows; the primary key leads with day
+        "CREATE INDEX active_days_user_idx ON active_days (user_id)",
+    ]),
+    (13, "shared page-cache version", [
+        # pagecache keys a user's pages on this; writers set it from the
+        # sequence, so a re-registered user never reuses an old value
+        "CREATE SEQUENCE pages_version_seq",
+        "ALTER TABLE users ADD COLUMN pages_version BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE users ALTER COLUMN pages_version SET DEFAULT nextval('pages_version_seq')",
+    ]),
+    (14, "existing users keep IST days", [
+        # reminders and streak days were IST before tz existed; 006 put everyone on UTC
+        "ALTER TABLE users ALTER COLUMN tz SET DEFAULT 'Asia/Kolkata'",
+        "UPDATE users SET tz = 'Asia/Kolkata', pages_version = nextval('pages_version_seq') WHERE tz = 'UTC'",
+        # mood_daily was bucketed by the old tz
+        "DELETE FROM mood_daily",
+        _MOOD_DAILY_BACKFILL,
+    ]),
+    (15, "reminder audience index", [
+        # reminders.audience: tz = ANY(...) walked in id order for keyset batches
+        "CREATE INDEX users_tz_id_idx ON users (tz, id)",
+        "DROP INDEX IF EXISTS users_tz_idx",
+    ]),
+    (16, "no undated explore cards", [
+        # 002 could pick an undated memory as the card; gardens.record never
+        # replaces those and the explore views can't format them
+        """UPDATE garden_latest g
+            SET text = m.text, mood = m.mood, timestamp = m.timestamp, voice_path = m.voice_path
+            FROM (SELECT DISTINCT ON (user_id) user_id, text, mood, timestamp, voice_path
+                  FROM memories
+                  WHERE (text IS NOT NULL OR voice_path IS NOT NULL) AND timestamp IS NOT NULL
+                  ORDER BY user_id, timestamp DESC) m
+            WHERE g.user_id = m.user_id AND g.timestamp IS NULL""",
+        # users with only undated memories have no card; gardens.sample skips the gap
+        "DELETE FROM garden_latest WHERE timestamp IS NULL",
+    ]),
+    (17, "durable transcode results", [
+        # transcode writes the MP3 result here; write_batch copies it onto
+        # memory rows the result raced past
+        "ALTER TABLE voice_blobs ADD COLUMN audio_status TEXT",
+        """CREATE INDEX memories_unsettled_audio_idx ON memories (voice_path)
+            WHERE audio_status IN ('pending', 'failed')""",
+    ]),
+]
+
+
+def _ensure_table(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMPTZ DEFAULT now()
+    )""")
+
+
+def applied(conn):
+    with conn.cursor() as c:
+        _ensure_table(c)
+        c.execute("SELECT version FROM schema_migrations")
+        versions = {r[0] for r in c.fetchall()}
+    conn.commit()
+    return versions
+
+
+def migrate(conn, verbose=True):
+    """Applies pending migrations, each in its own transaction."""
+    with conn.cursor() as c:
+        c.execute("SET statement_timeout = 0")
+        c.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    conn.commit()
+    try:
+        done = applied(conn)
+        for version, name, statements in MIGRATIONS:
+            if version in done:
+                continue
+            try:
+                with conn.cursor() as c:
+                    for sql in statements:
+                        c.execute(sql)
+                    c.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"[Migration Error] {version} {name}")
+                raise
+            if verbose:
+                print(f"✅ {version:03d} {name}")
+    finally:
+        with conn.cursor() as c:
+            c.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        conn.commit()
+
+
+def main(argv):
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        if "--status" in argv:
+            done = applied(conn)
+            for version, name, _ in MIGRATIONS:
+                print(f"{'applied' if version in done else 'pending':>8}  {version:03d} {name}")
+        else:
+            migrate(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
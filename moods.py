@@ -0,0 +1,153 @@
+# moods.py
+"""Mood trends for the dashboard and /moods.
+
+Writes keep mood_daily current: one row per user, local day and local hour
+holding how many moods were logged and their sum, so a user with ten years
+of daily entries loads a few thousand small rows instead of every memory.
+Buckets use the user's timezone at write time; changing /timezone later
+doesn't move old entries.
+
+analyse() turns those rows into everything the dashboard shows with numpy
+array operations only (no per-day Python loop): daily means, 7- and 30-day
+rolling means, a weekday x hour heatmap, the average mood by day of a
+logging streak, and volatility.
+"""
+import numpy as np
+from psycopg2.extras import execute_values
+
+import db
+
+WINDOW_DAYS = 90   # days of daily/rolling series sent to the chart
+RECENT_DAYS = 30   # volatility is measured over this many recent days
+STREAK_DAYS = 14   # streak trend buckets; day 14+ shares the last one
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+_EPOCH = np.datetime64("0001-01-01", "D")  # ordinal 1, a Monday
+
+
+def record(c, items):
+    """Adds (uid, mood, timestamp) rows to mood_daily (same transaction)."""
+    if not items:
+        return
+    # Grouped first: ON CONFLICT can't touch one row twice in a statement.
+    execute_values(c, """
+        INSERT INTO mood_daily (user_id, day, hour, n, total)
+        SELECT u.id, l.local::date, EXTRACT(HOUR FROM l.local), COUNT(*), SUM(v.mood)
+        FROM (VALUES %s) AS v(uid, mood, ts)
+        JOIN users u ON u.id = v.uid
+        CROSS JOIN LATERAL (SELECT v.ts::timestamp AT TIME ZONE 'UTC' AT TIME ZONE u.tz AS local) l
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, day, hour) DO UPDATE
+        SET n = mood_daily.n + EXCLUDED.n, total = mood_daily.total + EXCLUDED.total
+    """, items)
+
+
+def forget(c, uid):
+    c.execute("DELETE FROM mood_daily WHERE user_id = %s", (uid,))
+
+
+def load(uid):
+    """Returns (day ordinals, hours, counts, totals, today's ordinal) for a user."""
+    with db.cursor() as c:
+        c.execute("""
+            SELECT (now() AT TIME ZONE tz)::date - DATE '0001-01-01' + 1 FROM users WHERE id = %s
+        """, (uid,))
+        row = c.fetchone()
+        c.execute("""
+            SELECT day - DATE '0001-01-01' + 1, hour, n, total
+            FROM mood_daily WHERE user_id = %s
+        """, (uid,))
+        rows = c.fetchall()
+    arr = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    today = row[0] if row else (int(arr[:, 0].max()) if len(arr) else 0)
+    return arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3], today
+
+
+def _mean(total, count):
+    out = np.full(np.shape(total), np.nan)
+    np.divide(total, count, out=out, where=count > 0)
+    return out
+
+
+def _rolling(tot, cnt, k):
+    """Entry-weighted mean over each day's trailing k days, via prefix sums."""
+    ct = np.concatenate(([0.0], np.cumsum(tot)))
+    cc = np.concatenate(([0.0], np.cumsum(cnt)))
+    hi = np.arange(1, len(tot) + 1)
+    lo = np.maximum(hi - k, 0)
+    return _mean(ct[hi] - ct[lo], cc[hi] - cc[lo])
+
+
+def _clean(a):
+    """Rounded, NaN-free, JSON-ready copy of an array."""
+    a = np.asarray(a, dtype=float)
+    out = np.round(a, 2).astype(object)
+    out[np.isnan(a)] = None
+    return out.tolist()
+
+
+def _at(a, i):
+    return None if i < 0 or np.isnan(a[i]) else round(float(a[i]), 2)
+
+
+def analyse(day, hour, n, total, today):
+    """All mood stats for one user's mood_daily rows, or None without any."""
+    if not len(day):
+        return None
+    start = int(day.min())
+    span = max(int(today), int(day.max())) - start + 1
+    idx = day - start
+
+    # Dense per-day series, one slot per calendar day.
+    cnt = np.bincount(idx, weights=n, minlength=span)
+    tot = np.bincount(idx, weights=total, minlength=span)
+    daily = _mean(tot, cnt)
+    avg7 = _rolling(tot, cnt, 7)
+    avg30 = _rolling(tot, cnt, 30)
+    logged = cnt > 0
+
+    # Weekday x hour, straight from the hourly rows.
+    cell = ((day - 1) % 7) * 24 + hour
+    heat_n = np.bincount(cell, weights=n, minlength=168).reshape(7, 24)
+    heat_t = np.bincount(cell, weights=total, minlength=168).reshape(7, 24)
+    heatmap = _mean(heat_t, heat_n)
+    by_weekday = _mean(heat_t.sum(1), heat_n.sum(1))
+    by_hour = _mean(heat_t.sum(0), heat_n.sum(0))
+
+    # Position of each logged day within its run of consecutive days.
+    pos = np.arange(span)
+    run_start = np.maximum.accumulate(np.where(logged & ~np.r_[False, logged[:-1]], pos, 0))
+    slot = np.minimum(pos - run_start, STREAK_DAYS - 1)[logged]
+    streak = _mean(np.bincount(slot, weights=tot[logged], minlength=STREAK_DAYS),
+                   np.bincount(slot, weights=cnt[logged], minlength=STREAK_DAYS))
+
+    recent = daily[-RECENT_DAYS:]
+    recent = recent[~np.isnan(recent)]
+    steps = np.abs(np.diff(recent))
+
+    window = slice(max(span - WINDOW_DAYS, 0), span)
+    labels = (_EPOCH + (start - 1) + pos[window]).astype(str).tolist()
+    return {
+        "labels": labels,
+        "daily": _clean(daily[window]),
+        "avg7": _clean(avg7[window]),
+        "avg30": _clean(avg30[window]),
+        "heatmap": [_clean(r) for r in heatmap],
+        "weekday": _clean(by_weekday),
+        "hour": _clean(by_hour),
+        "streak": _clean(streak),
+        "week": _at(avg7, span - 1),
+        "prev_week": _at(avg7, span - 8),
+        "month": _at(avg30, span - 1),
+        "mean": round(float(tot.sum() / cnt.sum()), 2),
+        "volatility": round(float(recent.std()), 2) if len(recent) > 1 else None,
+        "swing": round(float(steps.mean()), 2) if len(steps) else None,
+        "best_weekday": WEEKDAYS[int(np.nanargmax(by_weekday))],
+        "best_hour": int(np.nanargmax(by_hour)),
+        "entries": int(cnt.sum()),
+        "days": int(logged.sum()),
+    }
+
+
+def summary(uid):
+    return analyse(*load(uid))
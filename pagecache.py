@@ -0,0 +1,132 @@
+# pagecache.py
+"""Rendered-page cache for the public web routes.
+
+A cached view renders once per (URL, data version) and is then served from
+memory, already gzipped (and brotli'd, when the brotli package is
+installed), with an ETag and Last-Modified so repeat visitors and link
+preview bots get a 304. Entries expire after their route's TTL.
+
+A user's pages are keyed by users.pages_version, which every write that
+shows on them sets from pages_version_seq in its own transaction. All
+workers read the same column, so none serves a page older than the data.
+"""
+import os
+import gzip
+import time
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+
+from flask import request, make_response
+
+import db
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "2000"))
+MIN_COMPRESS_BYTES = 1024
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+class Entry:
+    __slots__ = ("body", "gz", "br", "etag", "modified", "expires", "mimetype")
+
+    def __init__(self, body, mimetype, ttl):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.modified = time.time()
+        self.expires = time.monotonic() + ttl
+        big = len(body) >= MIN_COMPRESS_BYTES
+        self.gz = gzip.compress(body, 6) if big else None
+        self.br = brotli.compress(body, quality=5) if big and brotli else None
+
+
+def version(uid):
+    """The user's pages_version (None once the user is gone); one PK lookup."""
+    row = db.fetchone("SELECT pages_version FROM users WHERE id = %s", (uid,))
+    return row[0] if row else None
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def _get(key):
+    global hits, misses
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry.expires > time.monotonic():
+            _cache.move_to_end(key)
+            hits += 1
+            return entry
+        misses += 1
+    return None
+
+
+def _put(key, entry):
+    with _lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _respond(entry, ttl, public):
+    accept = request.headers.get("Accept-Encoding", "")
+    if entry.br is not None and "br" in accept:
+        body, encoding = entry.br, "br"
+    elif entry.gz is not None and "gzip" in accept:
+        body, encoding = entry.gz, "gzip"
+    else:
+        body, encoding = entry.body, None
+
+    resp = make_response(body)
+    resp.mimetype = entry.mimetype
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = f"{'public' if public else 'private'}, max-age={ttl}"
+    # Weak: the same ETag covers every encoding of the page.
+    resp.set_etag(entry.etag, weak=True)
+    resp.last_modified = entry.modified
+    return resp.make_conditional(request)
+
+
+def cached(ttl, version=None, public=True):
+    """Caches a view's 200 responses for ttl seconds.
+
+    version(**view_kwargs) returns the data version the page depends on;
+    a different version means a fresh render.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.full_path, version(**kwargs) if version else None)
+            entry = _get(key)
+            if entry is None:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                entry = Entry(resp.get_data(), resp.mimetype, ttl)
+                _put(key, entry)
+            return _respond(entry, ttl, public)
+        return wrapper
+    return decorator
+
+
+def stats():
+    with _lock:
+        size = len(_cache)
+    total = hits + misses
+    return {"size": size, "max": CACHE_SIZE, "hits": hits, "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0}
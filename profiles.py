@@ -0,0 +1,18 @@
+# profiles.py
+import db
+
+FIELDS = ("username", "streak", "points", "last_streak", "referrals")
+
+
+def get(uid):
+    """Returns the user's header fields as a dict, or None if not registered.
+
+    Only read when a page is rendered (behind pagecache) or on the streak
+    command's refusal path, so there is nothing worth caching here.
+    """
+    row = db.fetchone("""
+        SELECT username, streak, points, last_streak,
+               (SELECT COUNT(*) FROM users r WHERE r.referred_by = users.id)
+        FROM users WHERE id = %s
+    """, (uid,))
+    return dict(zip(FIELDS, row)) if row else None
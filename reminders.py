@@ -0,0 +1,39 @@
+# reminders.py
+import os
+import json
+from datetime import datetime, timezone
+
+import pytz
+
+# Everyone is reminded at REMINDER_HOUR in their own timezone (users.tz).
+# Within that hour users are split into SLICES groups by id, one group per
+# SLICE_MINUTES run, so sends trickle out over the hour instead of bursting
+# at :00. Every real UTC offset is a multiple of 15 minutes, so each group
+# gets exactly one run inside its local hour.
+REMINDER_HOUR = int(os.getenv("REMINDER_LOCAL_HOUR", "20"))
+SLICE_MINUTES = 5
+SLICES = 60 // SLICE_MINUTES
+# A finished slice is only kept this long; 288 are created a day.
+KEEP_FINISHED = "1 day"
+
+
+def payload(now=None):
+    """Describes the slice due now; stored with the fanout job so a resumed
+    job still targets the same users."""
+    now = now or datetime.now(timezone.utc)
+    return json.dumps({"at": now.replace(second=0, microsecond=0).isoformat(),
+                       "slice": now.minute // SLICE_MINUTES})
+
+
+def zones_at(at, hour=REMINDER_HOUR):
+    """Names of the timezones whose local hour at `at` is `hour`."""
+    return sorted(name for name in pytz.all_timezones if at.astimezone(pytz.timezone(name)).hour == hour)
+
+
+def audience(raw):
+    """Recipient filter for fanout: users whose local hour at `at` is the
+    reminder hour and whose id falls in this slice. The zones are worked
+    out here, so the query is a plain tz lookup on users_tz_id_idx."""
+    p = json.loads(raw)
+    return ("tz = ANY(%s) AND id %% %s = %s",
+            (zones_at(datetime.fromisoformat(p["at"])), SLICES, p["slice"]))
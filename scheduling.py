@@ -0,0 +1,219 @@
+# scheduling.py
+"""Periodic jobs, run by exactly one process.
+
+Every gunicorn worker imports main and calls start(), but only the process
+holding the leader lock runs jobs: a Postgres session advisory lock, or a
+lock file when SCHEDULER_LOCK=file (single host). If the leader dies its
+lock goes with it and another worker takes over within LEADER_RETRY
+seconds.
+
+Next run times live in the scheduled_jobs table, so a new leader neither
+repeats a run the old one already claimed nor forgets one that fell due
+while nobody was leading (missed runs are coalesced into one).
+
+Triggers are APScheduler's, used only to compute fire times.
+"""
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+import db
+import metrics
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_LOCK = os.getenv("SCHEDULER_LOCK", "postgres")
+LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "/tmp/soulgarden-scheduler.lock")
+LOCK_KEY = 0x50D16A4E  # next to migrations' key
+TICK_SECONDS = 5
+LEADER_RETRY = 15
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_jobs = {}
+_running = set()
+_lock = threading.Lock()
+_thread = None
+_leader = None
+
+
+class PostgresLeader:
+    """Holds a session-level advisory lock on its own connection."""
+
+    def __init__(self):
+        self.conn = None
+
+    def acquire(self):
+        try:
+            self.conn = psycopg2.connect(db.DATABASE_URL)
+            self.conn.autocommit = True
+            with self.conn.cursor() as c:
+                c.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_KEY,))
+                if c.fetchone()[0]:
+                    return True
+        except psycopg2.Error as e:
+            print("[Scheduler] Leader lock unavailable:", e)
+        self.release()
+        return False
+
+    def held(self):
+        try:
+            with self.conn.cursor() as c:
+                c.execute("SELECT 1")
+            return True
+        except (psycopg2.Error, AttributeError):
+            return False
+
+    def release(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
+
+
+class FileLeader:
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self.fd = None
+
+    def acquire(self):
+        import fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def held(self):
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def add(name, func, trigger):
+    """Registers func under a stable name; trigger is an APScheduler trigger."""
+    _jobs[name] = (func, trigger)
+
+
+def _next_fire(trigger, now):
+    return trigger.get_next_fire_time(None, now + timedelta(seconds=1))
+
+
+def _claim_due(name, trigger, now):
+    """Moves a due job's next_run forward; True if this process should run it.
+
+    The UPDATE only matches while next_run is still in the past, so a run is
+    claimed at most once even if two processes briefly both think they lead.
+    """
+    nxt = _next_fire(trigger, now)
+    with db.cursor() as c:
+        c.execute("""
+            INSERT INTO scheduled_jobs (name, next_run) VALUES (%s, %s)
+            ON CONFLICT (name) DO NOTHING
+        """, (name, nxt))
+        if c.rowcount:
+            return False
+        c.execute("""
+            UPDATE scheduled_jobs SET next_run = %s, last_run = now(), owner = %s
+            WHERE name = %s AND next_run <= %s
+        """, (nxt, _OWNER, name, now))
+        return c.rowcount == 1
+
+
+def _record(name, ok, error, started):
+    try:
+        db.execute("""
+            UPDATE scheduled_jobs SET last_status = %s, last_error = %s, last_duration_ms = %s
+            WHERE name = %s
+        """, ("ok" if ok else "failed", error, int((time.monotonic() - started) * 1000), name))
+    except Exception as e:
+        print("[Scheduler] Couldn't record run:", name, e)
+
+
+def _launch(name, func):
+    def target():
+        started = time.monotonic()
+        ok, error = True, None
+        try:
+            with metrics.track("job", name):
+                func()
+        except Exception as e:
+            ok, error = False, str(e)[:500]
+            print(f"[Scheduler] {name} failed:", e)
+        finally:
+            with _lock:
+                _running.discard(name)
+            _record(name, ok, error, started)
+
+    with _lock:
+        if name in _running:
+            return
+        _running.add(name)
+    threading.Thread(target=target, name=f"job-{name}", daemon=True).start()
+
+
+def _tick():
+    now = datetime.now(timezone.utc)
+    for name, (func, trigger) in list(_jobs.items()):
+        with _lock:
+            if name in _running:
+                continue
+        try:
+            if _claim_due(name, trigger, now):
+                _launch(name, func)
+        except Exception as e:
+            print(f"[Scheduler] {name} claim failed:", e)
+
+
+def _loop():
+    global _leader
+    leader = FileLeader() if SCHEDULER_LOCK == "file" else PostgresLeader()
+    while True:
+        if not leader.acquire():
+            time.sleep(LEADER_RETRY)
+            continue
+        _leader = leader
+        print(f"[Scheduler] {_OWNER} is leader")
+        while leader.held():
+            _tick()
+            time.sleep(TICK_SECONDS)
+        print(f"[Scheduler] {_OWNER} lost leadership")
+        _leader = None
+        leader.release()
+
+
+def start():
+    """Starts competing for leadership in the background (idempotent)."""
+    global _thread
+    if not SCHEDULER_ENABLED:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name="scheduler", daemon=True)
+            _thread.start()
+
+
+def stats():
+    jobs = {}
+    try:
+        for name, next_run, last_run, status, ms in db.fetchall("""
+            SELECT name, next_run, last_run, last_status, last_duration_ms FROM scheduled_jobs
+        """):
+            jobs[name] = {"next_run": next_run.isoformat() if next_run else None,
+                          "last_run": last_run.isoformat() if last_run else None,
+                          "status": status, "duration_ms": ms}
+    except Exception as e:
+        jobs = {"error": str(e)}
+    with _lock:
+        running = sorted(_running)
+    return {"leader": _leader is not None, "owner": _OWNER, "running": running, "jobs": jobs}
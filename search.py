@@ -0,0 +1,90 @@
+# search.py
+import re
+from datetime import date, timedelta
+
+import db
+
+PAGE_SIZE = 10
+CONFIG = "english"  # must match the generated tsv column (migration 10)
+HEADLINE = "StartSel=«, StopSel=», MaxWords=25, MinWords=8, ShortWord=2"
+
+_FILTER = re.compile(r"\b(mood|since|until|page):(\S+)", re.IGNORECASE)
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse(text, moods):
+    """Splits '/search beach walk mood:happy since:2024-01-01 page:2'.
+
+    moods maps lower-case mood names to their stored values. Unknown
+    filter values are dropped rather than failing the search.
+    """
+    filters = {k.lower(): v for k, v in _FILTER.findall(text or "")}
+    terms = " ".join(_FILTER.sub(" ", text or "").split())
+    page = filters.get("page", "1")
+    return {
+        "terms": terms,
+        "mood": moods.get(filters.get("mood", "").lower()),
+        "since": parse_date(filters.get("since")),
+        "until": parse_date(filters.get("until")),
+        "page": max(int(page), 1) if page.isdigit() else 1,
+    }
+
+
+def with_page(args, page):
+    """The same search arguments pointing at another page."""
+    return " ".join(re.sub(r"\bpage:\S+", " ", args, flags=re.IGNORECASE).split() + [f"page:{page}"])
+
+
+def run(uid, terms="", mood=None, since=None, until=None, page=1, limit=PAGE_SIZE):
+    """Returns (memories, has_more) for one page of a user's matches.
+
+    With terms, matches come from the GIN index on (user_id, tsv) and are
+    ranked by ts_rank_cd, each with a highlighted headline; with filters
+    only, they are the newest memories that pass them.
+    """
+    where = ["m.user_id = %(uid)s"]
+    params = {"uid": uid, "limit": limit + 1, "offset": (page - 1) * limit, "config": CONFIG}
+    if mood is not None:
+        where.append("m.mood = %(mood)s")
+        params["mood"] = mood
+    if since:
+        where.append("m.timestamp >= %(since)s")
+        params["since"] = since
+    if until:
+        where.append("m.timestamp < %(until)s")
+        params["until"] = until + timedelta(days=1)
+
+    if terms:
+        params["terms"] = terms
+        params["headline"] = HEADLINE
+        source = "memories m, websearch_to_tsquery(%(config)s::regconfig, %(terms)s) q"
+        where.append("m.tsv @@ q")
+        rank, query = "ts_rank_cd(m.tsv, q)", "q"
+        headline = "ts_headline(%(config)s::regconfig, COALESCE(h.text, ''), h.q, %(headline)s)"
+    else:
+        source, rank, query, headline = "memories m", "0", "NULL::tsquery", "h.text"
+
+    rows = db.fetchall(f"""
+        WITH h AS (
+            SELECT m.id, m.text, m.mood, m.timestamp, m.voice_path, m.audio_status,
+                   {rank} AS rank, {query} AS q
+            FROM {source}
+            WHERE {' AND '.join(where)}
+            ORDER BY rank DESC, m.timestamp DESC, m.id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        )
+        SELECT h.id, h.text, h.mood, h.timestamp, h.voice_path, h.audio_status, b.size, b.duration, {headline}
+        FROM h LEFT JOIN voice_blobs b ON b.key = h.voice_path
+        ORDER BY h.rank DESC, h.timestamp DESC, h.id DESC
+    """, params)
+
+    mems = [{"id": i, "text": t, "mood": m, "timestamp": ts, "voice": vp, "audio_status": st,
+             "size": size, "duration": dur, "headline": hl}
+            for i, t, m, ts, vp, st, size, dur, hl in rows[:limit]]
+    return mems, len(rows) > limit
@@ -0,0 +1,67 @@
+// Loads older memories into #memories as #more scrolls into view.
+// #more carries data-src (the JSON endpoint), data-next (the first cursor)
+// and data-mood: "label" shows mood_label, anything else the raw value.
+(function () {
+  var more = document.getElementById("more");
+  var list = document.getElementById("memories");
+  if (!more || !list) return;
+  var loading = false;
+
+  function el(tag, text) {
+    var node = document.createElement(tag);
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function mood(mem) {
+    if (more.dataset.mood === "label") return mem.mood_label;
+    return mem.mood === null ? "None" : mem.mood;
+  }
+
+  function render(mem) {
+    var card = el("div");
+    card.className = "memory";
+    var head = el("p");
+    head.appendChild(el("strong", mem.date));
+    head.appendChild(document.createTextNode(" — Mood: " + mood(mem)));
+    card.appendChild(head);
+    card.appendChild(el("p", mem.text));
+    if (mem.voice) {
+      var audio = el("audio");
+      audio.controls = true;
+      audio.preload = "none";
+      var ogg = el("source");
+      ogg.src = mem.voice;
+      ogg.type = "audio/ogg; codecs=opus";
+      audio.appendChild(ogg);
+      if (mem.mp3) {
+        var mp3 = el("source");
+        mp3.src = mem.mp3;
+        mp3.type = "audio/mpeg";
+        audio.appendChild(mp3);
+      }
+      card.appendChild(audio);
+      if (mem.clip) {
+        var clip = el("p", "🎧 " + mem.clip);
+        clip.className = "clip";
+        card.appendChild(clip);
+      }
+    }
+    return card;
+  }
+
+  var observer = new IntersectionObserver(function (entries) {
+    if (!entries[0].isIntersecting || loading || !more.dataset.next) return;
+    loading = true;
+    var sep = more.dataset.src.indexOf("?") < 0 ? "?" : "&";
+    fetch(more.dataset.src + sep + "cursor=" + encodeURIComponent(more.dataset.next))
+      .then(function (r) { return r.json(); })
+      .then(function (page) {
+        page.memories.forEach(function (mem) { list.appendChild(render(mem)); });
+        more.dataset.next = page.next || "";
+        if (!page.next) observer.disconnect();
+      })
+      .finally(function () { loading = false; });
+  });
+  observer.observe(more);
+})();
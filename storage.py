@@ -0,0 +1,234 @@
+# storage.py
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+import requests
+
+import db
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. benchmarks/fake_s3.py or MinIO
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL")
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Pre-dedup uploads were named per message, not by content, so they may not
+# be cached forever.
+LEGACY_CACHE = "public, max-age=86400"
+HASHED_KEY = re.compile(r"voices/[0-9a-f]{2}/[0-9a-f]{64}\.(ogg|mp3)$")
+MEDIA_TYPES = {".ogg": "audio/ogg", ".mp3": "audio/mpeg"}
+
+
+class TooLarge(Exception):
+    """Raised when a download grows past the allowed size."""
+
+
+def mp3_path(voice_path):
+    return voice_path.rsplit(".", 1)[0] + ".mp3"
+
+
+def clip_meta(duration, size):
+    """'0:42 · 35 KB' for the players, from the blob index; '' if unknown."""
+    parts = []
+    if duration is not None:
+        parts.append(f"{duration // 60}:{duration % 60:02d}")
+    if size:
+        parts.append(f"{max(1, round(size / 1024))} KB")
+    return " · ".join(parts)
+
+
+def valid_key(key):
+    return (key.startswith("voices/") and ".." not in key and "/." not in key
+            and os.path.splitext(key)[1] in MEDIA_TYPES)
+
+
+class LocalStorage:
+    """Blobs as files under static/, served by the /media route."""
+
+    def __init__(self, root="static"):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "voices", ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, src):
+        dst = self._path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.move(src, dst)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_copy(self, key):
+        """Returns (path, is_temporary) of a readable local file for key."""
+        return self._path(key), False
+
+    def url(self, key):
+        from flask import url_for
+        return url_for("media", key=key)
+
+    def response(self, key):
+        """Conditional, Range-aware file response (sendfile under gunicorn)."""
+        from flask import send_from_directory
+        resp = send_from_directory(self.root, key, mimetype=MEDIA_TYPES[os.path.splitext(key)[1]],
+                                   conditional=True, etag=True)
+        resp.headers["Cache-Control"] = IMMUTABLE if HASHED_KEY.match(key) else LEGACY_CACHE
+        return resp
+
+
+class S3Storage:
+    """Blobs in an S3-compatible bucket (AWS, MinIO, LocalStack...)."""
+
+    def __init__(self, bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, public_url=S3_PUBLIC_URL):
+        from botocore.exceptions import ClientError
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.tmp_dir = None
+        self._client_error = ClientError
+        self._clients = {}
+
+    @property
+    def client(self):
+        # boto3 clients must not cross a fork: the transcode pool's workers
+        # each build their own.
+        pid = os.getpid()
+        client = self._clients.get(pid)
+        if client is None:
+            import boto3
+            client = self._clients[pid] = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return client
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, key, src):
+        content_type = "audio/mpeg" if key.endswith(".mp3") else "audio/ogg"
+        self.client.upload_file(src, self.bucket, key,
+                                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE})
+        os.remove(src)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def local_copy(self, key):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        self.client.download_file(self.bucket, key, path)
+        return path, True
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=3600)
+
+    def response(self, key):
+        # The bucket already does Range and caching; never proxy bytes.
+        from flask import redirect
+        return redirect(self.url(key))
+
+
+backend = S3Storage() if STORAGE_BACKEND == "s3" else LocalStorage()
+
+
+def url(key):
+    return backend.url(key)
+
+
+def save_voice(url, max_bytes, duration=None):
+    """Streams a voice note into content-addressed storage.
+
+    Returns (key, created); created is False when an identical blob was
+    already stored, in which case nothing new is written. duration
+    (seconds, as Telegram reports it) goes into the blob index so pages can
+    show clip lengths without touching the audio.
+    """
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(suffix=".ogg", dir=backend.tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as fp, requests.get(url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise TooLarge(size)
+                h.update(chunk)
+                fp.write(chunk)
+
+        digest = h.hexdigest()
+        key = f"voices/{digest[:2]}/{digest}.ogg"
+        created = db.fetchone("""
+            INSERT INTO voice_blobs (key, size, duration) VALUES (%s, %s, %s)
+            ON CONFLICT (key) DO NOTHING RETURNING key
+        """, (key, size, duration), retry=False) is not None
+        if created or not backend.exists(key):
+            backend.put_file(key, tmp)
+        return key, created
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def add_ref(c, uid, key):
+    """Counts a memory's reference to a blob against the user's usage."""
+    c.execute("UPDATE voice_blobs SET refs = refs + 1 WHERE key = %s RETURNING size", (key,))
+    row = c.fetchone()
+    if row:
+        c.execute("UPDATE users SET voice_bytes = voice_bytes + %s WHERE id = %s", (row[0], uid))
+
+
+def release(c, uid, key):
+    """Drops one reference; returns the keys to delete once committed."""
+    c.execute("UPDATE voice_blobs SET refs = refs - 1 WHERE key = %s RETURNING refs, size", (key,))
+    row = c.fetchone()
+    if row is None:
+        # Pre-dedup files were written per message and never shared.
+        return [key, mp3_path(key)]
+    refs, size = row
+    c.execute("UPDATE users SET voice_bytes = GREATEST(voice_bytes - %s, 0) WHERE id = %s", (size, uid))
+    if refs > 0:
+        return []
+    c.execute("DELETE FROM voice_blobs WHERE key = %s AND refs <= 0", (key,))
+    return [key, mp3_path(key)]
+
+
+def delete_keys(keys):
+    for key in keys:
+        try:
+            backend.delete(key)
+        except Exception as e:
+            print("[Storage Delete Error]", key, e)
+
+
+def usage(uid):
+    row = db.fetchone("SELECT voice_bytes FROM users WHERE id = %s", (uid,))
+    return row[0] if row else 0
+
+
+def sweep_orphans():
+    """Removes blobs uploaded for a voice note whose memory was never saved."""
+    rows = db.fetchall("""
+        DELETE FROM voice_blobs
+        WHERE refs <= 0 AND created_at < now() - interval '1 day'
+        RETURNING key
+    """, retry=False)
+    delete_keys([k for (key,) in rows for k in (key, mp3_path(key))])
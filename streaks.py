@@ -0,0 +1,93 @@
+# streaks.py
+"""Daily streak rules, shared by the bot (Postgres) and utils.py (SQLite).
+
+A streak can be claimed once per calendar day in the user's own timezone.
+Claiming the day after the previous claim continues the streak; any later
+gap starts again at 1. Each claim earns STREAK_POINTS, plus BONUS_POINTS
+whenever the streak reaches a multiple of BONUS_EVERY.
+
+A claim is one conditional UPDATE ... RETURNING: the "not claimed today"
+check and the increment happen under the same row lock, so parallel taps
+cannot both succeed.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+STREAK_POINTS = 1
+BONUS_EVERY = 5
+BONUS_POINTS = 2
+# New users start here until they send /timezone; the bot ran on IST before that.
+DEFAULT_TZ = os.getenv("DEFAULT_TZ", "Asia/Kolkata")
+
+
+def awarded(streak):
+    """Points a claim that reaches `streak` earns."""
+    return STREAK_POINTS + (BONUS_POINTS if streak % BONUS_EVERY == 0 else 0)
+
+
+def valid_tz(name):
+    return name in pytz.all_timezones_set
+
+
+# Users' last_streak is naive UTC. Local midnight for today and yesterday,
+# converted to naive UTC, are the two boundaries a claim is checked against.
+_TODAY = "((date_trunc('day', now() AT TIME ZONE u.tz)) AT TIME ZONE u.tz AT TIME ZONE 'UTC')"
+_YESTERDAY = "((date_trunc('day', now() AT TIME ZONE u.tz) - interval '1 day') AT TIME ZONE u.tz AT TIME ZONE 'UTC')"
+_NEXT = f"CASE WHEN u.last_streak >= {_YESTERDAY} THEN COALESCE(u.streak, 0) + 1 ELSE 1 END"
+
+_CLAIM_SQL = f"""
+    UPDATE users u SET
+        streak = {_NEXT},
+        points = COALESCE(u.points, 0) + %(points)s
+                 + CASE WHEN ({_NEXT}) %% %(every)s = 0 THEN %(bonus)s ELSE 0 END,
+        last_streak = now() AT TIME ZONE 'UTC',
+        pages_version = nextval('pages_version_seq')
+    WHERE u.id = %(uid)s AND (u.last_streak IS NULL OR u.last_streak < {_TODAY})
+    RETURNING u.streak, u.points, u.last_streak
+"""
+
+
+def claim(c, uid):
+    """Claims today's streak on a Postgres cursor.
+
+    Returns (streak, points, last_streak) after the claim, or None if the
+    user already claimed today (or is not registered).
+    """
+    c.execute(_CLAIM_SQL, {"uid": uid, "points": STREAK_POINTS, "every": BONUS_EVERY, "bonus": BONUS_POINTS})
+    return c.fetchone()
+
+
+def day_bounds(tz=DEFAULT_TZ, now=None):
+    """(start of yesterday, start of today) in `tz`, as naive UTC datetimes."""
+    zone = pytz.timezone(tz)
+    now = now or datetime.now(timezone.utc)
+    local = now.astimezone(zone)
+    today = zone.localize(datetime(local.year, local.month, local.day))
+    yesterday = zone.localize(datetime(local.year, local.month, local.day) - timedelta(days=1))
+    return (yesterday.astimezone(timezone.utc).replace(tzinfo=None),
+            today.astimezone(timezone.utc).replace(tzinfo=None))
+
+
+def claim_sqlite(c, uid, now=None, tz=DEFAULT_TZ, column="last_entry"):
+    """SQLite flavour of claim() for utils.py, where timestamps are ISO text.
+
+    The local-day boundaries are computed here, since SQLite has no
+    timezone data; the UPDATE itself is the same single conditional write.
+    """
+    now = now or datetime.now(timezone.utc)
+    yesterday, today = day_bounds(tz, now)
+    params = {"uid": uid, "now": now.astimezone(timezone.utc).replace(tzinfo=None).isoformat(),
+              "yesterday": yesterday.isoformat(), "today": today.isoformat(),
+              "points": STREAK_POINTS, "every": BONUS_EVERY, "bonus": BONUS_POINTS}
+    nxt = f"CASE WHEN {column} >= :yesterday THEN COALESCE(streak, 0) + 1 ELSE 1 END"
+    c.execute(f"""
+        UPDATE users SET
+            streak = {nxt},
+            points = COALESCE(points, 0) + :points + CASE WHEN ({nxt}) % :every = 0 THEN :bonus ELSE 0 END,
+            {column} = :now
+        WHERE id = :uid AND ({column} IS NULL OR {column} < :today)
+        RETURNING streak, points
+    """, params)
+    return c.fetchone()
@@ -0,0 +1,122 @@
+# transcode.py
+import os
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import db
+import storage
+
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+# Telegram voice notes are Opus in OGG, which every current browser except
+# older Safari plays natively. The MP3 copy is only a fallback for those.
+MP3_FALLBACK = os.getenv("VOICE_MP3_FALLBACK", "1") == "1"
+
+PENDING, DONE, FAILED, SKIPPED = "pending", "done", "failed", "skipped"
+
+_executor = None
+_executor_lock = threading.Lock()
+# Status of jobs whose memory row may not exist yet (mood not chosen).
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_RECENT_MAX = 10000
+
+
+def to_mp3(src, dst):
+    # One ffmpeg pass straight from Opus to MP3; pydub decoded to WAV in
+    # Python first and spawned ffmpeg twice.
+    tmp = dst + ".part"
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", src,
+         "-vn", "-codec:a", "libmp3lame", "-q:a", "6", "-f", "mp3", tmp],
+        check=True, timeout=120
+    )
+    os.replace(tmp, dst)
+    return dst
+
+
+def _job(voice_path):
+    """Runs in a pool worker: fetch the OGG, convert, store the MP3.
+
+    With S3 storage the fetch and the upload are network round trips; here
+    they cost a pool slot instead of the handler thread.
+    """
+    src, src_is_temp = storage.backend.local_copy(voice_path)
+    fd, dst = tempfile.mkstemp(suffix=".mp3", dir=storage.backend.tmp_dir)
+    os.close(fd)
+    try:
+        to_mp3(src, dst)
+        storage.backend.put_file(storage.mp3_path(voice_path), dst)
+    finally:
+        for path in ([src] if src_is_temp else []) + [dst]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS)
+    return _executor
+
+
+def _remember(voice_path, status):
+    with _recent_lock:
+        _recent[voice_path] = status
+        _recent.move_to_end(voice_path)
+        while len(_recent) > _RECENT_MAX:
+            _recent.popitem(last=False)
+
+
+def _finished(voice_path):
+    def callback(future):
+        status = DONE
+        if future.exception():
+            status = FAILED
+            print("[Audio Conversion Error]", voice_path, future.exception())
+        _remember(voice_path, status)
+        try:
+            with db.cursor() as c:
+                # The blob row is the hand-off with write_batch, which locks it
+                # via add_ref: a memory row still being written either reads
+                # this status when it commits or is visible to the next UPDATE.
+                c.execute("UPDATE voice_blobs SET audio_status = %s WHERE key = %s", (status, voice_path))
+                c.execute("""
+                    UPDATE memories SET audio_status = %s
+                    WHERE voice_path = %s AND audio_status IN ('pending', 'failed')
+                """, (status, voice_path))
+        except Exception as e:
+            print("[Audio Status Error]", e)
+    return callback
+
+
+def submit(voice_path):
+    """Queues the MP3 fallback for a stored OGG blob."""
+    if not MP3_FALLBACK:
+        _remember(voice_path, SKIPPED)
+        return
+    _remember(voice_path, PENDING)
+    _get_executor().submit(_job, voice_path).add_done_callback(_finished(voice_path))
+
+
+def status(voice_path):
+    """Returns the conversion status to store with a new memory row.
+
+    _recent only knows this process's jobs, so anything it can't settle
+    (another worker converted it, or a dedup hit skipped submit) is read
+    from storage: an existing MP3 is done.
+    """
+    with _recent_lock:
+        known = _recent.pop(voice_path, None)
+    if known in (DONE, FAILED, SKIPPED):
+        return known
+    try:
+        if storage.backend.exists(storage.mp3_path(voice_path)):
+            return DONE
+    except Exception as e:
+        print("[Audio Status Error]", e)
+    return PENDING if MP3_FALLBACK else SKIPPED
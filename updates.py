@@ -0,0 +1,131 @@
+# updates.py
+import os
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+ENQUEUE_TIMEOUT = float(os.getenv("UPDATE_ENQUEUE_TIMEOUT", "1"))
+LATENCY_WINDOW = 1000
+
+
+def chat_key(update):
+    """Returns the chat/user an update belongs to, used to keep its order."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        m = getattr(update, field, None)
+        if m is not None:
+            return m.chat.id
+    cq = getattr(update, "callback_query", None)
+    if cq is not None:
+        return cq.from_user.id
+    pa = getattr(update, "poll_answer", None)
+    if pa is not None:
+        return pa.user.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """Bounded in-process queue drained by a fixed pool of worker threads.
+
+    Updates are sharded by chat, one shard per worker, so updates from the
+    same chat are always handled in arrival order while different chats run
+    in parallel. put() blocks for at most ENQUEUE_TIMEOUT when the shard is
+    full and then reports failure, so the webhook can push back on Telegram.
+    """
+
+    def __init__(self, handler, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE,
+                 enqueue_timeout=ENQUEUE_TIMEOUT):
+        self.handler = handler
+        self.enqueue_timeout = enqueue_timeout
+        per_shard = max(1, maxsize // workers)
+        self._shards = [queue.Queue(maxsize=per_shard) for _ in range(workers)]
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i, q in enumerate(self._shards):
+                t = threading.Thread(target=self._work, args=(q,), name=f"update-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def put(self, update):
+        self.start()
+        q = self._shards[hash(chat_key(update)) % len(self._shards)]
+        try:
+            q.put((time.monotonic(), update), timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+
+    def _work(self, q):
+        while True:
+            enqueued, update = q.get()
+            if update is None:
+                q.task_done()
+                return
+            ok = True
+            try:
+                self.handler(update)
+            except Exception as e:
+                ok = False
+                print("[Update Worker Error]", e)
+            finally:
+                with self._stats_lock:
+                    self._latencies.append(time.monotonic() - enqueued)
+                    if ok:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                q.task_done()
+
+    def drain(self):
+        """Stops the workers after everything already queued is handled."""
+        if not self._threads:
+            return
+        for q in self._shards:
+            q.put((time.monotonic(), None))
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def depth(self):
+        return sum(q.qsize() for q in self._shards)
+
+    def stats(self):
+        with self._stats_lock:
+            lat = sorted(self._latencies)
+            processed, failed, rejected = self.processed, self.failed, self.rejected
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(len(lat) * p))] * 1000, 1) if lat else 0.0
+
+        return {
+            "depth": self.depth(),
+            "capacity": sum(q.maxsize for q in self._shards),
+            "workers": len(self._shards),
+            "processed": processed,
+            "failed": failed,
+            "rejected": rejected,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_max": pct(1.0),
+        }
+
+
+def create(handler, **kwargs):
+    uq = UpdateQueue(handler, **kwargs)
+    atexit.register(uq.drain)
+    return uq
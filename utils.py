@@ -3,57 +3,59 @@ import sqlite3
 import datetime
 import os
 
+import streaks
+
 DB_PATH = os.getenv("DB_PATH", "garden.db")
+_search_ready = set()
 
 def get_db_connection():
     """Returns a new connection to the database."""
     return sqlite3.connect(DB_PATH)
 
-def log_memory(user_id, text, mood, voice_path=None):
-    """Logs a memory with streak and points logic."""
-    now = datetime.datetime.utcnow().isoformat()  # use UTC for consistency
+def ensure_search_index(conn):
+    """Creates the FTS5 index over memories.text, kept current by triggers."""
+    if DB_PATH in _search_ready:
+        return
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'memories_fts'").fetchone()
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+            text, content='memories', content_rowid='rowid', tokenize='porter unicode61');
+        CREATE TRIGGER IF NOT EXISTS memories_fts_ai AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts(rowid, text) VALUES (new.rowid, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_fts_ad AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_fts_au AFTER UPDATE OF text ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            INSERT INTO memories_fts(rowid, text) VALUES (new.rowid, new.text);
+        END;
+    """)
+    if not exists:
+        # Index what was logged before the index existed
+        conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+    conn.commit()
+    _search_ready.add(DB_PATH)
+
+def log_memory(user_id, text, mood, voice_path=None, tz=streaks.DEFAULT_TZ):
+    """Logs a memory; the first memory of the user's day claims the streak."""
+    now = datetime.datetime.now(datetime.timezone.utc)
     try:
         with get_db_connection() as conn:
+            ensure_search_index(conn)
             c = conn.cursor()
 
-            # Insert memory
+            # Insert memory (naive UTC, like the rest of the table)
             c.execute("""
                 INSERT INTO memories (user_id, text, mood, timestamp, voice_path)
                 VALUES (?, ?, ?, ?, ?)
-            """, (user_id, text, mood, now, voice_path))
-
-            # Fetch user streak and last entry
-            c.execute("SELECT last_entry, streak, points FROM users WHERE id = ?", (user_id,))
-            row = c.fetchone()
-
-            if row:
-                last_entry, current_streak, current_points = row
-                today = datetime.datetime.utcnow().date()
-
-                if last_entry:
-                    try:
-                        last_date = datetime.datetime.fromisoformat(last_entry).date()
-                        diff = (today - last_date).days
-                    except ValueError:
-                        diff = None
-                else:
-                    diff = None
-
-                # Update streak
-                if diff == 1:
-                    new_streak = current_streak + 1
-                elif diff == 0:
-                    new_streak = current_streak
-                else:
-                    new_streak = 1
+            """, (user_id, text, mood, now.replace(tzinfo=None).isoformat(), voice_path))
 
-                # Update points: +1 per memory, +2 bonus every 5 streak
-                bonus = 2 if new_streak % 5 == 0 else 0
-                new_points = current_points + 1 + bonus
+            # Streak and its bonus follow the bot's rules (streaks.py)
+            streaks.claim_sqlite(c, user_id, now, tz)
 
-                c.execute("""
-                    UPDATE users SET last_entry = ?, streak = ?, points = ? WHERE id = ?
-                """, (now, new_streak, new_points, user_id))
+            # +1 per memory
+            c.execute("UPDATE users SET points = COALESCE(points, 0) + 1 WHERE id = ?", (user_id,))
 
             conn.commit()
 
@@ -84,6 +86,41 @@ def calculate_streak(user_id):
         print(f"[calculate_streak] Error: {e}")
         return 0
 
+def search_memories(user_id, terms, mood=None, since=None, until=None, limit=10, offset=0):
+    """Ranked full-text matches for one user, best first.
+
+    Returns (text, mood, timestamp, voice_path, snippet) rows; since/until
+    are ISO dates (until inclusive).
+    """
+    # Quote every word so user input can't be read as FTS5 query syntax
+    query = " ".join('"%s"' % w.replace('"', '""') for w in terms.split())
+    if not query:
+        return []
+    where, params = ["memories_fts MATCH ?", "m.user_id = ?"], [query, user_id]
+    if mood is not None:
+        where.append("m.mood = ?")
+        params.append(mood)
+    if since:
+        where.append("m.timestamp >= ?")
+        params.append(str(since))
+    if until:
+        where.append("m.timestamp < date(?, '+1 day')")
+        params.append(str(until))
+    try:
+        with get_db_connection() as conn:
+            ensure_search_index(conn)
+            return conn.execute(f"""
+                SELECT m.text, m.mood, m.timestamp, m.voice_path,
+                       snippet(memories_fts, 0, '«', '»', '…', 12)
+                FROM memories_fts JOIN memories m ON m.rowid = memories_fts.rowid
+                WHERE {' AND '.join(where)}
+                ORDER BY bm25(memories_fts)
+                LIMIT ? OFFSET ?
+            """, params + [limit, offset]).fetchall()
+    except Exception as e:
+        print(f"[search_memories] Error: {e}")
+        return []
+
 def get_other_memories(user_id, limit=10):
     """Returns random memories from other users."""
     try:
@@ -0,0 +1,179 @@
+# writes.py
+"""Memory write path.
+
+Every memory is one transaction: the row, its explore card, analytics
+counters, mood aggregate, voice refcount and the user's +1 point commit
+together.
+
+With WRITE_BEHIND_MS > 0, memories from many users are gathered for at most
+that long (or WRITE_BATCH_MAX rows) and committed as one multi-row INSERT
+plus one points UPDATE, so a burst costs one fsync instead of one per
+memory. Callers still block until their memory is committed, which bounds
+the added latency by the window. Pending batches are flushed at exit.
+"""
+import os
+import time
+import atexit
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from psycopg2.extras import execute_values
+
+import db
+import analytics
+import gardens
+import moods
+import storage
+
+WRITE_BEHIND_MS = float(os.getenv("WRITE_BEHIND_MS", "0"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "200"))
+WRITE_TIMEOUT = float(os.getenv("WRITE_TIMEOUT", "10"))
+
+
+def write_batch(c, items):
+    """Writes (uid, text, mood, timestamp, voice_path, audio_status) rows.
+
+    Returns each row's points after its own +1, in input order, so a user
+    with several rows in one batch still sees consecutive totals.
+    """
+    ids = execute_values(c, """
+        INSERT INTO memories (user_id, text, mood, timestamp, voice_path, audio_status)
+        VALUES %s RETURNING id
+    """, items, fetch=True)
+    for uid, text, mood, ts, voice_path, _ in items:
+        gardens.record(c, uid, text, mood, ts, voice_path)
+        analytics.memory_logged(c, uid)
+        if voice_path:
+            storage.add_ref(c, uid, voice_path)
+    voiced = [i for (i,), item in zip(ids, items) if item[4]]
+    if voiced:
+        # add_ref holds each blob row now, so a conversion that finished
+        # before this point is visible here, and one finishing later waits
+        # for this commit before it updates the memory rows.
+        c.execute("""
+            UPDATE memories m SET audio_status = b.audio_status
+            FROM voice_blobs b
+            WHERE m.id = ANY(%s) AND b.key = m.voice_path
+            AND b.audio_status IS NOT NULL AND m.audio_status IS DISTINCT FROM b.audio_status
+        """, (voiced,))
+    moods.record(c, [(uid, mood, ts) for uid, _, mood, ts, _, _ in items if mood is not None])
+
+    per_user = Counter(item[0] for item in items)
+    totals = dict(execute_values(c, """
+        UPDATE users u SET points = u.points + v.n, pages_version = nextval('pages_version_seq')
+        FROM (VALUES %s) AS v(id, n)
+        WHERE u.id = v.id
+        RETURNING u.id, u.points
+    """, sorted(per_user.items()), fetch=True))
+
+    # Hand out totals from the last row backwards.
+    out = [None] * len(items)
+    for i in range(len(items) - 1, -1, -1):
+        uid = items[i][0]
+        if uid in totals:
+            out[i] = totals[uid]
+            totals[uid] -= 1
+    return out
+
+
+class MemoryWriter:
+    def __init__(self, window_ms=WRITE_BEHIND_MS, batch_max=WRITE_BATCH_MAX):
+        self.window = window_ms / 1000
+        self.batch_max = batch_max
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+
+    def write(self, uid, text, mood, timestamp, voice_path=None, audio_status=None):
+        """Commits one memory; returns the user's new points (None if unknown).
+
+        Raises TimeoutError only while the memory is still queued, after
+        taking it back out, so a retry cannot write it twice.
+        """
+        item = (uid, text, mood, timestamp, voice_path, audio_status)
+        fut = None
+        if self.window > 0:
+            with self._cond:
+                if not self._closed:
+                    fut = Future()
+                    self._start()
+                    self._pending.append((item, fut))
+                    if len(self._pending) >= self.batch_max:
+                        self._cond.notify()
+        if fut is None:
+            with db.cursor() as c:
+                return write_batch(c, [item])[0]
+        try:
+            return fut.result(timeout=WRITE_TIMEOUT)
+        except TimeoutError:
+            with self._cond:
+                if (item, fut) in self._pending:
+                    # Never reached the database; safe for the caller to retry.
+                    self._pending.remove((item, fut))
+                    raise
+            # Already in a batch that will commit; raising now would invite a duplicate.
+            return fut.result()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.batch_max and not self._closed:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch, self._pending = self._pending[:self.batch_max], self._pending[self.batch_max:]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            with db.cursor() as c:
+                results = write_batch(c, [item for item, _ in batch])
+        except Exception as e:
+            print("[Memory Batch Error]", e)
+            # One bad row must not lose everyone else's memory.
+            for item, fut in batch:
+                try:
+                    with db.cursor() as c:
+                        fut.set_result(write_batch(c, [item])[0])
+                except Exception as e:
+                    fut.set_exception(e)
+            return
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, fut), points in zip(batch, results):
+            fut.set_result(points)
+
+    def drain(self):
+        """Flushes whatever is pending and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {"window_ms": self.window * 1000, "pending": pending, "batches": self.batches,
+                "rows": self.rows, "avg_batch": round(self.rows / self.batches, 1) if self.batches else 0.0}
+
+
+def create(**kwargs):
+    writer = MemoryWriter(**kwargs)
+    atexit.register(writer.drain)
+    return writer